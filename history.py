@@ -15,6 +15,7 @@ from typing import Dict, List, Any, Optional
 from decimal import Decimal, getcontext
 
 import okx.Account as Account
+from okx_endpoints import rest_url
 
 
 # Set decimal precision for financial calculations
@@ -47,7 +48,8 @@ class OKXHistoryGenerator:
             api_secret_key=self.api_secret,
             passphrase=self.passphrase,
             use_server_time=False,
-            flag='0'  # Live trading
+            flag='0',  # Live trading
+            domain=rest_url(self.config)
         )
         
         logger.info("OKX History Generator initialized")
@@ -6,6 +6,7 @@ import logging
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 from okx_time_utils import get_okx_current_time, okx_time
+from okx_endpoints import rest_url
 import okx.Account as Account
 import okx.Trade as Trade
 import okx.PublicData as PublicData
@@ -25,12 +26,14 @@ class OKXReporter:
         self.passphrase = self.config.get('OKX', 'api_passphrase')
         
         # Initialize API clients
+        self.rest_url = rest_url(self.config)
         self.account_api = Account.AccountAPI(
             api_key=self.api_key,
             api_secret_key=self.secret_key,
             passphrase=self.passphrase,
             use_server_time=False,
-            flag='0'  # 0: Production, 1: Demo
+            flag='0',  # 0: Production, 1: Demo
+            domain=self.rest_url
         )
         
         self.trade_api = Trade.TradeAPI(
@@ -38,7 +41,8 @@ class OKXReporter:
             api_secret_key=self.secret_key,
             passphrase=self.passphrase,
             use_server_time=False,
-            flag='0'
+            flag='0',
+            domain=self.rest_url
         )
         
         self.public_api = PublicData.PublicAPI(
@@ -46,7 +50,8 @@ class OKXReporter:
             api_secret_key=self.secret_key,
             passphrase=self.passphrase,
             use_server_time=False,
-            flag='0'
+            flag='0',
+            domain=self.rest_url
         )
         
         # Setup logging
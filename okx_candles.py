@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+OKX Candle Series - Fixed-capacity in-memory candle buffers for okx_sync
+
+Each (instrument, timeframe) series is a ring buffer over preallocated NumPy
+arrays. Every slot is written twice (at i and i + capacity), so the live window
+is always one contiguous slice and views in either order need no copying.
+
+CandleAggregator rolls a base timeframe (5m) up into higher timeframes locally,
+using OKX bucket alignment (1D/1W/1M open at 00:00 Hong Kong time, UTC+8).
+"""
+
+import numpy as np
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+from okx_store import FLOAT_FIELDS, candles_to_columns, merge_columns
+
+MINUTE_MS = 60 * 1000
+DAY_MS = 24 * 60 * MINUTE_MS
+WEEK_MS = 7 * DAY_MS
+HK_OFFSET_MS = 8 * 60 * MINUTE_MS
+
+# Fixed-length bars; 1M is calendar based
+BAR_MS = {
+    "1m": MINUTE_MS,
+    "5m": 5 * MINUTE_MS,
+    "15m": 15 * MINUTE_MS,
+    "1H": 60 * MINUTE_MS,
+    "4H": 4 * 60 * MINUTE_MS,
+    "1D": DAY_MS,
+    "1W": WEEK_MS,
+}
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+class CandleRing:
+    """Fixed-capacity candle buffer with O(1) "update last / append new" semantics"""
+
+    def __init__(self, capacity: int):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self._ts = np.zeros(2 * capacity, dtype=np.int64)
+        self._values = np.zeros((2 * capacity, len(FLOAT_FIELDS)), dtype=np.float64)
+        self._confirm = np.zeros(2 * capacity, dtype=np.uint8)
+        self._head = 0  # Next slot to write
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the buffer's arrays"""
+        return self._ts.nbytes + self._values.nbytes + self._confirm.nbytes
+
+    @property
+    def latest_ts(self) -> int:
+        """Timestamp of the newest candle (0 when empty)"""
+        if not self._count:
+            return 0
+        return int(self._ts[(self._head - 1) % self.capacity])
+
+    def _write(self, slot: int, ts: int, values: Sequence[float], confirm: int) -> None:
+        for pos in (slot, slot + self.capacity):
+            self._ts[pos] = ts
+            self._values[pos] = values
+            self._confirm[pos] = confirm
+
+    def upsert(self, ts: int, values: Sequence[float], confirm: int = 0) -> None:
+        """
+        Insert or replace the candle with timestamp ts
+
+        Updating the newest candle or appending a newer one is O(1); a late
+        update to an older candle scans back from the newest slot.
+        """
+        cap = self.capacity
+        if self._count:
+            newest = (self._head - 1) % cap
+            newest_ts = self._ts[newest]
+            if ts == newest_ts:
+                self._write(newest, ts, values, confirm)
+                return
+            if ts < newest_ts:
+                for back in range(1, self._count):
+                    slot = (newest - back) % cap
+                    slot_ts = self._ts[slot]
+                    if slot_ts == ts:
+                        self._write(slot, ts, values, confirm)
+                        return
+                    if slot_ts < ts:
+                        break
+                self._insert_sorted(ts, values, confirm)
+                return
+        # New candle: append, overwriting the oldest when full
+        self._write(self._head, ts, values, confirm)
+        self._head = (self._head + 1) % cap
+        self._count = min(self._count + 1, cap)
+
+    def _insert_sorted(self, ts: int, values: Sequence[float], confirm: int) -> None:
+        """Rare out-of-order insert of a candle older than the newest one"""
+        all_ts = np.append(self.timestamps(), ts)
+        all_values = np.vstack([self.values(), np.asarray(values, dtype=np.float64)])
+        all_confirm = np.append(self.confirm(), confirm)
+        order = np.argsort(all_ts, kind="stable")[-self.capacity:]
+        self._load(all_ts[order], all_values[order], all_confirm[order])
+
+    def get(self, ts: int) -> Optional[Tuple[np.ndarray, int]]:
+        """Values and confirm flag of the candle with timestamp ts, scanning back from the newest"""
+        cap = self.capacity
+        newest = (self._head - 1) % cap
+        for back in range(self._count):
+            slot = (newest - back) % cap
+            slot_ts = self._ts[slot]
+            if slot_ts == ts:
+                return self._values[slot], int(self._confirm[slot])
+            if slot_ts < ts:
+                break
+        return None
+
+    def upsert_row(self, candle: Sequence) -> None:
+        """Insert or replace one OKX candle row [ts, o, h, l, c, vol, volCcy, volCcyQuote, confirm]"""
+        values = [_to_float(candle[i]) if len(candle) > i else float("nan") for i in range(1, 8)]
+        confirm = 1 if len(candle) > 8 and str(candle[8]) == "1" else 0
+        self.upsert(int(candle[0]), values, confirm)
+
+    def _load(self, ts: np.ndarray, values: np.ndarray, confirm: np.ndarray) -> None:
+        n = min(len(ts), self.capacity)
+        ts, values, confirm = ts[-n:], values[-n:], confirm[-n:]
+        cap = self.capacity
+        for base in (0, cap):
+            self._ts[base:base + n] = ts
+            self._values[base:base + n] = values
+            self._confirm[base:base + n] = confirm
+        self._head = n % cap
+        self._count = n
+
+    def load_rows(self, candles: List[List]) -> None:
+        """Replace contents with OKX candle rows (newest first, as returned by the API)"""
+        rows = sorted(candles, key=lambda c: int(c[0]))
+        self._load(
+            np.array([int(c[0]) for c in rows], dtype=np.int64),
+            np.array(
+                [[_to_float(c[i]) if len(c) > i else float("nan") for i in range(1, 8)] for c in rows],
+                dtype=np.float64,
+            ).reshape(-1, len(FLOAT_FIELDS)),
+            np.array([1 if len(c) > 8 and str(c[8]) == "1" else 0 for c in rows], dtype=np.uint8),
+        )
+
+    def merge_rows(self, candles: List[List]) -> None:
+        """Merge OKX candle rows into the buffer (same timestamp replaces, oldest dropped at capacity)"""
+        if not candles:
+            return
+        self.load_columns(merge_columns(self.columns(), candles_to_columns(candles)))
+
+    def load_columns(self, columns: Dict[str, np.ndarray]) -> None:
+        """Replace contents with chronological columns (as read from the candle store)"""
+        order = np.argsort(columns["ts"], kind="stable")
+        values = np.column_stack([columns[name] for name in FLOAT_FIELDS])
+        self._load(columns["ts"][order], values[order], columns["confirm"][order])
+
+    def _window(self, array: np.ndarray, newest_first: bool) -> np.ndarray:
+        start = (self._head - self._count) % self.capacity
+        view = array[start:start + self._count]
+        return view[::-1] if newest_first else view
+
+    def timestamps(self, newest_first: bool = False) -> np.ndarray:
+        """View of candle timestamps (oldest first by default)"""
+        return self._window(self._ts, newest_first)
+
+    def values(self, newest_first: bool = False) -> np.ndarray:
+        """View of the (rows x FLOAT_FIELDS) value matrix"""
+        return self._window(self._values, newest_first)
+
+    def confirm(self, newest_first: bool = False) -> np.ndarray:
+        return self._window(self._confirm, newest_first)
+
+    def column(self, name: str, newest_first: bool = False) -> np.ndarray:
+        """View of a single named field from okx_store.CANDLE_FIELDS"""
+        if name == "ts":
+            return self.timestamps(newest_first)
+        if name == "confirm":
+            return self.confirm(newest_first)
+        return self.values(newest_first)[:, FLOAT_FIELDS.index(name)]
+
+    def columns(self, newest_first: bool = False) -> Dict[str, np.ndarray]:
+        """Views of all fields keyed by okx_store.CANDLE_FIELDS"""
+        values = self.values(newest_first)
+        columns = {"ts": self.timestamps(newest_first)}
+        for idx, name in enumerate(FLOAT_FIELDS):
+            columns[name] = values[:, idx]
+        columns["confirm"] = self.confirm(newest_first)
+        return columns
+
+
+def bucket_start(ts: int, bar: str) -> int:
+    """Open timestamp (ms) of the OKX bar of the given timeframe containing ts"""
+    if bar == "1M":
+        local = datetime.fromtimestamp((ts + HK_OFFSET_MS) / 1000, tz=timezone.utc)
+        first = local.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        return int(first.timestamp() * 1000) - HK_OFFSET_MS
+    if bar == "1W":
+        # Epoch day 0 is a Thursday; shift so weeks start on Monday
+        local = ts + HK_OFFSET_MS + 3 * DAY_MS
+        return local // WEEK_MS * WEEK_MS - 3 * DAY_MS - HK_OFFSET_MS
+    bar_ms = BAR_MS[bar]
+    # Daily bars open at 00:00 UTC+8; intraday bars up to 4H align the same in UTC
+    offset = HK_OFFSET_MS if bar_ms >= DAY_MS else 0
+    return (ts + offset) // bar_ms * bar_ms - offset
+
+
+def bars_since(latest_ts: int, bar: str, now_ms: int) -> int:
+    """Number of bars from latest_ts to the forming bar (0 when latest_ts is the forming bar)"""
+    current = bucket_start(now_ms, bar)
+    if latest_ts >= current:
+        return 0
+    # Calendar months are at least 28 days; over-counting by a bar is harmless
+    bar_ms = BAR_MS.get(bar, 28 * DAY_MS)
+    return (current - latest_ts) // bar_ms + 1
+
+
+def _merge(acc: Optional[np.ndarray], cur: np.ndarray) -> np.ndarray:
+    """Combine an accumulated bar with a later one (fields in FLOAT_FIELDS order)"""
+    if acc is None:
+        return cur.copy()
+    out = acc.copy()
+    out[1] = max(acc[1], cur[1])
+    out[2] = min(acc[2], cur[2])
+    out[3] = cur[3]
+    out[4:] = acc[4:] + cur[4:]
+    return out
+
+
+class CandleAggregator:
+    """Roll base-timeframe candle updates up into higher timeframe bars"""
+
+    def __init__(self, base_bar: str, targets: List[str]):
+        self.base_bar = base_bar
+        self.base_ms = BAR_MS[base_bar]
+        self.targets = targets
+        # (instId, bar) -> [bucket start, base ts being folded, accumulated earlier base bars]
+        self._state = {}
+
+    def reset(self, inst_id: str, bar: Optional[str] = None) -> None:
+        """Forget aggregation state so the next update re-seeds from the stored series"""
+        for target in ([bar] if bar else self.targets):
+            self._state.pop((inst_id, target), None)
+
+    def _seed(self, base: CandleRing, target: CandleRing, start: int, ts: int, cur: np.ndarray):
+        base_ts = base.timestamps()
+        if len(base_ts) and base_ts[0] <= start:
+            # Base buffer covers the whole bucket: rebuild it exactly
+            mask = (base_ts >= start) & (base_ts < ts)
+            acc = None
+            for row in base.values()[mask]:
+                acc = _merge(acc, row)
+            return acc
+        seeded = target.get(start)
+        if seeded is not None:
+            # REST-seeded forming bar already includes part of the current base bar
+            acc = seeded[0].copy()
+            acc[4:] = np.maximum(acc[4:] - cur[4:], 0.0)
+            return acc
+        return None
+
+    def apply(self, inst_id: str, ts: int, base: CandleRing, targets: Dict[str, CandleRing]) -> List[str]:
+        """
+        Fold the base candle with timestamp ts into every target timeframe
+
+        Returns:
+            Timeframes whose series changed
+        """
+        current = base.get(ts)
+        if current is None or ts != base.latest_ts:
+            # Late update to an older base bar: left to REST reconciliation
+            return []
+        cur, confirm = current
+        changed = []
+        for bar in self.targets:
+            target = targets.get(bar)
+            if target is None:
+                continue
+            start = bucket_start(ts, bar)
+            key = (inst_id, bar)
+            state = self._state.get(key)
+            if state is None or state[0] != start:
+                if state is not None:
+                    # Previous bucket is finished
+                    previous = target.get(state[0])
+                    if previous is not None and not previous[1]:
+                        target.upsert(state[0], previous[0].copy(), 1)
+                state = self._state[key] = [start, ts, self._seed(base, target, start, ts, cur)]
+            elif ts > state[1]:
+                folded = base.get(state[1])
+                if folded is not None:
+                    state[2] = _merge(state[2], folded[0])
+                state[1] = ts
+            closed = 1 if confirm and bucket_start(ts + self.base_ms, bar) != start else 0
+            target.upsert(start, _merge(state[2], cur), closed)
+            changed.append(bar)
+        return changed
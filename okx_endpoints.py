@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+OKX Endpoints - Base URLs for the OKX REST and WebSocket APIs
+
+Every module takes its OKX URLs from here, so the whole pipeline can be pointed
+at another server (for example okx_fake_server.py for offline load tests):
+
+    OKX_REST_URL / OKX_WS_URL environment variables (highest priority)
+    [OKX] rest_url / ws_url in config.ini
+    production defaults below
+"""
+
+import os
+import configparser
+from typing import Optional
+
+DEFAULT_REST_URL = "https://www.okx.com"
+DEFAULT_WS_URL = "wss://ws.okx.com:8443/ws/v5/business"
+
+
+def _lookup(env_name: str, option: str, default: str,
+            config: Optional[configparser.ConfigParser], config_path: str) -> str:
+    value = os.environ.get(env_name)
+    if value:
+        return value.rstrip("/")
+    if config is None:
+        config = configparser.ConfigParser()
+        config.read(config_path)
+    value = config.get("OKX", option, fallback="")
+    return value.rstrip("/") if value else default
+
+
+def rest_url(config: Optional[configparser.ConfigParser] = None, config_path: str = "config.ini") -> str:
+    """Base URL of the OKX REST API (no trailing slash)"""
+    return _lookup("OKX_REST_URL", "rest_url", DEFAULT_REST_URL, config, config_path)
+
+
+def ws_url(config: Optional[configparser.ConfigParser] = None, config_path: str = "config.ini") -> str:
+    """URL of the OKX business WebSocket (candle channels)"""
+    return _lookup("OKX_WS_URL", "ws_url", DEFAULT_WS_URL, config, config_path)
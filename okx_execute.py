@@ -5,6 +5,7 @@ import json
 import configparser
 from okx.Trade import TradeAPI
 from okx.Account import AccountAPI
+from okx_endpoints import rest_url
 import time
 from typing import Dict, List, Any
 import logging
@@ -22,7 +23,8 @@ def load_config() -> Dict[str, str]:
     return {
         'api_key': config['OKX']['api_key'],
         'api_secret': config['OKX']['api_secret'],
-        'api_passphrase': config['OKX']['api_passphrase']
+        'api_passphrase': config['OKX']['api_passphrase'],
+        'rest_url': rest_url(config)
     }
 
 
@@ -238,14 +240,16 @@ def main():
             api_key=config['api_key'],
             api_secret_key=config['api_secret'],
             passphrase=config['api_passphrase'],
-            flag='0'  # 0 for real trading
+            flag='0',  # 0 for real trading
+            domain=config['rest_url']
         )
         
         account_api = AccountAPI(
             api_key=config['api_key'],
             api_secret_key=config['api_secret'],
             passphrase=config['api_passphrase'],
-            flag='0'  # 0 for real trading
+            flag='0',  # 0 for real trading
+            domain=config['rest_url']
         )
         
         # Check and set account configuration
@@ -0,0 +1,614 @@
+#!/usr/bin/env python3
+"""
+OKX Fake Server - Offline stand-in for the OKX REST and WebSocket APIs
+
+Implements the endpoints this project uses with deterministic synthetic data,
+so okx_sync, okx_market, okx_account, okx_execute and history.py can be run and
+load-tested without credentials or network access:
+
+    REST  public/time, public/instruments, public/funding-rate,
+          market/candles, market/history-candles,
+          account/balance, account/positions, account/config,
+          account/set-position-mode, account/set-leverage, account/leverage-info,
+          account/trade-fee, account/positions-history, account/bills,
+          trade/order, trade/cancel-order, trade/orders-pending,
+          trade/order-algo, trade/orders-algo-pending, trade/cancel-algos,
+          trade/fills-history
+    WS    /ws/v5/business and /ws/v5/public candle channels, ping/pong
+
+Prices follow a smooth deterministic path per instrument, so any time range
+can be served consistently. Orders fill immediately against that path.
+Latency, HTTP errors, rate-limit responses and WebSocket disconnects can be
+injected to exercise the retry paths.
+
+    python okx_fake_server.py --instruments 245 --latency-ms 40 --error-rate 0.01
+    OKX_REST_URL=http://127.0.0.1:8600 OKX_WS_URL=ws://127.0.0.1:8600/ws/v5/business python okx_sync.py
+
+Signatures are not checked; any API key works.
+"""
+
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+from typing import Dict, List, Optional
+from aiohttp import web, WSMsgType
+from okx_candles import BAR_MS, DAY_MS, bucket_start
+
+logger = logging.getLogger(__name__)
+
+COINS = [
+    "BTC", "ETH", "SOL", "XRP", "DOGE", "ADA", "AVAX", "LINK", "DOT", "TRX",
+    "LTC", "BCH", "NEAR", "APT", "ARB", "OP", "SUI", "TON", "UNI", "ATOM",
+    "FIL", "ETC", "INJ", "AAVE", "PEPE", "WIF", "SHIB", "TIA", "SEI", "ORDI",
+]
+
+WS_BARS = {
+    "candle1m": "1m", "candle5m": "5m", "candle15m": "15m", "candle1H": "1H", "candle1h": "1H",
+    "candle4H": "4H", "candle4h": "4H", "candle1D": "1D", "candle1d": "1D",
+    "candle1W": "1W", "candle1w": "1W", "candle1M": "1M",
+}
+
+
+def _hash01(*values: int) -> float:
+    """Deterministic pseudo-random number in [0, 1) from integers"""
+    x = 0x9E3779B97F4A7C15
+    for v in values:
+        x = (x ^ (v & 0xFFFFFFFFFFFFFFFF)) * 0xBF58476D1CE4E5B9 & 0xFFFFFFFFFFFFFFFF
+        x = (x ^ (x >> 31)) * 0x94D049BB133111EB & 0xFFFFFFFFFFFFFFFF
+    return (x >> 11) / float(1 << 53)
+
+
+def _fmt(value: float) -> str:
+    return f"{value:.8g}"
+
+
+class FakeOKXServer:
+    """aiohttp application that imitates the OKX v5 API"""
+
+    def __init__(self, instruments: int = 50, seed: int = 7, latency_ms: float = 0.0,
+                 jitter_ms: float = 0.0, error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 ws_interval: float = 1.0, ws_drop_interval: float = 0.0, balance: float = 10000.0):
+        self.seed = seed
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.ws_interval = ws_interval
+        self.ws_drop_interval = ws_drop_interval
+        self._rng = random.Random(seed)
+        self.stats = {"rest_requests": 0, "errors_injected": 0, "ws_messages": 0, "ws_connections": 0}
+
+        self.instruments = {}
+        for i in range(instruments):
+            coin = COINS[i] if i < len(COINS) else f"SYN{i}"
+            inst_id = f"{coin}-USDT-SWAP"
+            base = 10 ** (4.8 - 6.0 * _hash01(seed, i)) if i else 60000.0
+            ct_val = 10 ** round(math.log10(10.0 / base))  # About 10 USDT per contract
+            self.instruments[inst_id] = {"index": i, "base": base, "ctVal": ct_val}
+
+        # Account state (net position mode)
+        self.cash = balance
+        self.pos_mode = "net_mode"
+        self.leverage = {}  # instId -> lever
+        self.positions = {}  # instId -> {"pos", "avgPx", "cTime", "maxPos"}
+        self.fills = []
+        self.positions_history = []
+        self.algo_orders = []
+        self._order_seq = 1
+
+        self._runner = None
+        self.host = "127.0.0.1"
+        self.port = 0
+
+    # ------------------------------------------------------------------ prices
+
+    def price(self, inst_id: str, ts: int) -> float:
+        """Synthetic mark price of an instrument at ts (ms)"""
+        info = self.instruments[inst_id]
+        i = info["index"]
+        hours = ts / 3600000.0
+        phase = 6.283 * _hash01(self.seed, i, 1)
+        drift = (
+            0.08 * math.sin(hours / 97.0 + phase)
+            + 0.03 * math.sin(hours / 11.3 + 2 * phase)
+            + 0.008 * math.sin(hours * 1.9 + 3 * phase)
+            + 0.002 * math.sin(hours * 29.0 + 5 * phase)
+        )
+        return info["base"] * math.exp(drift)
+
+    def candle(self, inst_id: str, bar: str, start: int, now_ms: int) -> List[str]:
+        """OKX candle row for the bar opening at start (forming when it contains now_ms)"""
+        end = self._next_start(start, bar)
+        close_ts = min(end, now_ms)
+        info = self.instruments[inst_id]
+        samples = [self.price(inst_id, start + (close_ts - start) * k // 8) for k in range(9)]
+        o, c = samples[0], samples[-1]
+        wick = 0.002 * _hash01(self.seed, info["index"], start // 60000)
+        h = max(samples) * (1 + wick)
+        low = min(samples) * (1 - wick)
+        minutes = max((close_ts - start) / 60000.0, 0.0)
+        vol = round(minutes * (50 + 100 * _hash01(self.seed, info["index"], start, 2)))
+        vol_ccy = vol * info["ctVal"]
+        confirm = "1" if end <= now_ms else "0"
+        return [str(start), _fmt(o), _fmt(h), _fmt(low), _fmt(c), str(vol), _fmt(vol_ccy),
+                _fmt(vol_ccy * (o + c) / 2), confirm]
+
+    @staticmethod
+    def _next_start(start: int, bar: str) -> int:
+        if bar == "1M":
+            return bucket_start(start + 32 * DAY_MS, bar)
+        return start + BAR_MS[bar]
+
+    def candles(self, inst_id: str, bar: str, after: Optional[int], before: Optional[int],
+                limit: int, now_ms: int) -> List[List[str]]:
+        newest = now_ms if after is None else min(now_ms, after - 1)
+        start = bucket_start(newest, bar)
+        out = []
+        while len(out) < limit and (before is None or start > before):
+            out.append(self.candle(inst_id, bar, start, now_ms))
+            start = bucket_start(start - 1, bar)
+        return out
+
+    # --------------------------------------------------------------- plumbing
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self._inject])
+        routes = [
+            ("GET", "/api/v5/public/time", self.public_time),
+            ("GET", "/api/v5/public/instruments", self.public_instruments),
+            ("GET", "/api/v5/public/funding-rate", self.funding_rate),
+            ("GET", "/api/v5/market/candles", self.market_candles),
+            ("GET", "/api/v5/market/history-candles", self.market_candles),
+            ("GET", "/api/v5/account/balance", self.account_balance),
+            ("GET", "/api/v5/account/positions", self.account_positions),
+            ("GET", "/api/v5/account/config", self.account_config),
+            ("POST", "/api/v5/account/set-position-mode", self.set_position_mode),
+            ("POST", "/api/v5/account/set-leverage", self.set_leverage),
+            ("GET", "/api/v5/account/leverage-info", self.leverage_info),
+            ("GET", "/api/v5/account/trade-fee", self.trade_fee),
+            ("GET", "/api/v5/account/positions-history", self.account_positions_history),
+            ("GET", "/api/v5/account/bills", self.account_bills),
+            ("POST", "/api/v5/trade/order", self.trade_order),
+            ("POST", "/api/v5/trade/cancel-order", self.cancel_order),
+            ("GET", "/api/v5/trade/orders-pending", self.orders_pending),
+            ("POST", "/api/v5/trade/order-algo", self.order_algo),
+            ("GET", "/api/v5/trade/orders-algo-pending", self.orders_algo_pending),
+            ("POST", "/api/v5/trade/cancel-algos", self.cancel_algos),
+            ("GET", "/api/v5/trade/fills-history", self.fills_history),
+            ("GET", "/ws/v5/business", self.websocket),
+            ("GET", "/ws/v5/public", self.websocket),
+        ]
+        for method, path, handler in routes:
+            app.router.add_route(method, path, handler)
+        return app
+
+    @web.middleware
+    async def _inject(self, request: web.Request, handler):
+        """Latency and error injection for REST calls"""
+        if request.path.startswith("/ws/"):
+            return await handler(request)
+        self.stats["rest_requests"] += 1
+        delay = self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        roll = self._rng.random()
+        if roll < self.error_rate:
+            self.stats["errors_injected"] += 1
+            return web.json_response({"code": "50001", "msg": "Service temporarily unavailable", "data": []},
+                                     status=503)
+        if roll < self.error_rate + self.rate_limit_rate:
+            self.stats["errors_injected"] += 1
+            if self._rng.random() < 0.5:
+                return web.Response(status=429, text="Too Many Requests")
+            return web.json_response({"code": "50011", "msg": "Too Many Requests", "data": []})
+        return await handler(request)
+
+    @staticmethod
+    def _ok(data, msg: str = "") -> web.Response:
+        return web.json_response({"code": "0", "msg": msg, "data": data})
+
+    @staticmethod
+    def _error(code: str, msg: str) -> web.Response:
+        return web.json_response({"code": code, "msg": msg, "data": []})
+
+    @staticmethod
+    async def _body(request: web.Request) -> Dict:
+        try:
+            body = await request.json()
+        except (ValueError, json.JSONDecodeError):
+            return {}
+        return body if isinstance(body, dict) else {}
+
+    @staticmethod
+    def _now() -> int:
+        return int(time.time() * 1000)
+
+    # ------------------------------------------------------------- public/market
+
+    async def public_time(self, request):
+        return self._ok([{"ts": str(self._now())}])
+
+    async def public_instruments(self, request):
+        if request.query.get("instType", "SWAP") != "SWAP":
+            return self._ok([])
+        data = []
+        for inst_id, info in self.instruments.items():
+            coin = inst_id.split("-")[0]
+            tick = 10 ** math.floor(math.log10(info["base"]) - 4)
+            data.append({
+                "instType": "SWAP", "instId": inst_id, "uly": f"{coin}-USDT", "instFamily": f"{coin}-USDT",
+                "settleCcy": "USDT", "ctVal": _fmt(info["ctVal"]), "ctMult": "1", "ctValCcy": coin,
+                "ctType": "linear", "lotSz": "1", "minSz": "1", "tickSz": _fmt(tick), "lever": "50",
+                "state": "live", "listTime": "1600000000000", "expTime": "", "alias": "",
+            })
+        return self._ok(data)
+
+    async def funding_rate(self, request):
+        inst_id = request.query.get("instId", "")
+        if inst_id not in self.instruments:
+            return self._error("51001", "Instrument ID does not exist")
+        now = self._now()
+        rate = (_hash01(self.seed, self.instruments[inst_id]["index"], now // 28800000) - 0.4) * 0.0005
+        next_time = (now // 28800000 + 1) * 28800000
+        return self._ok([{"instType": "SWAP", "instId": inst_id, "fundingRate": _fmt(rate),
+                          "nextFundingRate": _fmt(rate * 0.9), "fundingTime": str(next_time),
+                          "nextFundingTime": str(next_time + 28800000)}])
+
+    async def market_candles(self, request):
+        q = request.query
+        inst_id = q.get("instId", "")
+        bar = q.get("bar", "1m")
+        if inst_id not in self.instruments:
+            return self._error("51001", "Instrument ID does not exist")
+        if bar not in BAR_MS and bar != "1M":
+            return self._error("51000", "Parameter bar error")
+        cap = 100 if request.path.endswith("history-candles") else 300
+        limit = min(int(q.get("limit") or 100), cap)
+        after = int(q["after"]) if q.get("after") else None
+        before = int(q["before"]) if q.get("before") else None
+        return self._ok(self.candles(inst_id, bar, after, before, limit, self._now()))
+
+    # ------------------------------------------------------------------ account
+
+    def _position_row(self, inst_id: str, now: int) -> Dict:
+        position = self.positions[inst_id]
+        mark = self.price(inst_id, now)
+        ct_val = self.instruments[inst_id]["ctVal"]
+        pos = position["pos"]
+        lever = self.leverage.get(inst_id, 10)
+        upl = (mark - position["avgPx"]) * pos * ct_val
+        notional = abs(pos) * ct_val * mark
+        margin = notional / lever
+        return {
+            "instType": "SWAP", "instId": inst_id, "mgnMode": "cross", "posSide": "net",
+            "pos": _fmt(pos), "avgPx": _fmt(position["avgPx"]), "markPx": _fmt(mark), "last": _fmt(mark),
+            "upl": _fmt(upl), "uplRatio": _fmt(upl / margin if margin else 0.0), "lever": str(lever),
+            "notionalUsd": _fmt(notional), "imr": _fmt(margin), "margin": "", "liqPx": "",
+            "posId": str(1000 + self.instruments[inst_id]["index"]), "ccy": "USDT",
+            "cTime": str(position["cTime"]), "uTime": str(now),
+        }
+
+    async def account_balance(self, request):
+        now = self._now()
+        upl = sum(float(self._position_row(inst_id, now)["upl"]) for inst_id in self.positions)
+        imr = sum(float(self._position_row(inst_id, now)["imr"]) for inst_id in self.positions)
+        eq = self.cash + upl
+        return self._ok([{
+            "totalEq": _fmt(eq), "adjEq": _fmt(eq), "imr": _fmt(imr), "uTime": str(now),
+            "details": [{"ccy": "USDT", "eq": _fmt(eq), "cashBal": _fmt(self.cash), "availBal": _fmt(eq - imr),
+                         "availEq": _fmt(eq - imr), "frozenBal": _fmt(imr), "upl": _fmt(upl),
+                         "eqUsd": _fmt(eq), "uTime": str(now)}],
+        }])
+
+    async def account_positions(self, request):
+        inst_id = request.query.get("instId")
+        now = self._now()
+        rows = [self._position_row(i, now) for i in self.positions if not inst_id or i == inst_id]
+        return self._ok(rows)
+
+    async def account_config(self, request):
+        return self._ok([{"uid": "1", "acctLv": "2", "posMode": self.pos_mode, "autoLoan": False}])
+
+    async def set_position_mode(self, request):
+        body = await self._body(request)
+        if self.positions:
+            return self._error("59000", "Cannot change position mode with open positions")
+        self.pos_mode = body.get("posMode", self.pos_mode)
+        return self._ok([{"posMode": self.pos_mode}])
+
+    async def set_leverage(self, request):
+        body = await self._body(request)
+        inst_id = body.get("instId", "")
+        if inst_id not in self.instruments:
+            return self._error("51001", "Instrument ID does not exist")
+        self.leverage[inst_id] = int(float(body.get("lever", 10)))
+        return self._ok([{"instId": inst_id, "lever": str(self.leverage[inst_id]),
+                          "mgnMode": body.get("mgnMode", "cross"), "posSide": "net"}])
+
+    async def leverage_info(self, request):
+        inst_id = request.query.get("instId", "")
+        return self._ok([{"instId": inst_id, "mgnMode": request.query.get("mgnMode", "cross"),
+                          "posSide": "net", "lever": str(self.leverage.get(inst_id, 10))}])
+
+    async def trade_fee(self, request):
+        return self._ok([{"instType": "SWAP", "maker": "-0.0002", "taker": "-0.0005", "level": "Lv1",
+                          "ts": str(self._now())}])
+
+    async def account_positions_history(self, request):
+        limit = int(request.query.get("limit") or 100)
+        return self._ok(self.positions_history[-limit:][::-1])
+
+    async def account_bills(self, request):
+        limit = int(request.query.get("limit") or 100)
+        bills = [{"billId": f["tradeId"], "instId": f["instId"], "ccy": "USDT", "type": "2",
+                  "balChg": _fmt(-float(f["fee"])), "fee": f["fee"], "ts": f["ts"]} for f in self.fills]
+        return self._ok(bills[-limit:][::-1])
+
+    # -------------------------------------------------------------------- trade
+
+    def _fill(self, inst_id: str, side: str, size: float, px: float, now: int) -> Dict:
+        """Apply a fill to the net position and account cash"""
+        ct_val = self.instruments[inst_id]["ctVal"]
+        signed = size if side == "buy" else -size
+        fee = abs(size) * ct_val * px * 0.0005
+        self.cash -= fee
+        position = self.positions.get(inst_id)
+        if position is None:
+            position = self.positions[inst_id] = {"pos": 0.0, "avgPx": px, "cTime": now, "maxPos": 0.0,
+                                                  "realized": 0.0}
+        old = position["pos"]
+        new = old + signed
+        if old == 0 or (old > 0) == (signed > 0):
+            position["avgPx"] = (position["avgPx"] * abs(old) + px * abs(signed)) / abs(new)
+        else:
+            closed = min(abs(old), abs(signed))
+            pnl = (px - position["avgPx"]) * closed * ct_val * (1 if old > 0 else -1)
+            self.cash += pnl
+            position["realized"] += pnl
+            if new == 0 or (new > 0) != (old > 0):
+                lever = self.leverage.get(inst_id, 10)
+                margin = abs(old) * ct_val * position["avgPx"] / lever
+                self.positions_history.append({
+                    "instType": "SWAP", "instId": inst_id, "mgnMode": "cross", "type": "2",
+                    "posSide": "net", "direction": "long" if old > 0 else "short", "lever": str(lever),
+                    "openAvgPx": _fmt(position["avgPx"]), "closeAvgPx": _fmt(px),
+                    "openMaxPos": _fmt(max(position["maxPos"], abs(old))), "closeTotalPos": _fmt(abs(old)),
+                    "pnl": _fmt(position["realized"]), "realizedPnl": _fmt(position["realized"] - fee),
+                    "pnlRatio": _fmt(position["realized"] / margin if margin else 0.0),
+                    "cTime": str(position["cTime"]), "uTime": str(now),
+                })
+                del self.positions[inst_id]
+                if new != 0:
+                    self.positions[inst_id] = {"pos": new, "avgPx": px, "cTime": now, "maxPos": abs(new),
+                                               "realized": 0.0}
+                position = None
+        if position is not None:
+            position["pos"] = new
+            position["maxPos"] = max(position["maxPos"], abs(new))
+
+        order_id = str(self._order_seq)
+        self._order_seq += 1
+        fill = {"instType": "SWAP", "instId": inst_id, "ordId": order_id, "tradeId": order_id,
+                "side": side, "posSide": "net", "fillPx": _fmt(px), "fillSz": _fmt(size),
+                "fee": _fmt(-fee), "feeCcy": "USDT", "execType": "T", "ts": str(now)}
+        self.fills.append(fill)
+        return fill
+
+    async def trade_order(self, request):
+        body = await self._body(request)
+        inst_id = body.get("instId", "")
+        if inst_id not in self.instruments:
+            return self._error("51001", "Instrument ID does not exist")
+        side = body.get("side")
+        try:
+            size = float(body.get("sz", 0))
+        except (TypeError, ValueError):
+            size = 0.0
+        if side not in ("buy", "sell") or size <= 0:
+            return self._error("51000", "Parameter sz error")
+        now = self._now()
+        px = self.price(inst_id, now)
+        if body.get("ordType") == "limit" and body.get("px"):
+            px = float(body["px"])
+        fill = self._fill(inst_id, side, size, px, now)
+        for algo in body.get("attachAlgoOrds") or []:
+            self._add_algo(inst_id, "oco", {"sz": body.get("sz"), "side": "sell" if side == "buy" else "buy",
+                                            **algo})
+        return self._ok([{"ordId": fill["ordId"], "clOrdId": body.get("clOrdId", ""), "tag": "",
+                          "sCode": "0", "sMsg": "Order placed"}])
+
+    async def cancel_order(self, request):
+        body = await self._body(request)
+        # Every order fills immediately, so there is never anything left to cancel
+        return self._ok([{"ordId": body.get("ordId", ""), "sCode": "51400",
+                          "sMsg": "Order cancellation failed as the order has been filled"}])
+
+    async def orders_pending(self, request):
+        return self._ok([])
+
+    def _add_algo(self, inst_id: str, ord_type: str, params: Dict) -> Dict:
+        algo_id = f"A{self._order_seq}"
+        self._order_seq += 1
+        algo = {"algoId": algo_id, "instType": "SWAP", "instId": inst_id, "ordType": ord_type,
+                "state": "live", "cTime": str(self._now()), "posSide": "net"}
+        for key in ("side", "sz", "tdMode", "tpTriggerPx", "tpOrdPx", "slTriggerPx", "slOrdPx",
+                    "tpTriggerPxType", "slTriggerPxType", "triggerPx", "orderPx"):
+            if params.get(key) not in (None, ""):
+                algo[key] = str(params[key])
+        self.algo_orders.append(algo)
+        return algo
+
+    async def order_algo(self, request):
+        body = await self._body(request)
+        inst_id = body.get("instId", "")
+        if inst_id not in self.instruments:
+            return self._error("51001", "Instrument ID does not exist")
+        algo = self._add_algo(inst_id, body.get("ordType", "conditional"), body)
+        return self._ok([{"algoId": algo["algoId"], "sCode": "0", "sMsg": ""}])
+
+    async def orders_algo_pending(self, request):
+        q = request.query
+        rows = [a for a in self.algo_orders
+                if (not q.get("ordType") or a["ordType"] in q["ordType"].split(","))
+                and (not q.get("instId") or a["instId"] == q["instId"])]
+        return self._ok(rows)
+
+    async def cancel_algos(self, request):
+        try:
+            body = await request.json()
+        except ValueError:
+            body = []
+        ids = {item.get("algoId") for item in (body if isinstance(body, list) else [body])}
+        self.algo_orders = [a for a in self.algo_orders if a["algoId"] not in ids]
+        return self._ok([{"algoId": algo_id, "sCode": "0", "sMsg": ""} for algo_id in ids])
+
+    async def fills_history(self, request):
+        limit = int(request.query.get("limit") or 100)
+        inst_id = request.query.get("instId")
+        rows = [f for f in self.fills if not inst_id or f["instId"] == inst_id]
+        return self._ok(rows[-limit:][::-1])
+
+    # ---------------------------------------------------------------- websocket
+
+    async def websocket(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.stats["ws_connections"] += 1
+        subscriptions = {}  # (channel, instId) -> last pushed bar start
+        pusher = asyncio.create_task(self._push_candles(ws, subscriptions))
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                if msg.data == "ping":
+                    await ws.send_str("pong")
+                    continue
+                try:
+                    request_msg = json.loads(msg.data)
+                except ValueError:
+                    continue
+                op = request_msg.get("op")
+                for arg in request_msg.get("args", []):
+                    channel, inst_id = arg.get("channel"), arg.get("instId")
+                    if op == "subscribe" and channel in WS_BARS and inst_id in self.instruments:
+                        subscriptions[(channel, inst_id)] = None
+                        await ws.send_str(json.dumps({"event": "subscribe", "arg": arg}))
+                    elif op == "unsubscribe":
+                        subscriptions.pop((channel, inst_id), None)
+                        await ws.send_str(json.dumps({"event": "unsubscribe", "arg": arg}))
+                    else:
+                        await ws.send_str(json.dumps({"event": "error", "code": "60018",
+                                                      "msg": f"Wrong URL or channel:{channel},instId:{inst_id}"}))
+        finally:
+            pusher.cancel()
+        return ws
+
+    async def _push_candles(self, ws: web.WebSocketResponse, subscriptions: Dict) -> None:
+        """Push the forming candle of every subscribed channel each ws_interval seconds"""
+        connected = time.monotonic()
+        try:
+            while not ws.closed:
+                await asyncio.sleep(self.ws_interval)
+                if self.ws_drop_interval and time.monotonic() - connected > self.ws_drop_interval:
+                    await ws.close()
+                    return
+                now = self._now()
+                for key in list(subscriptions):
+                    channel, inst_id = key
+                    if inst_id not in self.instruments:
+                        # Delisted while subscribed: the exchange simply stops pushing
+                        subscriptions.pop(key, None)
+                        continue
+                    bar = WS_BARS[channel]
+                    start = bucket_start(now, bar)
+                    if key not in subscriptions:
+                        continue  # Unsubscribed while pushing
+                    previous = subscriptions[key]
+                    rows = []
+                    if previous is not None and previous != start:
+                        # The last pushed bar closed since the previous push
+                        rows.append(self.candle(inst_id, bar, previous, now))
+                    rows.append(self.candle(inst_id, bar, start, now))
+                    subscriptions[key] = start
+                    for row in rows:
+                        await ws.send_str(json.dumps({"arg": {"channel": channel, "instId": inst_id},
+                                                      "data": [row]}))
+                        self.stats["ws_messages"] += 1
+        except (ConnectionError, RuntimeError):
+            pass
+
+    # ---------------------------------------------------------------- lifecycle
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start serving; returns the REST base URL"""
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        self.host = host
+        # Actual port when 0 (ephemeral) was requested
+        self.port = self._runner.addresses[0][1]
+        return self.rest_url
+
+    async def close(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @property
+    def rest_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def ws_url(self) -> str:
+        return f"ws://{self.host}:{self.port}/ws/v5/business"
+
+
+def main():
+    """Command line entry point"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Offline fake OKX REST/WebSocket server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--instruments", type=int, default=50, help="Number of synthetic USDT-SWAP instruments")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Added REST latency")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform +/- jitter on the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of REST calls answered with 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0,
+                        help="Fraction of REST calls answered with 429 / code 50011")
+    parser.add_argument("--ws-interval", type=float, default=1.0, help="Seconds between candle pushes per channel")
+    parser.add_argument("--ws-drop-interval", type=float, default=0.0,
+                        help="Close WebSocket connections after this many seconds (0 = never)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s: %(message)s',
+                        datefmt='%Y-%m-%d %H:%M:%S')
+    server = FakeOKXServer(
+        instruments=args.instruments, seed=args.seed, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, ws_interval=args.ws_interval,
+        ws_drop_interval=args.ws_drop_interval,
+    )
+
+    async def run():
+        await server.start(args.host, args.port)
+        logger.info(f"Fake OKX server with {len(server.instruments)} instruments. Point the modules at it with:")
+        logger.info(f"  export OKX_REST_URL={server.rest_url} OKX_WS_URL={server.ws_url}")
+        try:
+            while True:
+                await asyncio.sleep(60)
+                logger.info(f"Stats: {server.stats}")
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,560 @@
+#!/usr/bin/env python3
+"""
+OKX Batch Indicators - Cross-sectional technical indicators for all instruments at once
+
+The per-instrument path in okx_market.py (calculate_advanced_technical_indicators)
+runs mostly Python loops, so a thread pool gains almost nothing under the GIL.
+batch_indicators() stacks the 5m series of every instrument into 2D NumPy
+matrices (instruments x bars) and evaluates each indicator column-wise, so a
+loop over time costs one vector operation per bar for all instruments together.
+
+Series are grouped by length (every instrument with a full window shares one
+matrix; recent listings get their own), so each window sees exactly the bars
+the per-instrument path sees and the results carry the same keys and values.
+"""
+
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import stats
+from scipy.signal import lfilter
+from okx_store import FLOAT_FIELDS
+
+MIN_BARS = 20  # Fewer clean bars than this yields no indicators
+PERIODS_PER_DAY = 288  # 5m bars per day
+SQRT_DAY = np.sqrt(PERIODS_PER_DAY)
+
+# Indicators that are flags or counts in the per-instrument path
+INT_KEYS = {
+    "rsi_divergence", "golden_cross", "macd_cross", "bb_squeeze", "obv_trend", "vpt_trend",
+    "structure_trend", "swing_high_count", "swing_low_count", "vol_trend",
+}
+
+Matrix = np.ndarray
+
+
+def prepare_columns(columns: Dict[str, np.ndarray]) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Drop rows with unparsable values (NaN after ingest) and ensure chronological order
+
+    Args:
+        columns: Candle columns as produced by okx_store.candles_to_columns
+
+    Returns:
+        Cleaned columns, or None when fewer than MIN_BARS rows remain
+    """
+    if not columns or len(columns["ts"]) < MIN_BARS:
+        return None
+    valid = np.ones(len(columns["ts"]), dtype=bool)
+    for name in FLOAT_FIELDS:
+        valid &= ~np.isnan(columns[name])
+    if valid.sum() < MIN_BARS:
+        return None
+    order = np.nonzero(valid)[0]
+    if np.any(np.diff(columns["ts"][order]) < 0):
+        order = order[np.argsort(columns["ts"][order], kind="stable")]
+    return {name: col[order] for name, col in columns.items()}
+
+
+def batch_indicators(series: Dict[str, Dict[str, np.ndarray]]) -> Dict[str, Dict[str, float]]:
+    """
+    Compute the technical indicators of many instruments in one pass
+
+    Args:
+        series: {instId: 5m candle columns} (chronological, see okx_store.candles_to_columns)
+
+    Returns:
+        {instId: indicators} with the keys calculate_advanced_technical_indicators
+        produces; instruments with too little clean data are left out
+    """
+    groups: Dict[int, List[Tuple[str, Dict[str, np.ndarray]]]] = {}
+    for inst_id, columns in series.items():
+        cleaned = prepare_columns(columns)
+        if cleaned is not None:
+            groups.setdefault(len(cleaned["ts"]), []).append((inst_id, cleaned))
+
+    results = {}
+    for members in groups.values():
+        def stack(name: str) -> Matrix:
+            return np.vstack([columns[name] for _, columns in members])
+
+        values = compute_indicators(
+            stack("close"), stack("high"), stack("low"), stack("volCcyQuote"), stack("vol")
+        )
+        for row, (inst_id, _) in enumerate(members):
+            results[inst_id] = {
+                key: int(column[row]) if key in INT_KEYS else float(column[row])
+                for key, column in values.items()
+            }
+    return results
+
+
+def compute_indicators(closes: Matrix, highs: Matrix, lows: Matrix,
+                       volumes: Matrix, contracts: Matrix) -> Dict[str, np.ndarray]:
+    """
+    All indicators for equally long series stacked row-wise
+
+    Args:
+        closes, highs, lows: Prices, one instrument per row, oldest bar first
+        volumes: USDT volume (volCcyQuote)
+        contracts: Contract volume (vol), used by order flow and microstructure
+
+    Returns:
+        {indicator: array with one value per row}
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = {
+            "current_price": closes[:, -1],
+            "price_change_24h": (closes[:, -1] - closes[:, 0]) / closes[:, 0] * 100,
+        }
+        out.update(_rsi(closes))
+        out.update(_moving_averages(closes))
+        out.update(_macd(closes))
+        out.update(_bollinger_bands(closes))
+        out.update(_volume_profile(closes, volumes))
+        out.update(_market_structure(highs, lows, closes))
+        out.update(_volatility(highs, lows, closes))
+        out.update(_support_resistance(highs, lows, closes))
+        out.update(_order_flow(closes, contracts))
+        out.update(_volatility_enriched(closes))
+        out.update(_trend_quality(highs, lows, closes))
+        out.update(_volume_enriched(closes, volumes))
+        out.update(_momentum(closes))
+        out.update(_microstructure(highs, lows, closes, contracts))
+    return out
+
+
+# ---------------------------------------------------------------- recursive filters
+
+
+def ema_series(x: Matrix, period: int) -> Matrix:
+    """
+    EMA seeded with the SMA of the first period values, one column per bar
+
+    Column t is the EMA of the prefix x[:, :t + 1] (NaN for t < period - 1).
+    The recursion y[t] = m * x[t] + (1 - m) * y[t - 1] runs as a single
+    IIR filter pass over all rows.
+    """
+    n = x.shape[1]
+    out = np.full(x.shape, np.nan)
+    if n < period:
+        return out
+    multiplier = 2 / (period + 1)
+    seed = x[:, :period].mean(axis=1)
+    out[:, period - 1] = seed
+    if n > period:
+        out[:, period:], _ = lfilter(
+            [multiplier], [1.0, multiplier - 1], x[:, period:], axis=1,
+            zi=((1 - multiplier) * seed)[:, np.newaxis],
+        )
+    return out
+
+
+def wilder_rsi_series(x: Matrix, period: int) -> Matrix:
+    """Wilder RSI of every prefix: column k is the RSI of x[:, :period + k + 1]"""
+    deltas = np.diff(x, axis=1)
+    seed = deltas[:, :period]
+    avg_gain = np.where(seed > 0, seed, 0.0).sum(axis=1) / period
+    avg_loss = -np.where(seed < 0, seed, 0.0).sum(axis=1) / period
+    out = np.empty((x.shape[0], deltas.shape[1] - period + 1))
+    out[:, 0] = _rsi_value(avg_gain, avg_loss)
+    for k, t in enumerate(range(period, deltas.shape[1]), start=1):
+        delta = deltas[:, t]
+        avg_gain = (avg_gain * (period - 1) + np.maximum(delta, 0)) / period
+        avg_loss = (avg_loss * (period - 1) - np.minimum(delta, 0)) / period
+        out[:, k] = _rsi_value(avg_gain, avg_loss)
+    return out
+
+
+def _rsi_value(avg_gain: np.ndarray, avg_loss: np.ndarray) -> np.ndarray:
+    rs = np.where(avg_loss != 0, avg_gain / avg_loss, np.inf)
+    return 100 - (100 / (1 + rs))
+
+
+def rma_series(x: Matrix, period: int) -> Matrix:
+    """Wilder moving average seeded with the first value"""
+    alpha = 1.0 / period
+    out = np.empty(x.shape)
+    out[:, 0] = x[:, 0]
+    for t in range(1, x.shape[1]):
+        out[:, t] = alpha * x[:, t] + (1 - alpha) * out[:, t - 1]
+    return out
+
+
+def _running_sum(x: Matrix) -> np.ndarray:
+    """Row sums accumulated left to right, as a Python loop would add them"""
+    return np.cumsum(x, axis=1)[:, -1]
+
+
+def _last_two(mask: Matrix, values: Matrix) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(count, last, previous) of the values where mask is set, per row (last/previous unset below 2 hits)"""
+    rows = np.arange(mask.shape[0])
+    positions = np.where(mask, np.arange(mask.shape[1]), -1)
+    last = positions.max(axis=1)
+    previous = np.where(positions == last[:, None], -1, positions).max(axis=1)
+    return mask.sum(axis=1), values[rows, last], values[rows, previous]
+
+
+# ---------------------------------------------------------------- indicator groups
+
+
+def _rsi(closes: Matrix) -> Dict[str, np.ndarray]:
+    rsi_values = wilder_rsi_series(closes, 14)  # RSI(14) of prefixes ending at bar 14..n-1
+    rsi_14 = rsi_values[:, -1]
+    rsi_7 = wilder_rsi_series(closes, 7)[:, -1]
+    if rsi_values.shape[1] >= 14:
+        recent = rsi_values[:, -14:]
+        rsi_min, rsi_max = np.nanmin(recent, axis=1), np.nanmax(recent, axis=1)
+        stoch_rsi = np.where(rsi_max != rsi_min, (rsi_14 - rsi_min) / (rsi_max - rsi_min) * 100, 50.0)
+        price_trend = np.where(closes[:, -1] > closes[:, -4], 1, -1)
+        rsi_trend = np.where(rsi_values[:, -1] > rsi_values[:, -4], 1, -1)
+        divergence = np.where((price_trend < 0) & (rsi_trend > 0), 1,
+                              np.where((price_trend > 0) & (rsi_trend < 0), -1, 0))
+    else:
+        stoch_rsi = np.full(len(closes), 50.0)
+        divergence = np.zeros(len(closes), dtype=int)
+    return {
+        "rsi": rsi_14,
+        "rsi_7": np.where(np.isnan(rsi_7), rsi_14, rsi_7),
+        "stoch_rsi": stoch_rsi,
+        "rsi_divergence": divergence,
+    }
+
+
+def _wma(closes: Matrix, period: int) -> np.ndarray:
+    weights = np.arange(1, period + 1)
+    return closes[:, -period:] @ weights / weights.sum()
+
+
+def _moving_averages(closes: Matrix) -> Dict[str, np.ndarray]:
+    n = closes.shape[1]
+    out = {}
+    for period in (10, 20, 50, 100, 200):
+        if n >= period:
+            out[f"sma_{period}"] = closes[:, -period:].mean(axis=1)
+    for period in (12, 26, 50):
+        if n >= period:
+            out[f"ema_{period}"] = ema_series(closes, period)[:, -1]
+    out["hma_20"] = 2 * _wma(closes, 10) - _wma(closes, 20)
+    if "sma_50" in out:
+        out["golden_cross"] = (out["sma_20"] > out["sma_50"]).astype(int)
+    return out
+
+
+def _macd(closes: Matrix) -> Dict[str, np.ndarray]:
+    if closes.shape[1] < 26:
+        return {}
+    # MACD of every prefix from bar 25 on, as a percentage of EMA(26)
+    ema_12 = ema_series(closes, 12)[:, 25:]
+    ema_26 = ema_series(closes, 26)[:, 25:]
+    macd_line = np.where(ema_26 != 0, (ema_12 - ema_26) / ema_26 * 100, 0.0)
+    if macd_line.shape[1] >= 9:
+        signal = ema_series(macd_line, 9)[:, -1]
+    else:
+        signal = macd_line.mean(axis=1)
+    current = macd_line[:, -1]
+    momentum = macd_line[:, -1] - macd_line[:, -2] if macd_line.shape[1] >= 2 else np.zeros(len(closes))
+    return {
+        "macd": current,
+        "macd_signal": signal,
+        "macd_histogram": current - signal,
+        "macd_momentum": momentum,
+        "macd_cross": np.where(current > signal, 1, -1),
+    }
+
+
+def _bollinger_bands(closes: Matrix) -> Dict[str, np.ndarray]:
+    n = closes.shape[1]
+    window = closes[:, -20:]
+    sma = window.mean(axis=1)
+    std = window.std(axis=1)
+    upper = sma + (std * 2)
+    lower = sma - (std * 2)
+    position = np.where(upper != lower, (closes[:, -1] - lower) / (upper - lower), 0.5)
+    width = np.where(sma != 0, (upper - lower) / sma, 0)
+
+    # Bandwidth of the windows starting in the last 100 bars (before the current one)
+    start = max(0, n - 100)
+    if n - 20 > start:
+        windows = sliding_window_view(closes, 20, axis=1)[:, start:n - 20]
+        w_mean = windows.mean(axis=2)
+        history = np.where(w_mean != 0, (windows.std(axis=2) * 4) / w_mean, np.nan)
+        has_history = ~np.all(np.isnan(history), axis=1)
+        threshold = np.full(len(closes), -np.inf)
+        if has_history.any():
+            threshold[has_history] = np.nanpercentile(history[has_history], 20, axis=1)
+        squeeze = (has_history & (width < threshold)).astype(int)
+    else:
+        squeeze = np.zeros(len(closes), dtype=int)
+    return {
+        "bb_upper": upper,
+        "bb_lower": lower,
+        "bb_middle": sma,
+        "bb_position": position,
+        "bb_width": width,
+        "bb_squeeze": squeeze,
+    }
+
+
+def _volume_profile(closes: Matrix, volumes: Matrix) -> Dict[str, np.ndarray]:
+    n = closes.shape[1]
+    total = volumes.sum(axis=1)
+    vwap = np.where(total > 0, (closes * volumes).sum(axis=1) / total, closes[:, -1])
+    avg_volume = volumes.mean(axis=1)
+    recent_volume = volumes[:, -5:].mean(axis=1)
+    volume_ratio = np.where(avg_volume > 0, recent_volume / avg_volume, 1)
+
+    change = np.diff(closes, axis=1)
+    steps = np.where(change > 0, volumes[:, 1:], np.where(change < 0, -volumes[:, 1:], 0.0))
+    obv = np.cumsum(np.hstack([volumes[:, :1], steps]), axis=1)
+    obv_trend = np.where(obv[:, -1] > obv[:, -10:].mean(axis=1), 1, -1)
+
+    prev = closes[:, :-1]
+    price_change = np.where(prev != 0, (closes[:, 1:] - prev) / prev, 0)
+    vpt = np.cumsum(np.hstack([volumes[:, :1], volumes[:, 1:] * price_change]), axis=1)
+    vpt_trend = np.where(vpt[:, -1] > vpt[:, -2], 1, -1)
+    return {
+        "vwap": vwap,
+        "volume_ratio": volume_ratio,
+        "obv_trend": obv_trend,
+        "vpt_trend": vpt_trend,
+        "volume_24h": volumes[:, -288:].sum(axis=1) if n >= 288 else total,
+        "avg_volume": avg_volume,
+    }
+
+
+def _true_range(highs: Matrix, lows: Matrix, closes: Matrix) -> Matrix:
+    prev_close = closes[:, :-1]
+    return np.maximum(
+        np.maximum(highs[:, 1:] - lows[:, 1:], np.abs(highs[:, 1:] - prev_close)),
+        np.abs(lows[:, 1:] - prev_close),
+    )
+
+
+def _market_structure(highs: Matrix, lows: Matrix, closes: Matrix) -> Dict[str, np.ndarray]:
+    n = highs.shape[1]
+    # Swing points: higher/lower than the two bars on each side
+    h, l = highs[:, 2:n - 2], lows[:, 2:n - 2]
+    swing_high = (h > highs[:, 1:n - 3]) & (h > highs[:, :n - 4]) & (h > highs[:, 3:n - 1]) & (h > highs[:, 4:])
+    swing_low = (l < lows[:, 1:n - 3]) & (l < lows[:, :n - 4]) & (l < lows[:, 3:n - 1]) & (l < lows[:, 4:])
+    high_count, last_high, prev_high = _last_two(swing_high, h)
+    low_count, last_low, prev_low = _last_two(swing_low, l)
+    enough = (high_count >= 2) & (low_count >= 2)
+    structure_trend = np.where(
+        enough & (last_high > prev_high) & (last_low > prev_low), 1,
+        np.where(enough & (last_high < prev_high) & (last_low < prev_low), -1, 0),
+    )
+
+    atr = _true_range(highs, lows, closes)[:, -14:].mean(axis=1)
+    highest_high = highs[:, -20:].max(axis=1)
+    lowest_low = lows[:, -20:].min(axis=1)
+    channel_position = np.where(
+        highest_high != lowest_low, (closes[:, -1] - lowest_low) / (highest_high - lowest_low), 0.5
+    )
+    return {
+        "structure_trend": structure_trend,
+        "atr": atr,
+        "highest_high_20": highest_high,
+        "lowest_low_20": lowest_low,
+        "channel_position": channel_position,
+        "swing_high_count": high_count,
+        "swing_low_count": low_count,
+    }
+
+
+def _returns(closes: Matrix) -> Matrix:
+    return np.diff(closes, axis=1) / closes[:, :-1]
+
+
+def _hv(returns: Matrix, window: int) -> np.ndarray:
+    """Daily volatility in percent over the last window returns (0 when too short)"""
+    if returns.shape[1] < window:
+        return np.zeros(len(returns))
+    return returns[:, -window:].std(axis=1) * SQRT_DAY * 100
+
+
+def _volatility(highs: Matrix, lows: Matrix, closes: Matrix) -> Dict[str, np.ndarray]:
+    returns = _returns(closes)
+    volatility_5 = _hv(returns, 5)
+    volatility_20 = _hv(returns, 20)
+    volatility_50 = _hv(returns, 50)
+
+    # Parkinson volatility from the last 20 high/low ranges
+    h, l = highs[:, -20:], lows[:, -20:]
+    hl_logsquared = np.where(l > 0, np.log(h / l) ** 2, 0)
+    parkinson_vol = np.sqrt(hl_logsquared.sum(axis=1) / (4 * 20 * np.log(2))) * SQRT_DAY * 100
+
+    vol_ratio = np.where(volatility_20 > 0, volatility_5 / volatility_20, 1)
+    return {
+        "volatility": volatility_20,
+        "volatility_5": volatility_5,
+        "volatility_50": volatility_50,
+        "parkinson_vol": parkinson_vol,
+        "vol_ratio": vol_ratio,
+        "vol_trend": np.where(vol_ratio > 1.2, 1, np.where(vol_ratio < 0.8, -1, 0)),
+    }
+
+
+def _support_resistance(highs: Matrix, lows: Matrix, closes: Matrix) -> Dict[str, np.ndarray]:
+    recent_high = highs[:, -50:].max(axis=1)
+    recent_low = lows[:, -50:].min(axis=1)
+    fib_diff = recent_high - recent_low
+    pivot = (highs[:, -1] + lows[:, -1] + closes[:, -1]) / 3
+    bar_range = highs[:, -1] - lows[:, -1]
+    return {
+        "resistance": recent_high,
+        "support": recent_low,
+        "pivot": pivot,
+        "r1": 2 * pivot - lows[:, -1],
+        "r2": pivot + bar_range,
+        "s1": 2 * pivot - highs[:, -1],
+        "s2": pivot - bar_range,
+        "fib_0": recent_low,
+        "fib_236": recent_low + fib_diff * 0.236,
+        "fib_382": recent_low + fib_diff * 0.382,
+        "fib_500": recent_low + fib_diff * 0.500,
+        "fib_618": recent_low + fib_diff * 0.618,
+        "fib_786": recent_low + fib_diff * 0.786,
+        "fib_1000": recent_high,
+    }
+
+
+def _order_flow(closes: Matrix, contracts: Matrix) -> Dict[str, np.ndarray]:
+    change = np.diff(closes, axis=1)
+    flow = contracts[:, 1:] * np.abs(change)
+    buy = _running_sum(np.where(change > 0, flow, 0.0))
+    sell = _running_sum(np.where(change > 0, 0.0, flow))
+    total = buy + sell
+    return {
+        "order_flow_imbalance": np.where(total > 0, (buy - sell) / total, 0),
+        "volume_delta": buy - sell,
+        "buy_pressure": buy,
+        "sell_pressure": sell,
+        "buying_pressure": np.where(total > 0, buy / total, 0.5),
+    }
+
+
+def _volatility_enriched(closes: Matrix) -> Dict[str, np.ndarray]:
+    n = closes.shape[1]
+    returns = _returns(closes)
+    r = returns.shape[1]
+    out = {
+        "hv10": _hv(returns, 10),
+        "hv20": _hv(returns, 20),
+        "hv50": _hv(returns, 50) if r >= 50 else _hv(returns, r),
+    }
+
+    # Range and max drawdown over the last 24h (288 5m bars)
+    recent = closes[:, -min(288, n):]
+    first = recent[:, 0]
+    out["range_pct_24h"] = np.where(first > 0, (recent.max(axis=1) - recent.min(axis=1)) / first * 100, 0.0)
+    peak = np.maximum.accumulate(recent, axis=1)
+    out["mdd_24h"] = np.minimum(((recent - peak) / peak * 100).min(axis=1), 0.0)
+
+    if r >= 20:
+        out["skew_20"] = stats.skew(returns[:, -20:], axis=1)
+        out["kurtosis_20"] = stats.kurtosis(returns[:, -20:], axis=1)
+    # Current volatility ranked against 20-bar windows from the start of the last 200 returns
+    current = _hv(returns, min(50, r))
+    hist_win = min(200, r)
+    if hist_win >= 20:
+        history = sliding_window_view(returns[:, :hist_win], 20, axis=1).std(axis=2) * SQRT_DAY * 100
+        out["vol_percentile_rolling"] = (history <= current[:, None]).sum(axis=1) / history.shape[1] * 100
+    return out
+
+
+def _trend_quality(highs: Matrix, lows: Matrix, closes: Matrix) -> Dict[str, np.ndarray]:
+    n = closes.shape[1]
+    if n < 26:
+        return {}
+    rows = len(closes)
+    period = 14
+    up_move = highs[:, 1:] - highs[:, :-1]
+    down_move = lows[:, :-1] - lows[:, 1:]
+    plus_dm = np.where((up_move > down_move) & (up_move > 0), up_move, 0.0)
+    minus_dm = np.where((down_move > up_move) & (down_move > 0), down_move, 0.0)
+    # One smoothing pass for TR, +DM and -DM of every instrument
+    smoothed = rma_series(np.vstack([_true_range(highs, lows, closes), plus_dm, minus_dm]), period)
+    tr14, pdm14, mdm14 = smoothed[:rows], smoothed[rows:2 * rows], smoothed[2 * rows:]
+    di_plus = np.where(tr14 > 0, 100 * (pdm14 / tr14), 0.0)
+    di_minus = np.where(tr14 > 0, 100 * (mdm14 / tr14), 0.0)
+    di_sum = di_plus + di_minus
+    dx = np.where(di_sum > 0, 100 * np.abs(di_plus - di_minus) / di_sum, 0.0)
+    out = {"adx_14": rma_series(dx, period)[:, -1]}
+
+    aroon_len = 25
+    out["aroon_up_25"] = 100 * (aroon_len - 1 - highs[:, -aroon_len:].argmax(axis=1)) / (aroon_len - 1)
+    out["aroon_down_25"] = 100 * (aroon_len - 1 - lows[:, -aroon_len:].argmin(axis=1)) / (aroon_len - 1)
+
+    tp = ((highs + lows + closes) / 3.0)[:, -20:]
+    sma_tp = tp.mean(axis=1)
+    md = np.abs(tp - sma_tp[:, None]).mean(axis=1)
+    out["cci_20"] = np.where(md > 0, (tp[:, -1] - sma_tp) / (0.015 * md), 0.0)
+
+    # Bandwidth ranked against 20-bar windows from the start of the last 200 bars (higher = more squeezed)
+    def bandwidth(window: Matrix) -> np.ndarray:
+        mean = window.mean(axis=-1)
+        return np.where(mean > 0, (2 * 2 * window.std(axis=-1)) / mean * 100, 0.0)
+
+    bbw = bandwidth(closes[:, -20:])
+    history = bandwidth(sliding_window_view(closes[:, :min(200, n)], 20, axis=1))
+    rank = (history >= bbw[:, None]).sum(axis=1)
+    out["bb_squeeze_score"] = 100 - rank / history.shape[1] * 100
+    return out
+
+
+def _volume_enriched(closes: Matrix, volumes: Matrix) -> Dict[str, np.ndarray]:
+    window = volumes[:, -20:]
+    mu = window.mean(axis=1)
+    sigma = window.std(axis=1)
+    change = np.diff(closes, axis=1)
+    obv = _running_sum(np.where(change > 0, volumes[:, 1:], np.where(change < 0, -volumes[:, 1:], 0.0)))
+    total = window.sum(axis=1)
+    p = closes[:, -20:]
+    vwap = np.where(total > 0, (p * window).sum(axis=1) / total, p[:, -1])
+    return {
+        "volume_z_20": np.where(sigma > 0, (volumes[:, -1] - mu) / sigma, 0.0),
+        "obv_20": obv,
+        # Close-only money flow: the multiplier is 0 for every bar
+        "cmf_20": np.zeros(len(closes)),
+        "vwap_dev_pct_20": np.where(vwap > 0, (closes[:, -1] - vwap) / vwap * 100, 0.0),
+    }
+
+
+def _momentum(closes: Matrix) -> Dict[str, np.ndarray]:
+    n = closes.shape[1]
+    last = closes[:, -1]
+    out = {}
+    for bars in (1, 3, 5, 10, 12, 20, 60):
+        if n > bars:
+            base = closes[:, -(bars + 1)]
+            out[f"momentum_{bars}"] = np.where(base != 0, (last - base) / base * 100, 0.0)
+        else:
+            out[f"momentum_{bars}"] = np.zeros(len(closes))
+
+    sma_20 = closes[:, -20:].mean(axis=1)
+    mean_deviation = np.abs(closes[:, -20:] - sma_20[:, None]).mean(axis=1)
+    out["cci"] = np.where(mean_deviation > 0, (last - sma_20) / (0.015 * mean_deviation), 0)
+
+    highest_high = closes[:, -14:].max(axis=1)
+    lowest_low = closes[:, -14:].min(axis=1)
+    spread = highest_high != lowest_low
+    out["williams_r"] = np.where(spread, (highest_high - last) / (highest_high - lowest_low) * -100, -50)
+    out["stochastic_k"] = np.where(spread, (last - lowest_low) / (highest_high - lowest_low) * 100, 50)
+    return out
+
+
+def _microstructure(highs: Matrix, lows: Matrix, closes: Matrix, contracts: Matrix) -> Dict[str, np.ndarray]:
+    spreads = (highs - lows) / closes * 100
+    total = contracts.sum(axis=1)
+    vwap = np.where(total > 0, (closes * contracts).sum(axis=1) / total, closes[:, -1])
+    change = np.diff(closes, axis=1)
+    upticks = (change > 0).sum(axis=1)
+    downticks = (change < 0).sum(axis=1)
+    ticks = upticks + downticks
+    return {
+        "avg_spread": spreads.mean(axis=1),
+        "current_spread": spreads[:, -1],
+        "price_efficiency": 1 - np.abs(closes[:, -1] - vwap) / vwap,
+        "tick_indicator": np.where(ticks > 0, (upticks - downticks) / np.maximum(ticks, 1), 0),
+    }
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+OKX Indicators Benchmark - Time the indicator paths of okx_market.py
+
+Runs the same 5m series through the legacy prefix-recomputing MACD, the
+single-pass EMA/MACD of ProfessionalMarketAnalyzer, the full per-instrument
+indicator set and the batch engine of okx_indicators.py, and reports the time
+per run and the largest difference from the reference:
+
+    python okx_indicators_bench.py                     # 5m series from data/candles/
+    python okx_indicators_bench.py --synthetic 245     # generated series, no data needed
+    python okx_indicators_bench.py --repeat 5
+"""
+
+import os
+import time
+import math
+import logging
+import argparse
+from typing import Callable, Dict, List
+import numpy as np
+from okx_store import CandleStore, candles_to_columns
+from okx_indicators import batch_indicators, prepare_columns
+
+Series = Dict[str, Dict[str, np.ndarray]]
+
+
+def load_series(data_dir: str) -> Series:
+    """5m columns of every instrument in an existing store"""
+    store = CandleStore(data_dir)
+    series = {}
+    if not os.path.isdir(store.root):
+        return series
+    for inst_id in sorted(os.listdir(store.root)):
+        data = store.read_series(inst_id, "5m")
+        if data and len(data["columns"]["ts"]):
+            series[inst_id] = data["columns"]
+    return series
+
+
+def synthetic_series(instruments: int) -> Series:
+    """288 5m bars per instrument from the fake server's price model"""
+    from okx_fake_server import FakeOKXServer
+
+    server = FakeOKXServer(instruments=instruments)
+    now_ms = int(time.time() * 1000)
+    return {
+        inst_id: candles_to_columns(server.candles(inst_id, "5m", None, None, 288, now_ms))
+        for inst_id in server.instruments
+    }
+
+
+def legacy_macd(prices: np.ndarray) -> Dict[str, float]:
+    """MACD as computed before the single-pass EMA series (every prefix from scratch)"""
+
+    def ema(values, period):
+        if len(values) < period:
+            return np.mean(values)
+        multiplier = 2 / (period + 1)
+        result = np.mean(values[:period])
+        for price in values[period:]:
+            result = (price - result) * multiplier + result
+        return float(result)
+
+    if len(prices) < 26:
+        return {}
+    macd_line = []
+    for i in range(25, len(prices)):
+        window = prices[: i + 1]
+        ema_12, ema_26 = ema(window, 12), ema(window, 26)
+        macd_line.append(((ema_12 - ema_26) / ema_26 * 100) if ema_26 != 0 else 0)
+    signal = ema(np.array(macd_line), 9) if len(macd_line) >= 9 else np.mean(macd_line)
+    return {"macd": macd_line[-1], "macd_signal": signal, "macd_histogram": macd_line[-1] - signal}
+
+
+def _timed(fn: Callable[[], Dict], repeat: int):
+    """(best seconds, last result) over repeat runs"""
+    best, result = math.inf, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def _max_rel_diff(reference: Dict[str, Dict], other: Dict[str, Dict]) -> float:
+    worst = 0.0
+    for inst_id, values in reference.items():
+        for key, value in values.items():
+            a, b = float(value), float(other[inst_id][key])
+            if a == b or (math.isnan(a) and math.isnan(b)):
+                continue
+            worst = max(worst, abs(a - b) / max(abs(a), 1e-12))
+    return worst
+
+
+def run(series: Series, repeat: int) -> List[Dict]:
+    from okx_market import ProfessionalMarketAnalyzer
+
+    analyzer = ProfessionalMarketAnalyzer()
+    closes = {inst_id: cleaned["close"] for inst_id, cleaned in
+              ((inst_id, prepare_columns(columns)) for inst_id, columns in series.items())
+              if cleaned is not None}
+
+    legacy_s, legacy = _timed(lambda: {k: legacy_macd(c) for k, c in closes.items()}, repeat)
+    macd_s, macd = _timed(lambda: {k: analyzer._calculate_macd(c) for k, c in closes.items()}, repeat)
+    single_s, single = _timed(
+        lambda: {k: analyzer.calculate_advanced_technical_indicators(c) for k, c in series.items()}, repeat
+    )
+    batch_s, batch = _timed(lambda: batch_indicators(series), repeat)
+    single = {k: v for k, v in single.items() if v}
+    return [
+        {"path": "MACD, prefix recompute (legacy)", "seconds": legacy_s, "diff": 0.0, "base": legacy_s},
+        {"path": "MACD, single-pass EMA series", "seconds": macd_s,
+         "diff": _max_rel_diff(legacy, {k: {key: v[key] for key in legacy[k]} for k, v in macd.items()}),
+         "base": legacy_s},
+        {"path": "All indicators, per instrument", "seconds": single_s, "diff": 0.0, "base": single_s},
+        {"path": "All indicators, batch engine", "seconds": batch_s,
+         "diff": _max_rel_diff(single, batch), "base": single_s},
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark okx_market indicator paths")
+    parser.add_argument("--data-dir", default="data", help="Store to take 5m series from")
+    parser.add_argument("--synthetic", type=int, default=0, metavar="N",
+                        help="Generate N instruments instead of reading --data-dir")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per path (best time is reported)")
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    series = synthetic_series(args.synthetic) if args.synthetic else load_series(args.data_dir)
+    if not series:
+        parser.error(f"No 5m series under {args.data_dir}/candles; run okx_sync.py first or use --synthetic N")
+    bars = sum(len(columns["ts"]) for columns in series.values())
+    print(f"{len(series)} instruments, {bars} 5m candles")
+    print(f"{'path':<34} {'ms':>10} {'speedup':>8} {'max rel diff':>13}")
+    for result in run(series, args.repeat):
+        print(f"{result['path']:<34} {result['seconds'] * 1000:>10.1f} "
+              f"{result['base'] / result['seconds']:>7.1f}x {result['diff']:>13.1e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -19,7 +19,11 @@ import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta, timezone
 from okx_time_utils import okx_time, get_okx_current_time
-from typing import Dict, List, Tuple, Optional, Any
+from okx_store import CandleStore, FLOAT_FIELDS, candles_to_columns
+from okx_indicators import batch_indicators, ema_series, prepare_columns
+from okx_shm import SharedSnapshotReader, default_shm_path
+from okx_endpoints import rest_url
+from typing import Dict, List, Tuple, Optional, Any, Union
 from dataclasses import dataclass, field
 from decimal import Decimal, getcontext
 import statistics
@@ -136,7 +140,7 @@ class OKXTimeAPI:
     """OKX Time API handler with proper error handling"""
 
     def __init__(self):
-        self.base_url = "https://www.okx.com"
+        self.base_url = rest_url()
         self.timeout = 10
         self.retry_count = 3
 
@@ -178,10 +182,20 @@ class ProfessionalMarketAnalyzer:
         self.config = configparser.ConfigParser()
         self.config.read(config_path)
         self.data_dir = "data"
+        self.store = CandleStore(self.data_dir)
+        # Live snapshot published by okx_sync.py in shared memory (preferred when fresh)
+        self.shm_reader = SharedSnapshotReader(
+            self.config.get("SYNC", "shm_path", fallback=default_shm_path())
+        )
+        self.shm_max_age = self.config.getint("SYNC", "shm_max_age", fallback=120)
         self.instruments_file = "instruments.json"
         self.market_data = {}
         self.instruments_info = {}
         self.time_api = OKXTimeAPI()
+        # Compute indicators for all instruments at once (okx_indicators.py) instead of one by one
+        self.batch_indicators = self.config.getboolean(
+            "ANALYSIS", "batch_indicators", fallback=True
+        )
 
         # Professional trading parameters
         self.min_volume_threshold = 100000  # Minimum 24h volume in USD
@@ -206,11 +220,21 @@ class ProfessionalMarketAnalyzer:
         # Load market data for each instrument with parallel processing
         loaded_count = 0
         failed_count = 0
+        shared = self._load_shared_snapshot()
 
         with ThreadPoolExecutor(max_workers=10) as executor:
             futures = {}
 
             for inst_id in self.instruments_info.keys():
+                if inst_id in shared:
+                    self.market_data[inst_id] = shared[inst_id]
+                    loaded_count += 1
+                    continue
+                if self.store.has_instrument(inst_id):
+                    future = executor.submit(self._load_instrument_store, inst_id)
+                    futures[future] = inst_id
+                    continue
+                # Legacy JSON files (okx_sync.py with export_json enabled or older versions)
                 data_file = os.path.join(self.data_dir, f"{inst_id}.json")
                 if os.path.exists(data_file):
                     future = executor.submit(
@@ -233,15 +257,61 @@ class ProfessionalMarketAnalyzer:
             f"Successfully loaded market data for {loaded_count} instruments, {failed_count} failed"
         )
 
+    def _load_shared_snapshot(self) -> Dict[str, Dict]:
+        """Read the live snapshot published by okx_sync.py (empty when missing or stale)"""
+        try:
+            snapshot = self.shm_reader.read()
+            if snapshot is None:
+                return {}
+            age = time.time() - self.shm_reader.publish_ms / 1000
+            if age > self.shm_max_age:
+                logger.info(f"Shared snapshot is {age:.0f}s old, using stored files")
+                return {}
+        except Exception as e:
+            logger.warning(f"Failed to read shared snapshot: {e}")
+            return {}
+        finally:
+            self.shm_reader.close()
+
+        data = {}
+        for inst_id, bars in snapshot.items():
+            data[inst_id] = {
+                bar: {"latest_ts": int(columns["ts"][-1]), "columns": columns}
+                for bar, columns in bars.items()
+                if len(columns["ts"])
+            }
+        logger.info(f"Loaded live data for {len(data)} instruments from shared snapshot ({age:.1f}s old)")
+        return data
+
+    def _load_instrument_store(self, inst_id: str) -> Optional[Dict]:
+        """Load individual instrument data from the columnar binary store"""
+        try:
+            data = self.store.read_instrument(inst_id)
+            if not data:
+                logger.warning(f"No stored timeframes for {inst_id}")
+                return None
+            return data
+
+        except Exception as e:
+            logger.error(f"Error loading {inst_id}: {e}")
+            return None
+
     def _load_instrument_data(self, inst_id: str, data_file: str) -> Optional[Dict]:
         """Load and validate individual instrument data"""
         try:
             with open(data_file, "r", encoding="utf-8") as f:
                 data = json.load(f)
 
-            # Validate data structure
+            # Validate data structure and parse the rows once into numeric columns
             if "data" in data and isinstance(data["data"], dict):
-                return data["data"]
+                return {
+                    bar: {
+                        "latest_ts": int(bar_data.get("latest_ts", 0)),
+                        "columns": candles_to_columns(bar_data["candles"]),
+                    }
+                    for bar, bar_data in data["data"].items()
+                    if bar_data.get("candles")
+                }
             else:
                 logger.warning(f"Invalid data structure for {inst_id}")
                 return None
@@ -251,49 +321,27 @@ class ProfessionalMarketAnalyzer:
             return None
 
     def calculate_advanced_technical_indicators(
-        self, candles: List[List]
+        self, columns: Union[Dict[str, np.ndarray], List[List]]
     ) -> Dict[str, float]:
-        """Calculate comprehensive technical indicators with professional methods"""
-        if not candles or len(candles) < 20:
-            return {}
-
-        # Convert to pandas DataFrame for professional analysis
-        df = pd.DataFrame(
-            candles,
-            columns=[
-                "timestamp",
-                "open",
-                "high",
-                "low",
-                "close",
-                "vol",
-                "volCcy",
-                "volCcyQuote",
-                "confirm",
-            ],
-        )
-
-        # Convert to numeric types with validation
-        numeric_columns = [
-            "open",
-            "high",
-            "low",
-            "close",
-            "vol",
-            "volCcy",
-            "volCcyQuote",
-        ]
-        for col in numeric_columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-
-        # Remove any rows with NaN values
-        df = df.dropna()
+        """
+        Calculate comprehensive technical indicators with professional methods
 
-        if len(df) < 20:
+        Args:
+            columns: Chronological numeric candle columns (see okx_store.candles_to_columns);
+                raw OKX candle rows are still accepted and parsed once here
+        """
+        if isinstance(columns, list):
+            columns = candles_to_columns(columns)
+        # Drop rows with unparsable values (NaN after ingest) and keep chronological order
+        columns = prepare_columns(columns)
+        if columns is None:
             return {}
 
-        # Sort by timestamp (newest first in OKX data)
-        df = df.sort_values("timestamp").reset_index(drop=True)
+        # Pandas frame for the analyses that work on named columns
+        df = pd.DataFrame({"timestamp": columns["ts"]})
+        for name in FLOAT_FIELDS:
+            df[name] = columns[name]
+        df["confirm"] = columns["confirm"]
 
         indicators = {}
 
@@ -379,38 +427,16 @@ class ProfessionalMarketAnalyzer:
 
     def _calculate_advanced_rsi(self, prices: np.ndarray) -> Dict[str, float]:
         """Calculate RSI(14) and RSI(7) with Stochastic RSI on RSI(14)"""
-
-        def _compute_rsi(series: np.ndarray, period: int) -> float:
-            if len(series) < period + 1:
-                return float(np.nan)
-            deltas = np.diff(series)
-            seed = deltas[:period]
-            avg_gain = seed[seed > 0].sum() / period
-            avg_loss = -seed[seed < 0].sum() / period
-            rs = (avg_gain / avg_loss) if avg_loss != 0 else np.inf
-            rsi_val = 100 - (100 / (1 + rs))
-            for delta in deltas[period:]:
-                gain = max(delta, 0)
-                loss = -min(delta, 0)
-                avg_gain = (avg_gain * (period - 1) + gain) / period
-                avg_loss = (avg_loss * (period - 1) + loss) / period
-                rs = (avg_gain / avg_loss) if avg_loss != 0 else np.inf
-                rsi_val = 100 - (100 / (1 + rs))
-            return float(rsi_val)
-
         if len(prices) < 14:
             return {}
 
-        rsi_14 = _compute_rsi(prices, 14)
-        rsi_7 = _compute_rsi(prices, 7) if len(prices) >= 7 else float("nan")
+        # RSI(14) of every prefix prices[:i + 1], i >= 14, in one pass
+        rsi_values = self._rsi_series(prices, 14)
+        rsi_7_values = self._rsi_series(prices, 7)
+        rsi_14 = rsi_values[-1] if rsi_values else float("nan")
+        rsi_7 = rsi_7_values[-1] if rsi_7_values else float("nan")
 
         # Stochastic RSI based on RSI(14) series
-        rsi_values = []
-        for i in range(14, len(prices)):
-            window = prices[: i + 1]
-            rsi_window = _compute_rsi(window, 14)
-            rsi_values.append(rsi_window)
-
         if len(rsi_values) >= 14:
             rsi_min = float(np.nanmin(rsi_values[-14:]))
             rsi_max = float(np.nanmax(rsi_values[-14:]))
@@ -431,6 +457,29 @@ class ProfessionalMarketAnalyzer:
             ),
         }
 
+    @staticmethod
+    def _rsi_series(prices: np.ndarray, period: int) -> List[float]:
+        """
+        Streaming Wilder RSI
+
+        Returns:
+            RSI of every prefix prices[:i + 1] for i >= period (empty when too short)
+        """
+        if len(prices) < period + 1:
+            return []
+        deltas = np.diff(prices)
+        seed = deltas[:period]
+        avg_gain = float(seed[seed > 0].sum() / period)
+        avg_loss = float(-seed[seed < 0].sum() / period)
+        rs = (avg_gain / avg_loss) if avg_loss != 0 else math.inf
+        series = [100 - (100 / (1 + rs))]
+        for delta in deltas[period:].tolist():
+            avg_gain = (avg_gain * (period - 1) + max(delta, 0)) / period
+            avg_loss = (avg_loss * (period - 1) - min(delta, 0)) / period
+            rs = (avg_gain / avg_loss) if avg_loss != 0 else math.inf
+            series.append(100 - (100 / (1 + rs)))
+        return series
+
     def _calculate_moving_averages(self, prices: np.ndarray) -> Dict[str, float]:
         """Calculate multiple moving averages with crossover detection"""
         indicators = {}
@@ -462,13 +511,11 @@ class ProfessionalMarketAnalyzer:
         if len(prices) < period:
             return np.mean(prices)
 
-        multiplier = 2 / (period + 1)
-        ema = np.mean(prices[:period])
-
-        for price in prices[period:]:
-            ema = (price - ema) * multiplier + ema
+        return float(self._ema_series(prices, period)[-1])
 
-        return float(ema)
+    def _ema_series(self, prices: np.ndarray, period: int) -> np.ndarray:
+        """EMA of every prefix: element i equals _calculate_ema(prices[:i + 1], period) for i >= period - 1"""
+        return ema_series(np.asarray(prices, dtype=np.float64)[np.newaxis, :], period)[0]
 
     def _calculate_hma(self, prices: np.ndarray, period: int) -> float:
         """Calculate Hull Moving Average for reduced lag"""
@@ -497,30 +544,26 @@ class ProfessionalMarketAnalyzer:
         if len(prices) < 26:
             return {}
 
-        # Calculate MACD line for all periods (as percentage)
-        macd_line = []
-        for i in range(25, len(prices)):
-            window = prices[: i + 1]
-            ema_12 = self._calculate_ema(window, 12)
-            ema_26 = self._calculate_ema(window, 26)
-            # Convert to percentage to normalize across different price levels
-            macd_pct = ((ema_12 - ema_26) / ema_26 * 100) if ema_26 != 0 else 0
-            macd_line.append(macd_pct)
+        # Calculate MACD line for all periods (as percentage) from the full EMA series
+        ema_12 = self._ema_series(prices, 12)[25:]
+        ema_26 = self._ema_series(prices, 26)[25:]
+        # Convert to percentage to normalize across different price levels
+        macd_line = np.where(ema_26 != 0, (ema_12 - ema_26) / ema_26 * 100, 0.0)
 
         # Calculate signal line (9-day EMA of MACD)
         if len(macd_line) >= 9:
-            signal = self._calculate_ema(np.array(macd_line), 9)
+            signal = self._calculate_ema(macd_line, 9)
         else:
-            signal = np.mean(macd_line) if macd_line else 0
+            signal = float(np.mean(macd_line))
 
         # Current MACD values
-        current_macd = macd_line[-1] if macd_line else 0
+        current_macd = float(macd_line[-1])
         histogram = current_macd - signal
 
         # MACD momentum
         macd_momentum = 0
         if len(macd_line) >= 2:
-            macd_momentum = macd_line[-1] - macd_line[-2]
+            macd_momentum = float(macd_line[-1] - macd_line[-2])
 
         return {
             "macd": current_macd,
@@ -1353,6 +1396,7 @@ class ProfessionalMarketAnalyzer:
                 passphrase=self.config.get("OKX", "api_passphrase"),
                 use_server_time=False,
                 flag="0",  # 0: Production
+                domain=rest_url(self.config),
             )
 
             # Get SWAP positions
@@ -1401,16 +1445,36 @@ class ProfessionalMarketAnalyzer:
         # Calculate technical indicators for all instruments
         logger.info("Calculating technical indicators for all instruments...")
 
-        # Parallel indicator calculation
+        batched = set()  # Instruments handled by the batch engine
+        if self.batch_indicators:
+            try:
+                series = {
+                    inst_id: data["5m"]["columns"]
+                    for inst_id, data in self.market_data.items()
+                    if "5m" in data
+                }
+                all_indicators = {
+                    inst_id: indicators
+                    for inst_id, indicators in batch_indicators(series).items()
+                    if indicators
+                }
+                batched = set(series)
+            except Exception as e:
+                logger.warning(f"Batch indicator calculation failed, computing per instrument: {e}")
+                all_indicators = {}
+
+        # Parallel per-instrument indicator calculation (when batching is off or failed)
         with ThreadPoolExecutor(max_workers=10) as executor:
             futures = {}
 
             for inst_id, data in self.market_data.items():
-                if "5m" not in data or not data["5m"].get("candles"):
+                if "5m" not in data or not len(data["5m"]["columns"]["ts"]):
+                    continue
+                if inst_id in batched:
                     continue
 
                 future = executor.submit(
-                    self._process_instrument, inst_id, data["5m"]["candles"]
+                    self._process_instrument, inst_id, data["5m"]["columns"]
                 )
                 futures[future] = inst_id
 
@@ -1427,6 +1491,9 @@ class ProfessionalMarketAnalyzer:
         logger.info("Generating objective market analysis...")
 
         for inst_id, indicators in all_indicators.items():
+            # Multi-day performance from hourly/daily candles (incl. backfilled history)
+            indicators.update(self._calculate_performance(inst_id))
+
             # Create objective market analysis without trading suggestions
             analysis = self.create_market_analysis(inst_id, indicators)
             if analysis:
@@ -1451,34 +1518,27 @@ class ProfessionalMarketAnalyzer:
             if inst_id not in self.market_data or "5m" not in self.market_data[inst_id]:
                 return None
 
-            candles = self.market_data[inst_id]["5m"]["candles"]
-            if not candles:
+            columns = self.market_data[inst_id]["5m"]["columns"]
+            ts = columns["ts"]
+            closes = columns["close"]
+            if not len(ts):
                 return None
 
-            current_price = float(candles[0][4])  # Close price of latest 5m candle
+            current_price = float(closes[-1])  # Close price of latest 5m candle
 
             # Use timestamp proximity matching to calculate 1h and 24h comparison close prices, avoiding misjudgment caused by gaps
             def price_at_offset(
                 target_ms: int, tolerance_ms: int = 2 * 60 * 1000
             ) -> float:
                 """Find close price closest to target_ms in 5m candles; if no samples within tolerance, return close price of the temporally closest one in all samples"""
-                nearest_price = None
-                nearest_diff = None
-                for k in candles:
-                    try:
-                        ts = int(k[0])
-                        close_val = float(k[4])
-                    except Exception:
-                        continue
-                    diff = abs(ts - target_ms)
-                    if diff <= tolerance_ms:
-                        return close_val
-                    if nearest_diff is None or diff < nearest_diff:
-                        nearest_diff = diff
-                        nearest_price = close_val
-                return nearest_price if nearest_price is not None else current_price
-
-            now_ms = int(candles[0][0])
+                diffs = np.abs(ts - target_ms)
+                within = np.nonzero(diffs <= tolerance_ms)[0]
+                # Newest match wins, as when scanning the rows newest first
+                if len(within):
+                    return float(closes[within[-1]])
+                return float(closes[len(diffs) - 1 - np.argmin(diffs[::-1])])
+
+            now_ms = int(ts[-1])
             one_hour_ms = 60 * 60 * 1000
             one_day_ms = 24 * one_hour_ms
 
@@ -1521,27 +1581,18 @@ class ProfessionalMarketAnalyzer:
                 liq_risk = "high"
 
             # Calculate volume from recent candles (24 hours = 288 candles of 5min each)
-            # OKX candle[5] is vol field which is the trading volume in contracts
-            # OKX candle[7] is volCcyQuote field which is the trading volume in quote currency (USDT)
-            # For 24h volume: need 288 candles (288 * 5min = 24 hours)
-            candles_24h = min(288, len(candles))  # Use all available candles up to 288
-
-            # Try to use USDT volume (volCcyQuote) if available, otherwise fall back to contract volume
-            try:
-                # Use volCcyQuote (index 7) for USDT volume
-                recent_volumes = [float(candle[7]) for candle in candles[:candles_24h]]
-                volume_24h = sum(recent_volumes) if recent_volumes else 0
-            except (IndexError, ValueError):
-                # Fall back to contract volume if USDT volume not available
-                recent_volumes = [float(candle[5]) for candle in candles[:candles_24h]]
+            # vol is the trading volume in contracts
+            # volCcyQuote is the trading volume in quote currency (USDT)
+            # For 24h volume: the newest 288 candles (288 * 5min = 24 hours), or all available
+            recent_quote = columns["volCcyQuote"][-288:]
+
+            # Use USDT volume (volCcyQuote) if available, otherwise fall back to contract volume
+            if not np.isnan(recent_quote).any():
+                volume_24h = float(recent_quote.sum())
+            else:
                 # Convert contracts to approximate USDT value
-                inst_info = self.instruments_info.get(inst_id, {})
                 ct_val = float(inst_info.get("ctVal", 1))  # Contract value
-                volume_24h = (
-                    sum(recent_volumes) * ct_val * current_price
-                    if recent_volumes
-                    else 0
-                )
+                volume_24h = float(np.nansum(columns["vol"][-288:])) * ct_val * current_price
 
             return MarketAnalysis(
                 instId=inst_id,
@@ -1621,12 +1672,41 @@ class ProfessionalMarketAnalyzer:
             logger.error(f"Error creating market analysis for {inst_id}: {e}")
             return None
 
+    def _calculate_performance(self, inst_id: str) -> Dict[str, float]:
+        """7d/30d price change from 1H (then 1D) candles merged with okx_sync's deep history"""
+        out: Dict[str, float] = {}
+        for bar in ("1H", "1D"):
+            columns = self.market_data.get(inst_id, {}).get(bar, {}).get("columns")
+            try:
+                history = self.store.read_history(inst_id, bar)
+            except Exception as e:
+                logger.debug(f"Failed to read {bar} history for {inst_id}: {e}")
+                history = None
+            parts = [c for c in (columns, history and history["columns"]) if c is not None and len(c["ts"])]
+            if not parts:
+                continue
+
+            ts = np.concatenate([c["ts"] for c in parts])
+            order = np.argsort(ts, kind="stable")
+            ts_arr = ts[order]
+            close_arr = np.concatenate([c["close"] for c in parts])[order]
+
+            for days in (7, 30):
+                key = f"performance_{days}d"
+                target = ts_arr[-1] - days * 24 * 60 * 60 * 1000
+                if key in out or ts_arr[0] > target:
+                    continue
+                base = close_arr[np.searchsorted(ts_arr, target, side="right") - 1]
+                if base > 0:
+                    out[key] = float((close_arr[-1] - base) / base * 100)
+        return out
+
     def _process_instrument(
-        self, inst_id: str, candles: List[List]
+        self, inst_id: str, columns: Dict[str, np.ndarray]
     ) -> Optional[Dict[str, float]]:
         """Process individual instrument data"""
         try:
-            return self.calculate_advanced_technical_indicators(candles)
+            return self.calculate_advanced_technical_indicators(columns)
         except Exception as e:
             logger.error(f"Error processing {inst_id}: {e}")
             return None
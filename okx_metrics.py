@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+OKX Sync Metrics - Prometheus text endpoint for okx_sync health and lag
+
+Serves GET /metrics on a local port while OKXMarketSync runs, so ingestion
+problems (dead WebSocket, stale timeframes, REST backlog, slow saves) can be
+alerted on before the trading cycle reads stale candles:
+
+    [SYNC]
+    metrics_enabled = true
+    metrics_port = 8791
+
+    curl -s http://127.0.0.1:8791/metrics
+
+Every value is computed from the sync's own counters at scrape time; nothing
+is recorded per candle beyond a few integer increments.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import collections
+from typing import Dict, List, Optional, Tuple
+from aiohttp import web
+from okx_candles import BAR_MS, DAY_MS, bars_since, bucket_start
+
+try:
+    import resource  # Unix only
+except ImportError:
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def freshness_lag_ms(latest_ts: int, bar: str, now_ms: int) -> int:
+    """
+    How long a series has been missing its forming bar
+
+    Args:
+        latest_ts: Open timestamp of the newest stored candle
+        bar: Timeframe of the series
+        now_ms: Current time
+
+    Returns:
+        0 while the newest candle is the forming bar, otherwise the time since
+        the first missing bar opened
+    """
+    if latest_ts >= bucket_start(now_ms, bar):
+        return 0
+    if bar in BAR_MS:
+        next_open = latest_ts + BAR_MS[bar]
+    else:
+        # Calendar month: the bucket after latest_ts
+        next_open = bucket_start(latest_ts + 32 * DAY_MS, bar)
+    return max(0, now_ms - next_open)
+
+
+def rss_bytes() -> int:
+    """Resident set size of this process (peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if peak > 1 << 32 else peak * 1024
+
+
+class _Exposition:
+    """Collects samples grouped by metric name and renders the text format"""
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self._metrics = collections.OrderedDict()  # name -> (type, help, [(labels, value)])
+
+    def add(self, name: str, kind: str, help_text: str, value: float,
+            labels: Optional[Dict[str, str]] = None) -> None:
+        entry = self._metrics.setdefault(f"{self.prefix}_{name}", (kind, help_text, []))
+        entry[2].append((labels or {}, value))
+
+    def render(self) -> str:
+        lines = []
+        for name, (kind, help_text, samples) in self._metrics.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{val}"' for key, val in labels.items())
+                value_text = str(value) if isinstance(value, int) else repr(float(value))
+                lines.append(f"{name}{{{label_text}}} {value_text}" if label_text else f"{name} {value_text}")
+        return "\n".join(lines) + "\n"
+
+
+class SyncMetricsServer:
+    """Local HTTP server exposing OKXMarketSync state as Prometheus metrics"""
+
+    def __init__(self, sync, host: str = "127.0.0.1", port: int = 8791, rate_window: int = 60):
+        self.sync = sync
+        self.host = host
+        self.port = port
+        self.rate_window = rate_window  # Seconds averaged for messages/sec
+        self.started_at = time.time()
+        self._samples = collections.deque(maxlen=rate_window + 1)  # (monotonic, messages)
+        self._sampler = None
+        self._runner = None
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        # Actual port when 0 (ephemeral) was configured
+        self.port = self._runner.addresses[0][1]
+        self._sampler = asyncio.create_task(self._sample_loop())
+        logger.info(f"Sync metrics on http://{self.host}:{self.port}/metrics")
+
+    async def close(self) -> None:
+        if self._sampler:
+            self._sampler.cancel()
+            try:
+                await self._sampler
+            except asyncio.CancelledError:
+                pass
+            self._sampler = None
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _sample_loop(self) -> None:
+        """Sample the message counter once a second for a scrape-independent rate"""
+        while True:
+            self._samples.append((time.monotonic(), self.sync.ws_stats["messages"]))
+            await asyncio.sleep(1)
+
+    def message_rate(self) -> float:
+        """WebSocket messages per second over the last rate_window seconds"""
+        if len(self._samples) < 2:
+            return 0.0
+        (t0, n0), (t1, n1) = self._samples[0], self._samples[-1]
+        return (n1 - n0) / (t1 - t0) if t1 > t0 else 0.0
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(body=self.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    def _series_lags(self, now_ms: int) -> Dict[str, List[Tuple[int, int]]]:
+        """{bar: [(freshness lag ms, bars behind), ...]} over all live series"""
+        sync = self.sync
+        lags = {}
+        for inst_id in list(sync.instruments):
+            for bar, series in sync.market_data.get(inst_id, {}).items():
+                if not len(series):
+                    continue
+                latest_ts = series.latest_ts
+                lags.setdefault(bar, []).append(
+                    (freshness_lag_ms(latest_ts, bar, now_ms), bars_since(latest_ts, bar, now_ms))
+                )
+        return lags
+
+    def render(self) -> str:
+        """Current metrics in the Prometheus text exposition format"""
+        sync = self.sync
+        now = time.time()
+        now_ms = int(now * 1000)
+        out = _Exposition("okx_sync")
+
+        out.add("start_time_seconds", "gauge", "Unix time the sync process started", self.started_at)
+        out.add("instruments", "gauge", "Instruments in the live set", len(sync.instruments))
+
+        # Freshness per timeframe
+        for bar, values in sorted(self._series_lags(now_ms).items(), key=lambda item: BAR_MS.get(item[0], 1 << 62)):
+            lag_s = sorted(lag / 1000 for lag, _ in values)
+            labels = {"bar": bar}
+            out.add("series", "gauge", "Live candle series per timeframe", len(values), labels)
+            out.add("freshness_lag_seconds", "gauge",
+                    "Time since the first missing bar opened (0 = forming bar present)",
+                    lag_s[-1], {"bar": bar, "quantile": "1"})
+            out.add("freshness_lag_seconds", "gauge",
+                    "Time since the first missing bar opened (0 = forming bar present)",
+                    lag_s[len(lag_s) // 2], {"bar": bar, "quantile": "0.5"})
+            out.add("series_behind", "gauge", "Series missing at least one closed bar",
+                    sum(1 for _, behind in values if behind >= 2), labels)
+        for bar, last in sorted(sync.ws_last_message.items()):
+            out.add("ws_last_message_age_seconds", "gauge", "Seconds since the last WebSocket candle update",
+                    max(0.0, now - last), {"bar": bar})
+
+        # WebSocket ingestion
+        ws = sync.ws_stats
+        out.add("ws_shards", "gauge", "Configured WebSocket shards", sync.ws_shards)
+        out.add("ws_active_shards", "gauge", "WebSocket shards in use for the current instrument set",
+                sync.active_ws_shards)
+        out.add("ws_connected_shards", "gauge", "WebSocket shards currently connected", sync.connected_ws_shards)
+        out.add("ws_connects_total", "counter", "WebSocket connections established", ws["connects"])
+        out.add("ws_reconnects_total", "counter", "WebSocket reconnections after a dropped connection",
+                ws["reconnects"])
+        out.add("ws_catchup_series_total", "counter", "Series caught up over REST after a reconnect",
+                ws["catchup_series"])
+        out.add("ws_messages_total", "counter", "WebSocket messages received", ws["messages"])
+        out.add("ws_messages_per_second", "gauge", f"WebSocket messages per second over {self.rate_window}s",
+                self.message_rate())
+        out.add("ws_decode_seconds_total", "counter", "Time spent decoding WebSocket messages",
+                ws["decode_seconds"])
+
+        # REST scheduling and rate limits
+        queue = sync.scheduler.report(reset=False)
+        out.add("rest_queue_depth", "gauge", "REST jobs waiting in the scheduler", queue["depth"])
+        out.add("rest_queue_max_depth", "gauge", "Largest REST queue depth since the last save report",
+                queue["max_depth"])
+        out.add("rest_running", "gauge", "REST jobs in progress", queue["running"])
+        out.add("rest_completed_total", "counter", "REST jobs completed", queue["completed"])
+        out.add("rest_deduplicated_total", "counter", "REST jobs merged into an already queued one",
+                queue["deduplicated"])
+        for quantile, key in (("0.5", "wait_p50_ms"), ("0.95", "wait_p95_ms"), ("1", "wait_max_ms")):
+            out.add("rest_queue_wait_seconds", "gauge", "Queue wait of recently started REST jobs",
+                    queue[key] / 1000, {"quantile": quantile})
+        for path, limiter in sync.rate_limits.items():
+            labels = {"endpoint": path}
+            out.add("rate_limit_allowance", "gauge", "Current requests allowed per period", limiter.limit, labels)
+            out.add("rate_limit_requests_total", "counter", "Requests admitted by the rate limiter",
+                    limiter.stats["acquired"], labels)
+            out.add("rate_limit_waits_total", "counter", "Requests that had to wait for the rate limiter",
+                    limiter.stats["waits"], labels)
+            out.add("rate_limit_wait_seconds_total", "counter", "Time spent waiting for the rate limiter",
+                    limiter.stats["wait_seconds"], labels)
+            out.add("rate_limited_total", "counter", "Rate limit responses from OKX",
+                    limiter.stats["rate_limited"], labels)
+
+        # Saving and the event loop
+        out.add("last_save_timestamp_seconds", "gauge", "Unix time of the last completed checkpoint",
+                sync.last_save_time)
+        for phase in ("snapshot", "write"):
+            out.add("save_duration_seconds", "gauge", "Duration of the last checkpoint by phase",
+                    sync.save_timing[f"{phase}_ms"] / 1000, {"phase": phase})
+        out.add("save_files_written_total", "counter", "Snapshot files written", sync.save_totals["files_written"])
+        out.add("save_files_skipped_total", "counter", "Unchanged series skipped by checkpoints",
+                sync.save_totals["files_skipped"])
+        out.add("save_files_failed", "gauge", "Files that failed to save in the last checkpoint",
+                sync.save_stats["files_failed"])
+        out.add("loop_stall_max_seconds", "gauge", "Worst event-loop stall since the last save report",
+                sync.loop_stall_ms / 1000)
+        if sync.fanout:
+            out.add("fanout_published_total", "counter", "Events published to fan-out subscribers",
+                    sync.fanout.stats["published"])
+            out.add("fanout_dropped_subscribers_total", "counter", "Slow fan-out subscribers disconnected",
+                    sync.fanout.stats["dropped_subscribers"])
+
+        # Memory
+        out.add("resident_memory_bytes", "gauge", "Resident set size of the sync process", rss_bytes())
+        out.add("candle_buffer_bytes", "gauge", "Memory held by in-memory candle buffers",
+                sum(series.nbytes for inst_data in list(sync.market_data.values()) for series in inst_data.values()))
+        return out.render()
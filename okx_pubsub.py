@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+OKX Candle Fan-out - Local pub/sub of live candle updates from okx_sync
+
+OKXMarketSync keeps the only exchange connection and re-publishes every candle
+update to local subscribers over TCP on localhost or a Unix domain socket, so
+the analyzer, dashboards and risk checks do not each open their own.
+
+The protocol is newline-delimited JSON. A subscriber may send a filter line at
+any time (every field optional, missing means "all"):
+
+    {"op": "subscribe", "instIds": ["BTC-USDT-SWAP"], "bars": ["5m"], "events": ["closed"]}
+
+and receives events:
+
+    {"event": "candle", "instId": "...", "bar": "5m", "data": [ts, o, h, l, c, vol, volCcy, volCcyQuote, "0"]}
+    {"event": "closed", "instId": "...", "bar": "5m", "data": [..., "1"]}
+
+"closed" is sent once when a bar becomes confirmed. Each subscriber has a
+bounded queue; a subscriber that falls that far behind is disconnected rather
+than slowing down ingestion (reconnect and re-read the snapshot to resync).
+"""
+
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Subscriber:
+    def __init__(self, writer: asyncio.StreamWriter, queue_size: int):
+        self.writer = writer
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.inst_ids = None
+        self.bars = None
+        self.events = None
+        self.sender = None
+
+    def wants(self, event: str, inst_id: str, bar: str) -> bool:
+        return (
+            (self.events is None or event in self.events)
+            and (self.bars is None or bar in self.bars)
+            and (self.inst_ids is None or inst_id in self.inst_ids)
+        )
+
+    def set_filter(self, request: Dict) -> None:
+        def _as_set(key):
+            values = request.get(key)
+            return set(values) if values else None
+
+        self.inst_ids = _as_set("instIds")
+        self.bars = _as_set("bars")
+        self.events = _as_set("events")
+
+
+class CandleFanout:
+    """Local fan-out server for candle and bar-closed events"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8790,
+                 unix_path: Optional[str] = None, queue_size: int = 10000):
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self.queue_size = queue_size
+        self._server = None
+        self._subscribers = set()
+        self.stats = {"published": 0, "dropped_subscribers": 0}
+
+    @property
+    def active(self) -> bool:
+        """True while at least one subscriber is connected"""
+        return bool(self._subscribers)
+
+    async def start(self) -> None:
+        if self.unix_path:
+            self._server = await asyncio.start_unix_server(self._handle, path=self.unix_path)
+            logger.info(f"Candle fan-out listening on {self.unix_path}")
+        else:
+            self._server = await asyncio.start_server(self._handle, self.host, self.port)
+            self.port = self._server.sockets[0].getsockname()[1]
+            logger.info(f"Candle fan-out listening on {self.host}:{self.port}")
+
+    async def close(self) -> None:
+        if self._server is None:
+            return
+        self._server.close()
+        for subscriber in list(self._subscribers):
+            self._drop(subscriber)
+        await self._server.wait_closed()
+        self._server = None
+
+    def publish(self, event: str, inst_id: str, bar: str, row: List) -> None:
+        """Queue an event for every matching subscriber (never blocks)"""
+        if not self._subscribers:
+            return
+        line = None
+        for subscriber in list(self._subscribers):
+            if not subscriber.wants(event, inst_id, bar):
+                continue
+            if line is None:
+                # Encode once for all subscribers
+                line = (json.dumps(
+                    {"event": event, "instId": inst_id, "bar": bar, "data": row},
+                    separators=(",", ":"),
+                ) + "\n").encode()
+            try:
+                subscriber.queue.put_nowait(line)
+            except asyncio.QueueFull:
+                logger.warning(f"Dropping slow fan-out subscriber ({self.queue_size} events behind)")
+                self.stats["dropped_subscribers"] += 1
+                self._drop(subscriber)
+        if line is not None:
+            self.stats["published"] += 1
+
+    def _drop(self, subscriber: _Subscriber) -> None:
+        self._subscribers.discard(subscriber)
+        if subscriber.sender:
+            subscriber.sender.cancel()
+        subscriber.writer.close()
+
+    async def _send(self, subscriber: _Subscriber) -> None:
+        try:
+            while True:
+                line = await subscriber.queue.get()
+                subscriber.writer.write(line)
+                await subscriber.writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self._drop(subscriber)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        subscriber = _Subscriber(writer, self.queue_size)
+        self._subscribers.add(subscriber)
+        subscriber.sender = asyncio.create_task(self._send(subscriber))
+        logger.info(f"Fan-out subscriber connected ({len(self._subscribers)} total)")
+        try:
+            while subscriber in self._subscribers:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(request, dict) and request.get("op") == "subscribe":
+                    subscriber.set_filter(request)
+        except ConnectionError:
+            pass
+        finally:
+            self._drop(subscriber)
+            logger.info(f"Fan-out subscriber disconnected ({len(self._subscribers)} total)")
+
+
+async def subscribe(host: str = "127.0.0.1", port: int = 8790, unix_path: Optional[str] = None,
+                    inst_ids: Optional[List[str]] = None, bars: Optional[List[str]] = None,
+                    events: Optional[List[str]] = None) -> AsyncIterator[Dict]:
+    """
+    Connect to a CandleFanout and yield its events
+
+    Args:
+        inst_ids/bars/events: Optional filters (None receives everything)
+
+    Yields:
+        Event dicts with keys event, instId, bar, data
+    """
+    if unix_path:
+        reader, writer = await asyncio.open_unix_connection(unix_path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    try:
+        request = {"op": "subscribe", "instIds": inst_ids, "bars": bars, "events": events}
+        writer.write((json.dumps(request) + "\n").encode())
+        await writer.drain()
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            yield json.loads(line)
+    finally:
+        writer.close()
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+OKX WebSocket Record & Replay - Offline benchmark for the okx_sync ingest path
+
+Record raw candle frames from the live OKX WebSocket, then replay them to
+OKXMarketSync.websocket_loop from a local server at 1x, Nx or maximum speed
+and report throughput, latency, event-loop stalls, checkpoint time and memory.
+
+    python okx_replay.py record capture.jsonl.gz --duration 600
+    python okx_replay.py replay capture.jsonl.gz --speed 10
+    python okx_replay.py replay capture.jsonl.gz --speed 0     # as fast as possible
+
+Capture format: gzip-compressed JSON lines. The first line is a header
+({"format": "okx-ws-capture", ...}); every following line is
+[seconds since recording start, raw frame text].
+"""
+
+import asyncio
+import collections
+import gzip
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+import websockets
+from typing import Dict, List, Optional, Tuple
+from okx_store import CandleStore, CandleWAL
+from okx_sync import OKXMarketSync
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_FORMAT = "okx-ws-capture"
+
+
+async def record_stream(output: str, duration: float, limit: Optional[int] = None,
+                        config_path: str = "config.ini") -> int:
+    """
+    Record raw WebSocket frames for all synced instruments
+
+    Args:
+        output: Capture file path (gzip)
+        duration: Seconds to record
+        limit: Only record the first N instruments
+
+    Returns:
+        Number of frames written
+    """
+    sync = OKXMarketSync(config_path)
+    instruments = await sync.get_instruments()
+    if limit:
+        instruments = instruments[:limit]
+    shards = sync.ws_shard_channels(instruments)
+    started = time.monotonic()
+    deadline = started + duration
+    count = 0
+
+    with gzip.open(output, "wt", encoding="utf-8") as f:
+        f.write(json.dumps({
+            "format": CAPTURE_FORMAT,
+            "version": 1,
+            "ws_url": sync.ws_url,
+            "started_ms": int(time.time() * 1000),
+            "instruments": instruments,
+        }) + "\n")
+
+        async def record_shard(channels, start_delay):
+            nonlocal count
+            await asyncio.sleep(start_delay)
+            async with websockets.connect(sync.ws_url) as ws:
+                for i in range(0, len(channels), sync.ws_subscribe_batch):
+                    await ws.send(json.dumps({"op": "subscribe", "args": channels[i:i + sync.ws_subscribe_batch]}))
+                heartbeat = asyncio.create_task(sync.heartbeat_loop(ws))
+                try:
+                    while True:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return
+                        try:
+                            message = await asyncio.wait_for(ws.recv(), timeout=remaining)
+                        except asyncio.TimeoutError:
+                            return
+                        if message == "pong":
+                            continue
+                        f.write(json.dumps([round(time.monotonic() - started, 6), message]) + "\n")
+                        count += 1
+                finally:
+                    heartbeat.cancel()
+
+        await asyncio.gather(*[
+            record_shard(channels, n * sync.ws_connect_stagger)
+            for n, (_, channels) in enumerate(sorted(shards.items()))
+        ])
+    logger.info(f"Recorded {count} frames from {len(instruments)} instruments to {output}")
+    return count
+
+
+def load_capture(path: str) -> Tuple[Dict, List[Tuple[float, str, Tuple[str, str]]]]:
+    """
+    Read a capture file
+
+    Returns:
+        (header, [(offset seconds, raw frame, (channel, instId))]) for candle data frames
+    """
+    frames = []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("format") != CAPTURE_FORMAT:
+            raise ValueError(f"{path} is not an OKX WebSocket capture")
+        for line in f:
+            offset, message = json.loads(line)
+            try:
+                data = json.loads(message)
+            except ValueError:
+                continue
+            arg = data.get("arg") if isinstance(data, dict) else None
+            if not arg or "data" not in data:
+                continue  # Subscription acks and errors
+            frames.append((offset, message, (arg.get("channel"), arg.get("instId"))))
+    frames.sort(key=lambda frame: frame[0])
+    return header, frames
+
+
+class ReplayServer:
+    """Local WebSocket server that plays a capture back to subscribed clients"""
+
+    def __init__(self, frames, speed: float = 1.0, host: str = "127.0.0.1", port: int = 0):
+        self.frames = frames
+        self.speed = speed  # 0 = as fast as possible
+        self.host = host
+        self.port = port
+        self.channels = {key for _, _, key in frames}
+        self.sent = 0
+        self.sent_times = [None] * len(frames)  # time.monotonic() each frame was sent
+        self._routes = {}  # (channel, instId) -> connection
+        self._ready = asyncio.Event()
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        self._server = await websockets.serve(self._handle, self.host, self.port)
+        self.port = next(iter(self._server.sockets)).getsockname()[1]
+
+    async def close(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, ws) -> None:
+        try:
+            async for message in ws:
+                if message == "ping":
+                    await ws.send("pong")
+                    continue
+                try:
+                    request = json.loads(message)
+                except ValueError:
+                    continue
+                if request.get("op") != "subscribe":
+                    continue
+                for arg in request.get("args", []):
+                    self._routes[(arg.get("channel"), arg.get("instId"))] = ws
+                    await ws.send(json.dumps({"event": "subscribe", "arg": arg}))
+                if self.channels.issubset(self._routes):
+                    self._ready.set()
+        except websockets.ConnectionClosed:
+            pass
+
+    async def play(self, start_timeout: float = 30.0, settle: float = 1.5) -> None:
+        """
+        Wait for the client to subscribe to every recorded channel, then send all frames
+
+        settle covers the pause okx_sync takes after its last subscribe batch
+        before it starts reading, which would otherwise show up as latency.
+
+        Send times are recorded in sent_times (time.monotonic(), comparable across processes).
+        """
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout=start_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Only {len(self.channels & set(self._routes))}/{len(self.channels)} "
+                           f"recorded channels subscribed, replaying anyway")
+        await asyncio.sleep(settle)
+        started = time.monotonic()
+        first_offset = self.frames[0][0] if self.frames else 0.0
+        for i, (offset, message, key) in enumerate(self.frames):
+            if self.speed > 0:
+                delay = started + (offset - first_offset) / self.speed - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            ws = self._routes.get(key)
+            if ws is None:
+                continue
+            try:
+                await ws.send(message)
+            except websockets.ConnectionClosed:
+                continue
+            self.sent_times[i] = time.monotonic()
+            self.sent += 1
+
+
+def _serve_capture(path: str, speed: float, conn) -> None:
+    """Replay server process: reports its port, then (sent count, send times) when done"""
+    async def run():
+        _, frames = load_capture(path)
+        server = ReplayServer(frames, speed)
+        await server.start()
+        conn.send(server.port)
+        await server.play()
+        conn.send((server.sent, server.sent_times))
+        # Keep the connections open until the parent stops this process
+        await asyncio.Event().wait()
+
+    asyncio.run(run())
+
+
+def _max_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KB on Linux, bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+async def replay_capture(path: str, speed: float = 1.0, shards: Optional[int] = None,
+                         config_path: str = "config.ini") -> Dict[str, float]:
+    """
+    Replay a capture into a fresh OKXMarketSync and measure the ingest path
+
+    The sync writes to a temporary data directory; the shared snapshot and
+    fan-out server are disabled so a running deployment is not disturbed.
+
+    Returns:
+        Report metrics (also logged)
+    """
+    _, frames = load_capture(path)
+    if not frames:
+        raise ValueError(f"{path} contains no candle frames")
+    instruments = sorted({key[1] for _, _, key in frames})
+
+    # The server runs in its own process so it does not compete with the sync for the event loop
+    loop = asyncio.get_running_loop()
+    parent_conn, child_conn = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=_serve_capture, args=(path, speed, child_conn), daemon=True)
+    server.start()
+    port = await loop.run_in_executor(None, parent_conn.recv)
+
+    data_dir = tempfile.mkdtemp(prefix="okx_replay_")
+    sync = OKXMarketSync(config_path)
+    sync.ws_url = f"ws://127.0.0.1:{port}"
+    sync.data_dir = data_dir
+    sync.summary_file = os.path.join(data_dir, "summary.json")
+    sync.store = CandleStore(data_dir, sync.store.codec, sync.store.level)
+    sync.wal = CandleWAL(data_dir) if sync.wal_enabled else None
+    sync.shm = None
+    sync.fanout = None
+    if shards:
+        sync.ws_shards = shards
+    if sync.wal:
+        sync.wal.open()
+
+    # Frame indices per raw text, so processed frames can be matched to their send time
+    pending = collections.defaultdict(collections.deque)
+    for i, (_, message, _) in enumerate(frames):
+        pending[message].append(i)
+    processed_times = [None] * len(frames)
+    processed = 0
+    process_messages = sync.process_messages
+
+    def timed_process(messages):
+        nonlocal processed
+        process_messages(messages)
+        now = time.monotonic()
+        for message in messages:
+            indices = pending.get(message)
+            if indices:
+                processed_times[indices.popleft()] = now
+                processed += 1
+
+    sync.process_messages = timed_process
+    ws_task = asyncio.create_task(sync.websocket_loop(instruments))
+    monitor_task = asyncio.create_task(sync.loop_monitor())
+    try:
+        sent, sent_times = await loop.run_in_executor(None, parent_conn.recv)
+        # Let the client drain what is still in flight
+        deadline = time.monotonic() + 30
+        while processed < sent and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+        save_started = time.perf_counter()
+        await sync.checkpoint_async()
+        save_ms = (time.perf_counter() - save_started) * 1000
+    finally:
+        for task in (ws_task, monitor_task):
+            task.cancel()
+        await asyncio.gather(ws_task, monitor_task, return_exceptions=True)
+        server.terminate()
+        server.join()
+        sync.close()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    latencies = [done - start for start, done in zip(sent_times, processed_times)
+                 if start is not None and done is not None]
+    first_sent = min((t for t in sent_times if t is not None), default=0.0)
+    last_done = max((t for t in processed_times if t is not None), default=first_sent)
+    elapsed = max(last_done - first_sent, 1e-9)
+    lat_ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    report = {
+        "frames": len(frames),
+        "sent": sent,
+        "processed": processed,
+        "seconds": elapsed,
+        "messages_per_sec": processed / elapsed,
+        "latency_p50_ms": float(np.percentile(lat_ms, 50)),
+        "latency_p90_ms": float(np.percentile(lat_ms, 90)),
+        "latency_p99_ms": float(np.percentile(lat_ms, 99)),
+        "latency_max_ms": float(lat_ms.max()),
+        "max_loop_stall_ms": sync.loop_stall_ms,
+        "checkpoint_ms": save_ms,
+        "series": sum(len(bars) for bars in sync.market_data.values()),
+        "max_rss_mb": _max_rss_mb(),
+    }
+    speed_label = "max" if speed <= 0 else f"{speed:g}x"
+    logger.info(
+        f"Replay {os.path.basename(path)} at {speed_label}: {processed}/{report['sent']} messages "
+        f"in {elapsed:.2f}s ({report['messages_per_sec']:.0f} msg/s), latency p50 "
+        f"{report['latency_p50_ms']:.2f}ms / p90 {report['latency_p90_ms']:.2f}ms / "
+        f"p99 {report['latency_p99_ms']:.2f}ms / max {report['latency_max_ms']:.2f}ms, "
+        f"max loop stall {report['max_loop_stall_ms']:.1f}ms, checkpoint {save_ms:.0f}ms, "
+        f"{report['series']} series, max RSS "
+        + (f"{report['max_rss_mb']:.0f}MB" if report["max_rss_mb"] is not None else "n/a")
+    )
+    return report
+
+
+def main():
+    """Command line entry point"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Record and replay the OKX candle WebSocket stream")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    rec = sub.add_parser("record", help="Record live frames to a capture file")
+    rec.add_argument("output", help="Capture file (gzip JSON lines)")
+    rec.add_argument("--duration", type=float, default=300, help="Seconds to record")
+    rec.add_argument("--instruments", type=int, default=None, help="Only record the first N instruments")
+
+    rep = sub.add_parser("replay", help="Replay a capture into OKXMarketSync and report")
+    rep.add_argument("capture", help="Capture file written by the record command")
+    rep.add_argument("--speed", type=float, default=1.0, help="Playback speed multiplier, 0 = as fast as possible")
+    rep.add_argument("--shards", type=int, default=None, help="Override [SYNC] ws_shards")
+    rep.add_argument("--json", action="store_true", help="Print the report as JSON")
+
+    args = parser.parse_args()
+    if args.command == "record":
+        asyncio.run(record_stream(args.output, args.duration, args.instruments))
+    else:
+        report = asyncio.run(replay_capture(args.capture, args.speed, args.shards))
+        if args.json:
+            print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+OKX Shared Snapshot - Live candle buffers shared between okx_sync and okx_market
+
+okx_sync.py publishes its in-memory candle series into one memory-mapped file
+(on /dev/shm when available, so it never touches disk). okx_market.py attaches
+to it and copies the series out under the seqlock, so the analyzer sees data
+that is at most one publish interval old without parsing any files.
+
+Layout (little-endian):
+
+    header   magic "OLSM" | version u16 | flags u16 | seq u64 | series count u32
+             | series slots u32 | publish time ms i64 | data offset u64
+    index    one INDEX_DTYPE record per series slot
+    data     per series: ts int64[capacity] | values float64[capacity, 7]
+             | confirm uint8[capacity] (padded to 8 bytes)
+
+The writer makes seq odd while it updates the mapping and even again when it
+is done (a seqlock); readers retry when seq was odd or changed under them.
+When the writer needs a bigger mapping it replaces the file and sets
+FLAG_STALE in the old one so readers re-attach.
+"""
+
+import os
+import mmap
+import time
+import struct
+import logging
+import numpy as np
+from typing import Dict, Optional, Tuple
+from okx_store import FLOAT_FIELDS
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"OLSM"
+VERSION = 1
+HEADER = struct.Struct("<4sHHQIIqQ")
+HEADER_SIZE = 64
+SEQ_OFFSET = 8
+FLAG_STALE = 1
+
+INDEX_DTYPE = np.dtype([
+    ("inst", "S32"),
+    ("bar", "S8"),
+    ("offset", "<u8"),
+    ("capacity", "<u4"),
+    ("rows", "<u4"),
+    ("latest_ts", "<i8"),
+])
+
+NCOLS = len(FLOAT_FIELDS)
+
+
+def default_shm_path() -> str:
+    """Memory-backed location for the snapshot file (falls back to the data directory)"""
+    if os.path.isdir("/dev/shm"):
+        return "/dev/shm/openlucky_candles"
+    return os.path.join("data", "live.shm")
+
+
+def _region_size(capacity: int) -> int:
+    return capacity * 8 + capacity * NCOLS * 8 + (capacity + 7) // 8 * 8
+
+
+def _region_views(buf, offset: int, capacity: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    ts = np.frombuffer(buf, dtype="<i8", count=capacity, offset=offset)
+    offset += capacity * 8
+    values = np.frombuffer(buf, dtype="<f8", count=capacity * NCOLS, offset=offset).reshape(capacity, NCOLS)
+    offset += capacity * NCOLS * 8
+    confirm = np.frombuffer(buf, dtype=np.uint8, count=capacity, offset=offset)
+    return ts, values, confirm
+
+
+def _columns(ts: np.ndarray, values: np.ndarray, confirm: np.ndarray) -> Dict[str, np.ndarray]:
+    columns = {"ts": ts}
+    for idx, name in enumerate(FLOAT_FIELDS):
+        columns[name] = values[:, idx]
+    columns["confirm"] = confirm
+    return columns
+
+
+def _close_mapping(mm: mmap.mmap) -> None:
+    try:
+        mm.close()
+    except BufferError:
+        # NumPy views of the mapping are still alive; unmapped once they are released
+        pass
+
+
+class SharedSnapshotWriter:
+    """Publishes CandleRing series into the shared snapshot (single writer)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._mm = None
+        self._index = None
+        self._slots = {}  # (instId, bar) -> slot number
+        self._max_series = 0
+        self._next_offset = 0
+        self._seq = 0
+
+    def _create(self, specs) -> None:
+        """Create a new mapping sized for specs [((instId, bar), capacity)] plus headroom"""
+        max_series = int(len(specs) * 1.25) + 64
+        largest = max([cap for _, cap in specs], default=0)
+        data_offset = HEADER_SIZE + max_series * INDEX_DTYPE.itemsize
+        data_size = sum(_region_size(cap) for _, cap in specs)
+        size = data_offset + data_size + data_size // 4 + 64 * _region_size(largest)
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.truncate(size)
+        new_file = open(temp_path, "r+b")
+        new_mm = mmap.mmap(new_file.fileno(), size)
+        HEADER.pack_into(new_mm, 0, MAGIC, VERSION, 0, self._seq, 0, max_series, 0, data_offset)
+        os.replace(temp_path, self.path)
+
+        # Tell readers of the previous mapping to re-attach
+        self.close(stale=True)
+        self._file, self._mm = new_file, new_mm
+        self._index = np.frombuffer(new_mm, dtype=INDEX_DTYPE, count=max_series, offset=HEADER_SIZE)
+        self._slots = {}
+        self._max_series = max_series
+        self._next_offset = data_offset
+
+    def _allocate(self, key, capacity: int) -> bool:
+        if len(self._slots) >= self._max_series or self._next_offset + _region_size(capacity) > len(self._mm):
+            return False
+        slot = len(self._slots)
+        record = self._index[slot]
+        record["inst"] = key[0].encode()
+        record["bar"] = key[1].encode()
+        record["offset"] = self._next_offset
+        record["capacity"] = capacity
+        record["rows"] = 0
+        record["latest_ts"] = 0
+        self._slots[key] = slot
+        self._next_offset += _region_size(capacity)
+        return True
+
+    def _set_seq(self, seq: int) -> None:
+        self._seq = seq
+        struct.pack_into("<Q", self._mm, SEQ_OFFSET, seq)
+
+    def publish(self, market_data, dirty=None) -> int:
+        """
+        Copy series into the mapping
+
+        Args:
+            market_data: {instId: {bar: CandleRing}}
+            dirty: (instId, bar) pairs changed since the last publish, None for all
+
+        Returns:
+            Number of series written
+        """
+        series = {
+            (inst_id, bar): ring
+            for inst_id, inst_data in market_data.items()
+            for bar, ring in inst_data.items()
+        }
+        if self._mm is None:
+            self._create([(key, ring.capacity) for key, ring in series.items()])
+            dirty = None
+        new_keys = [key for key in series if key not in self._slots]
+        keys = list(series) if dirty is None else [key for key in dirty if key in series]
+
+        self._set_seq(self._seq + 1)  # Odd: update in progress
+        try:
+            for key in new_keys:
+                if not self._allocate(key, series[key].capacity):
+                    # Out of room: move everything into a bigger mapping (created with the odd seq)
+                    self._create([(k, ring.capacity) for k, ring in series.items()])
+                    for k in series:
+                        self._allocate(k, series[k].capacity)
+                    keys = list(series)
+                    break
+            else:
+                keys = list(dict.fromkeys(keys + new_keys))
+
+            for key in keys:
+                ring = series[key]
+                record = self._index[self._slots[key]]
+                capacity = int(record["capacity"])
+                ts, values, confirm = _region_views(self._mm, int(record["offset"]), capacity)
+                rows = min(len(ring), capacity)
+                skip = len(ring) - rows
+                ts[:rows] = ring.timestamps()[skip:]
+                values[:rows] = ring.values()[skip:]
+                confirm[:rows] = ring.confirm()[skip:]
+                record["rows"] = rows
+                record["latest_ts"] = ring.latest_ts
+
+            struct.pack_into("<I", self._mm, 16, len(self._slots))
+            struct.pack_into("<q", self._mm, 24, int(time.time() * 1000))
+        finally:
+            self._set_seq(self._seq + 1)  # Even: consistent
+        return len(keys)
+
+    def close(self, stale: bool = False) -> None:
+        if self._mm is None:
+            return
+        if stale:
+            struct.pack_into("<H", self._mm, 6, FLAG_STALE)
+        self._index = None
+        _close_mapping(self._mm)
+        self._file.close()
+        self._mm = self._file = None
+
+
+class SharedSnapshotReader:
+    """Attach to the shared snapshot and read series as NumPy arrays"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._mm = None
+
+    def attach(self) -> bool:
+        """Map the snapshot file; returns False when no sync process has published one"""
+        self.close()
+        try:
+            self._file = open(self.path, "rb")
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self.close()
+            return False
+        if len(self._mm) < HEADER_SIZE or HEADER.unpack_from(self._mm, 0)[0] != MAGIC:
+            self.close()
+            return False
+        return True
+
+    def _header(self):
+        _, _, flags, seq, n_series, _, publish_ms, _ = HEADER.unpack_from(self._mm, 0)
+        return flags, seq, n_series, publish_ms
+
+    @property
+    def publish_ms(self) -> int:
+        """Wall-clock time (ms) of the last publish, 0 when not attached"""
+        if self._mm is None:
+            return 0
+        return self._header()[3]
+
+    def _ensure_attached(self) -> bool:
+        if self._mm is None or self._header()[0] & FLAG_STALE:
+            return self.attach()
+        return True
+
+    def read(self, retries: int = 100) -> Optional[Dict[str, Dict[str, Dict[str, np.ndarray]]]]:
+        """
+        Consistent copy of every series
+
+        Returns:
+            {instId: {bar: chronological columns}}, or None when unavailable
+        """
+        for _ in range(retries):
+            if not self._ensure_attached():
+                return None
+            flags, seq, n_series, _ = self._header()
+            if seq & 1 or flags & FLAG_STALE:
+                time.sleep(0.001)
+                continue
+            index = np.frombuffer(self._mm, dtype=INDEX_DTYPE, count=n_series, offset=HEADER_SIZE).copy()
+            out = {}
+            for record in index:
+                rows = int(record["rows"])
+                ts, values, confirm = _region_views(self._mm, int(record["offset"]), int(record["capacity"]))
+                out.setdefault(record["inst"].decode(), {})[record["bar"].decode()] = _columns(
+                    ts[:rows].copy(), values[:rows].copy(), confirm[:rows].copy()
+                )
+            if self._header()[1] == seq:
+                return out
+        logger.warning("Shared snapshot kept changing while reading; giving up")
+        return None
+
+    def close(self) -> None:
+        if self._mm is not None:
+            _close_mapping(self._mm)
+        if self._file is not None:
+            self._file.close()
+        self._mm = self._file = None
@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+"""
+OKX Candle Store - Columnar binary storage for synchronized candlestick data
+
+okx_sync.py writes one file per instrument/timeframe and okx_market.py reads
+them back without any text parsing. Each file is a small fixed header followed
+by one contiguous column per candle field (oldest candle first):
+
+    header   magic "OLKC" | version u16 | column count u16 | row count u32
+             | bar (8 bytes, NUL padded) | latest_ts i64
+    columns  ts int64[rows]
+             open/high/low/close/vol/volCcy/volCcyQuote float64[rows]
+             confirm uint8[rows]
+
+All values are little-endian. Files live under data/candles/<instId>/<bar>.olc
+(live window) and data/history/<instId>/<bar>.olc (deep backfilled history).
+
+Files may instead hold that layout compressed as a standard zstd, lz4 frame or
+zlib stream ([SYNC] store_codec). Readers detect the codec from the first bytes
+of each file, so stores with mixed codecs read fine.
+
+Between snapshots, WebSocket updates are appended to a line-delimited
+write-ahead log (data/wal/<seq>.wal) so a crash loses at most the OS buffer.
+"""
+
+import os
+import json
+import zlib
+import struct
+import shutil
+import logging
+import numpy as np
+from typing import Dict, List, Optional, Any, Iterator, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"OLKC"
+VERSION = 1
+HEADER = struct.Struct("<4sHHI8sq")
+FILE_SUFFIX = ".olc"
+WAL_SUFFIX = ".wal"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+LZ4_MAGIC = b"\x04\x22\x4d\x18"
+
+# OKX candle field order: [ts, o, h, l, c, vol, volCcy, volCcyQuote, confirm]
+FLOAT_FIELDS = ("open", "high", "low", "close", "vol", "volCcy", "volCcyQuote")
+CANDLE_FIELDS = ("ts",) + FLOAT_FIELDS + ("confirm",)
+
+
+def _float_column(values: List[Any]) -> np.ndarray:
+    """Convert a list of OKX numeric strings to float64, unparseable entries become NaN"""
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        out = np.empty(len(values), dtype=np.float64)
+        for i, v in enumerate(values):
+            try:
+                out[i] = float(v)
+            except (TypeError, ValueError):
+                out[i] = np.nan
+        return out
+
+
+def candles_to_columns(candles: List[List]) -> Dict[str, np.ndarray]:
+    """
+    Convert OKX candle rows (newest first) into chronological numeric columns
+
+    Args:
+        candles: Candle rows as returned by the OKX REST/WebSocket APIs
+
+    Returns:
+        Dict mapping every name in CANDLE_FIELDS to a NumPy array
+    """
+    rows = candles[::-1]
+    columns = {"ts": np.array([int(c[0]) for c in rows], dtype=np.int64)}
+    for idx, name in enumerate(FLOAT_FIELDS, start=1):
+        columns[name] = _float_column([c[idx] if len(c) > idx else np.nan for c in rows])
+    columns["confirm"] = np.array(
+        [1 if len(c) > 8 and str(c[8]) == "1" else 0 for c in rows], dtype=np.uint8
+    )
+    return columns
+
+
+def _okx_number(value: float) -> str:
+    """Format a float the way OKX sends numbers ("43250.1", "12", "" for missing)"""
+    if value != value:
+        return ""
+    text = repr(value)
+    if "e" in text:
+        # Shortest round-trip digits without an exponent ("0.00001234")
+        return np.format_float_positional(value, trim="-")
+    return text[:-2] if text.endswith(".0") else text
+
+
+def columns_to_candles(columns: Dict[str, np.ndarray], as_strings: bool = False) -> List[List]:
+    """
+    Convert chronological columns back into OKX-style candle rows (newest first)
+
+    Args:
+        columns: Chronological numeric columns
+        as_strings: Format every field as a string, exactly like OKX API rows
+    """
+    ts = columns["ts"][::-1].tolist()
+    values = [columns[name][::-1].tolist() for name in FLOAT_FIELDS]
+    if as_strings:
+        ts = [str(t) for t in ts]
+        values = [[_okx_number(v) for v in column] for column in values]
+    confirm = ["1" if c else "0" for c in columns["confirm"][::-1].tolist()]
+    return [list(row) for row in zip(ts, *values, confirm)]
+
+
+def merge_columns(*parts: Optional[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """
+    Union of chronological column sets by timestamp
+
+    Later parts win on duplicate timestamps; the result is sorted oldest first.
+    """
+    parts = [p for p in parts if p is not None and len(p["ts"])]
+    if not parts:
+        return {name: np.empty(0, dtype=np.uint8 if name == "confirm" else
+                               np.int64 if name == "ts" else np.float64)
+                for name in CANDLE_FIELDS}
+    merged = {name: np.concatenate([p[name] for p in parts]) for name in CANDLE_FIELDS}
+    # Keep the last occurrence of each timestamp
+    reversed_ts = merged["ts"][::-1]
+    _, first_idx = np.unique(reversed_ts, return_index=True)
+    keep = len(reversed_ts) - 1 - first_idx
+    return {name: values[keep] for name, values in merged.items()}
+
+
+def encode_columns(bar: str, columns: Dict[str, np.ndarray]) -> bytes:
+    """Serialize columns into the binary file layout"""
+    ts = np.ascontiguousarray(columns["ts"], dtype="<i8")
+    rows = len(ts)
+    latest_ts = int(ts.max()) if rows else 0
+    parts = [
+        HEADER.pack(
+            MAGIC, VERSION, len(CANDLE_FIELDS), rows, bar.encode("ascii")[:8], latest_ts
+        ),
+        ts.tobytes(),
+    ]
+    for name in FLOAT_FIELDS:
+        parts.append(np.ascontiguousarray(columns[name], dtype="<f8").tobytes())
+    parts.append(np.ascontiguousarray(columns["confirm"], dtype=np.uint8).tobytes())
+    return b"".join(parts)
+
+
+def decode_columns(buf: bytes) -> Dict[str, Any]:
+    """
+    Parse a binary candle file
+
+    Args:
+        buf: Raw file contents
+
+    Returns:
+        Dict with "bar", "latest_ts" and "columns" (NumPy arrays backed by buf)
+    """
+    if len(buf) < HEADER.size:
+        raise ValueError("Truncated candle file header")
+    magic, version, ncols, rows, bar, latest_ts = HEADER.unpack_from(buf, 0)
+    if magic != MAGIC:
+        raise ValueError(f"Not a candle store file (magic={magic!r})")
+    if version != VERSION or ncols != len(CANDLE_FIELDS):
+        raise ValueError(f"Unsupported candle file version {version} ({ncols} columns)")
+
+    expected = HEADER.size + rows * (8 + 8 * len(FLOAT_FIELDS) + 1)
+    if len(buf) < expected:
+        raise ValueError(f"Truncated candle file ({len(buf)} < {expected} bytes)")
+
+    offset = HEADER.size
+    columns = {"ts": np.frombuffer(buf, dtype="<i8", count=rows, offset=offset)}
+    offset += rows * 8
+    for name in FLOAT_FIELDS:
+        columns[name] = np.frombuffer(buf, dtype="<f8", count=rows, offset=offset)
+        offset += rows * 8
+    columns["confirm"] = np.frombuffer(buf, dtype=np.uint8, count=rows, offset=offset)
+
+    return {
+        "bar": bar.rstrip(b"\x00").decode("ascii"),
+        "latest_ts": int(latest_ts),
+        "columns": columns,
+    }
+
+
+def available_codecs() -> List[str]:
+    """Codecs usable for writing in this environment"""
+    return ["none", "zlib"] + (["lz4"] if lz4_frame else []) + (["zstd"] if zstandard else [])
+
+
+def resolve_codec(name: str) -> str:
+    """Map a configured codec name to an installed one ("auto" prefers zstd, then lz4, then zlib)"""
+    name = (name or "none").strip().lower()
+    if name == "auto":
+        return "zstd" if zstandard else "lz4" if lz4_frame else "zlib"
+    if name not in ("none", "zlib", "lz4", "zstd"):
+        raise ValueError(f"Unknown store codec {name!r}")
+    if name not in available_codecs():
+        logger.warning(f"Store codec {name} is not installed, using zlib")
+        return "zlib"
+    return name
+
+
+def compress_payload(payload: bytes, codec: str, level: Optional[int] = None) -> bytes:
+    """Compress an encoded candle file with the given codec (None level = codec default)"""
+    if codec == "none":
+        return payload
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compress(payload)
+    if codec == "lz4":
+        return lz4_frame.compress(payload, compression_level=0 if level is None else level)
+    if codec == "zlib":
+        return zlib.compress(payload, 6 if level is None else level)
+    raise ValueError(f"Unknown store codec {codec!r}")
+
+
+def detect_codec(buf: bytes) -> str:
+    """Codec of a stored file from its first bytes"""
+    head = bytes(buf[:4])
+    if head == MAGIC:
+        return "none"
+    if head == ZSTD_MAGIC:
+        return "zstd"
+    if head == LZ4_MAGIC:
+        return "lz4"
+    # zlib header: deflate method and a checksum over the first two bytes
+    if len(buf) >= 2 and buf[0] & 0x0F == 8 and (buf[0] << 8 | buf[1]) % 31 == 0:
+        return "zlib"
+    raise ValueError(f"Not a candle store file (magic={head!r})")
+
+
+def decompress_payload(buf: bytes) -> bytes:
+    """Return the plain encoded candle file, whatever codec it was stored with"""
+    codec = detect_codec(buf)
+    if codec == "none":
+        return buf
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("Candle file is zstd compressed but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(buf)
+    if codec == "lz4":
+        if lz4_frame is None:
+            raise ValueError("Candle file is lz4 compressed but lz4 is not installed")
+        return lz4_frame.decompress(buf)
+    try:
+        return zlib.decompress(buf)
+    except zlib.error as e:
+        raise ValueError(f"Corrupt zlib candle file: {e}") from e
+
+
+class CandleStore:
+    """Per instrument/timeframe columnar candle files under a data directory"""
+
+    def __init__(self, data_dir: str = "data", codec: str = "none", level: Optional[int] = None):
+        self.root = os.path.join(data_dir, "candles")
+        self.history_root = os.path.join(data_dir, "history")
+        # Codec for files written from now on; reading detects the codec per file
+        self.codec = resolve_codec(codec)
+        self.level = level
+
+    def instrument_dir(self, inst_id: str) -> str:
+        return os.path.join(self.root, inst_id)
+
+    def series_path(self, inst_id: str, bar: str) -> str:
+        return os.path.join(self.instrument_dir(inst_id), f"{bar}{FILE_SUFFIX}")
+
+    def has_instrument(self, inst_id: str) -> bool:
+        return os.path.isdir(self.instrument_dir(inst_id))
+
+    def remove_instrument(self, inst_id: str) -> None:
+        """Delete every live series of an instrument (deep history is left in place)"""
+        shutil.rmtree(self.instrument_dir(inst_id), ignore_errors=True)
+
+    def list_bars(self, inst_id: str) -> List[str]:
+        """List timeframes stored for an instrument"""
+        try:
+            names = os.listdir(self.instrument_dir(inst_id))
+        except FileNotFoundError:
+            return []
+        return [n[: -len(FILE_SUFFIX)] for n in names if n.endswith(FILE_SUFFIX)]
+
+    def write_columns(self, inst_id: str, bar: str, columns: Dict[str, np.ndarray]) -> int:
+        """
+        Atomically write one instrument/timeframe series from chronological columns
+
+        Returns:
+            Number of bytes written
+        """
+        return self._write_file(self.series_path(inst_id, bar), bar, columns)
+
+    def _write_file(self, path: str, bar: str, columns: Dict[str, np.ndarray]) -> int:
+        payload = compress_payload(encode_columns(bar, columns), self.codec, self.level)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_file = f"{path}.tmp"
+        with open(temp_file, "wb") as f:
+            f.write(payload)
+        os.replace(temp_file, path)
+        return len(payload)
+
+    def read_series(self, inst_id: str, bar: str) -> Optional[Dict[str, Any]]:
+        """Read one series as decoded columns, or None if missing"""
+        return self._read_file(self.series_path(inst_id, bar))
+
+    def history_path(self, inst_id: str, bar: str) -> str:
+        return os.path.join(self.history_root, inst_id, f"{bar}{FILE_SUFFIX}")
+
+    def read_history(self, inst_id: str, bar: str) -> Optional[Dict[str, Any]]:
+        """Read the deep history of one series (decoded columns), or None if not backfilled"""
+        return self._read_file(self.history_path(inst_id, bar))
+
+    def write_history(self, inst_id: str, bar: str, columns: Dict[str, np.ndarray]) -> int:
+        """Atomically replace the deep history of one series"""
+        return self._write_file(self.history_path(inst_id, bar), bar, columns)
+
+    def _read_file(self, path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path, "rb") as f:
+                buf = f.read()
+        except FileNotFoundError:
+            return None
+        return decode_columns(decompress_payload(buf))
+
+    def read_instrument(self, inst_id: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Read all timeframes of an instrument as decoded columns
+
+        Returns:
+            {bar: {"latest_ts": int, "columns": {name: np.ndarray}}}
+            with chronological columns as produced by candles_to_columns
+        """
+        data = {}
+        for bar in self.list_bars(inst_id):
+            try:
+                series = self.read_series(inst_id, bar)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Failed to read {bar} candles for {inst_id}: {e}")
+                continue
+            if series is None:
+                continue
+            data[bar] = {
+                "latest_ts": series["latest_ts"],
+                "columns": series["columns"],
+            }
+        return data
+
+
+class CandleWAL:
+    """Append-only log of candle updates, folded into the snapshot files on checkpoint"""
+
+    def __init__(self, data_dir: str = "data"):
+        self.wal_dir = os.path.join(data_dir, "wal")
+        self._file = None
+        self._seq = 0
+
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.wal_dir, f"{seq:010d}{WAL_SUFFIX}")
+
+    def segments(self) -> List[Tuple[int, str]]:
+        """List (sequence number, path) of existing segments, oldest first"""
+        try:
+            names = os.listdir(self.wal_dir)
+        except FileNotFoundError:
+            return []
+        out = []
+        for name in names:
+            if name.endswith(WAL_SUFFIX) and name[: -len(WAL_SUFFIX)].isdigit():
+                out.append((int(name[: -len(WAL_SUFFIX)]), os.path.join(self.wal_dir, name)))
+        return sorted(out)
+
+    def open(self) -> int:
+        """Start a new segment after any existing ones and return its sequence number"""
+        self.close()
+        os.makedirs(self.wal_dir, exist_ok=True)
+        existing = self.segments()
+        self._seq = (existing[-1][0] + 1) if existing else 1
+        self._file = open(self._segment_path(self._seq), "a", encoding="utf-8")
+        return self._seq
+
+    def rotate(self) -> int:
+        """
+        Seal the current segment and continue in a new one
+
+        Returns:
+            Sequence number of the new segment; every older segment is sealed
+        """
+        return self.open()
+
+    def append(self, inst_id: str, bar: str, candles: List[List], flush: bool = True) -> None:
+        """
+        Append one update; flushed to the OS so it survives a process crash
+
+        Pass flush=False when appending a batch and call flush() once at the end.
+        """
+        if self._file is None:
+            self.open()
+        self._file.write(json.dumps([inst_id, bar, candles], separators=(",", ":")) + "\n")
+        if flush:
+            self._file.flush()
+
+    def flush(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+
+    def replay(self) -> Iterator[Tuple[str, str, List[List]]]:
+        """Yield (instId, bar, candles) from all segments in write order"""
+        for seq, path in self.segments():
+            if seq == self._seq and self._file is not None:
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        inst_id, bar, candles = json.loads(line)
+                    except (ValueError, TypeError):
+                        # Torn write at the tail of a segment
+                        continue
+                    yield inst_id, bar, candles
+
+    def drop_before(self, seq: int) -> int:
+        """Delete segments older than seq (already folded into snapshots)"""
+        removed = 0
+        for old_seq, path in self.segments():
+            if old_seq >= seq:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError as e:
+                logger.warning(f"Failed to remove WAL segment {path}: {e}")
+        return removed
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
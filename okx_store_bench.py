@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+OKX Store Benchmark - Compare candle snapshot encodings
+
+Writes the same candle series as legacy per-instrument JSON and as binary
+store files with every installed codec, then reports bytes on disk, write
+time and read time (read + decompress + decode to NumPy columns):
+
+    python okx_store_bench.py                      # series from data/candles/
+    python okx_store_bench.py --synthetic 245      # generated series, no data needed
+    python okx_store_bench.py --level 1 --repeat 5
+
+Output goes to a temporary directory that is removed afterwards.
+"""
+
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from typing import Dict, List, Tuple
+import numpy as np
+from okx_store import (
+    CandleStore, available_codecs, candles_to_columns, columns_to_candles, encode_columns,
+)
+
+Series = Dict[Tuple[str, str], Dict[str, np.ndarray]]
+
+
+def load_series(data_dir: str) -> Series:
+    """All live series of an existing store as {(instId, bar): columns}"""
+    store = CandleStore(data_dir)
+    series = {}
+    if not os.path.isdir(store.root):
+        return series
+    for inst_id in sorted(os.listdir(store.root)):
+        for bar in store.list_bars(inst_id):
+            data = store.read_series(inst_id, bar)
+            if data and len(data["columns"]["ts"]):
+                series[(inst_id, bar)] = data["columns"]
+    return series
+
+
+def synthetic_series(instruments: int) -> Series:
+    """Series from the fake server's price model, sized like the sync's live windows"""
+    from okx_fake_server import FakeOKXServer
+
+    limits = {"5m": 288, "15m": 192, "1H": 168, "4H": 180, "1D": 90, "1W": 52, "1M": 12}
+    server = FakeOKXServer(instruments=instruments)
+    now_ms = int(time.time() * 1000)
+    return {
+        (inst_id, bar): candles_to_columns(server.candles(inst_id, bar, None, None, limit, now_ms))
+        for inst_id in server.instruments
+        for bar, limit in limits.items()
+    }
+
+
+def _directory_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def bench_json(series: Series, out_dir: str) -> Tuple[float, float]:
+    """Legacy data/<instId>.json files (export_json layout); returns (write s, read s)"""
+    by_inst = {}
+    for (inst_id, bar), columns in series.items():
+        by_inst.setdefault(inst_id, {})[bar] = columns
+    os.makedirs(out_dir, exist_ok=True)
+
+    started = time.perf_counter()
+    for inst_id, bars in by_inst.items():
+        output = {
+            "instrument": inst_id,
+            "data": {bar: {"latest_ts": int(columns["ts"][-1]), "candles": columns_to_candles(columns)}
+                     for bar, columns in bars.items()},
+        }
+        path = os.path.join(out_dir, f"{inst_id}.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(output, f, separators=(",", ":"))
+        os.replace(f"{path}.tmp", path)
+    write_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for inst_id in by_inst:
+        with open(os.path.join(out_dir, f"{inst_id}.json")) as f:
+            data = json.load(f)
+        for bar_data in data["data"].values():
+            candles_to_columns(bar_data["candles"])
+    read_s = time.perf_counter() - started
+    return write_s, read_s
+
+
+def bench_store(series: Series, out_dir: str, codec: str, level) -> Tuple[float, float]:
+    """Binary store files with one codec; returns (write s, read s)"""
+    store = CandleStore(out_dir, codec=codec, level=level)
+    started = time.perf_counter()
+    for (inst_id, bar), columns in series.items():
+        store.write_columns(inst_id, bar, columns)
+    write_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for inst_id, bar in series:
+        store.read_series(inst_id, bar)
+    read_s = time.perf_counter() - started
+    return write_s, read_s
+
+
+def run(series: Series, codecs: List[str], level, repeat: int) -> List[Dict]:
+    raw_bytes = sum(len(encode_columns(bar, columns)) for (_, bar), columns in series.items())
+    results = []
+    temp_root = tempfile.mkdtemp(prefix="okx_store_bench_")
+    try:
+        for name in ["json"] + codecs:
+            writes, reads = [], []
+            out_dir = os.path.join(temp_root, name)
+            for _ in range(repeat):
+                shutil.rmtree(out_dir, ignore_errors=True)
+                if name == "json":
+                    write_s, read_s = bench_json(series, out_dir)
+                else:
+                    write_s, read_s = bench_store(series, out_dir, name, level)
+                writes.append(write_s)
+                reads.append(read_s)
+            size = _directory_bytes(out_dir)
+            results.append({
+                "format": name if name == "json" else f"olc+{name}" if name != "none" else "olc",
+                "bytes": size,
+                "ratio": size / raw_bytes,
+                "write_ms": min(writes) * 1000,
+                "read_ms": min(reads) * 1000,
+            })
+    finally:
+        shutil.rmtree(temp_root, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark candle snapshot encodings")
+    parser.add_argument("--data-dir", default="data", help="Store to take series from")
+    parser.add_argument("--synthetic", type=int, default=0, metavar="N",
+                        help="Generate N instruments instead of reading --data-dir")
+    parser.add_argument("--level", type=int, default=None, help="Compression level (default: codec default)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per format (best time is reported)")
+    args = parser.parse_args()
+
+    series = synthetic_series(args.synthetic) if args.synthetic else load_series(args.data_dir)
+    if not series:
+        parser.error(f"No series under {args.data_dir}/candles; run okx_sync.py first or use --synthetic N")
+    rows = sum(len(columns["ts"]) for columns in series.values())
+    print(f"{len(series)} series, {rows} candles, codecs: {', '.join(available_codecs())}")
+    print(f"{'format':<10} {'bytes':>12} {'vs olc':>7} {'write ms':>9} {'read ms':>9}")
+    for result in run(series, available_codecs(), args.level, args.repeat):
+        print(f"{result['format']:<10} {result['bytes']:>12,} {result['ratio']:>7.2f} "
+              f"{result['write_ms']:>9.1f} {result['read_ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
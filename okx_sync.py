@@ -15,6 +15,26 @@ from datetime import datetime
 import logging
 import random
 import collections
+import functools
+import heapq
+import itertools
+import math
+import zlib
+import numpy as np
+import configparser
+from concurrent.futures import ThreadPoolExecutor
+from okx_store import CandleStore, CandleWAL, candles_to_columns, columns_to_candles, merge_columns
+from okx_candles import CandleRing, CandleAggregator, bars_since, bucket_start
+from okx_shm import SharedSnapshotWriter, default_shm_path
+from okx_pubsub import CandleFanout
+from okx_metrics import SyncMetricsServer
+from okx_endpoints import rest_url, ws_url
+
+try:
+    import orjson  # Optional, faster WebSocket message decoding
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
 
 # Configure logging
 logging.basicConfig(
@@ -25,44 +45,280 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class AsyncRateLimiter:
-    """Lightweight token bucket rate limiter (coroutine-safe)"""
+    """Lightweight token bucket rate limiter (coroutine-safe) with adaptive slowdown"""
     def __init__(self, max_requests: int, period_seconds: float):
         self.max_requests = max_requests
         self.period = period_seconds
+        self.limit = max_requests  # Current allowance, lowered after rate limit responses
         self.timestamps = collections.deque()
         self._lock = asyncio.Lock()
+        self._recover_at = 0.0
+        self.stats = {"acquired": 0, "waits": 0, "wait_seconds": 0.0, "rate_limited": 0}
 
     async def acquire(self):
+        started = time.monotonic()
         async with self._lock:
             now = time.monotonic()
             # Clean up expired timestamps
             while self.timestamps and now - self.timestamps[0] > self.period:
                 self.timestamps.popleft()
-            if len(self.timestamps) >= self.max_requests:
+            while len(self.timestamps) >= self.limit:
                 sleep_time = self.period - (now - self.timestamps[0]) + 0.01
                 await asyncio.sleep(max(0.0, sleep_time))
+                now = time.monotonic()
+                while self.timestamps and now - self.timestamps[0] > self.period:
+                    self.timestamps.popleft()
             # Record current request
-            self.timestamps.append(time.monotonic())
+            now = time.monotonic()
+            self.timestamps.append(now)
+            self.stats["acquired"] += 1
+            if now - started > 0.001:
+                self.stats["waits"] += 1
+                self.stats["wait_seconds"] += now - started
+
+    def slow_down(self):
+        """Halve the allowance after HTTP 429 / code 50011"""
+        self.stats["rate_limited"] += 1
+        self.limit = max(1, self.limit // 2)
+        self._recover_at = time.monotonic() + self.period * 5
+
+    def record_success(self):
+        """Give back one request per period once the cool-down has passed"""
+        if self.limit < self.max_requests and time.monotonic() >= self._recover_at:
+            self.limit += 1
+            self._recover_at = time.monotonic() + self.period
+
+
+class RateLimitRegistry:
+    """Per-endpoint rate limiters (OKX limits are per endpoint and IP)"""
+    def __init__(self, limits, default):
+        self._limiters = {path: AsyncRateLimiter(n, period) for path, (n, period) in limits.items()}
+        self._default = AsyncRateLimiter(*default)
+
+    def get(self, path: str) -> AsyncRateLimiter:
+        return self._limiters.get(path, self._default)
+
+    def items(self):
+        """(endpoint, limiter) pairs; endpoints without their own limit are listed as default"""
+        return list(self._limiters.items()) + [("default", self._default)]
+
+class RestScheduler:
+    """
+    Priority queue of REST jobs drained by a bounded worker pool
+
+    Jobs are coroutine factories; the highest priority runs first (FIFO among
+    equals). Submitting a key that is still queued returns the queued job's
+    future and raises its priority instead of adding a duplicate.
+    """
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._heap = []  # Entries [-priority, seq, key, factory, future, enqueued_at]; factory None = superseded
+        self._queued = {}  # key -> live heap entry
+        self._seq = itertools.count()
+        self._available = None  # asyncio.Semaphore with one permit per live entry, created in start()
+        self._tasks = []
+        self.depth = 0
+        self.running = 0
+        self.stats = {"submitted": 0, "completed": 0, "deduplicated": 0, "max_depth": 0}
+        self._waits_ms = collections.deque(maxlen=2000)  # Queue wait of recently started jobs
+
+    def start(self):
+        self._available = asyncio.Semaphore(0)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for entry in self._heap:
+            if entry[3] is not None and not entry[4].done():
+                entry[4].cancel()
+        self._heap = []
+        self._queued = {}
+        self._available = None
+        self.depth = 0
+
+    def submit(self, priority: float, factory, key=None) -> asyncio.Future:
+        """Queue factory() to run with the given priority; returns a future with its result"""
+        if not self._tasks:
+            # Workers not started (e.g. tools driving parts of the sync directly): run right away
+            return asyncio.ensure_future(factory())
+        queued = self._queued.get(key) if key is not None else None
+        if queued is not None:
+            self.stats["deduplicated"] += 1
+            if -priority < queued[0]:
+                # Push a copy with the higher priority; the old entry is skipped when popped
+                entry = [-priority, next(self._seq), key, queued[3], queued[4], queued[5]]
+                queued[3] = None
+                self._queued[key] = entry
+                heapq.heappush(self._heap, entry)
+            return self._queued[key][4]
+        future = asyncio.get_running_loop().create_future()
+        entry = [-priority, next(self._seq), key, factory, future, time.monotonic()]
+        if key is not None:
+            self._queued[key] = entry
+        heapq.heappush(self._heap, entry)
+        self.depth += 1
+        self.stats["submitted"] += 1
+        self.stats["max_depth"] = max(self.stats["max_depth"], self.depth)
+        self._available.release()
+        return future
+
+    async def run(self, priority: float, factory, key=None):
+        """Submit and wait for the result"""
+        return await self.submit(priority, factory, key)
+
+    def _pop(self):
+        while True:
+            entry = heapq.heappop(self._heap)
+            if entry[3] is not None:
+                break
+        self.depth -= 1
+        if entry[2] is not None and self._queued.get(entry[2]) is entry:
+            del self._queued[entry[2]]
+        return entry
+
+    async def _worker(self):
+        while True:
+            await self._available.acquire()
+            _, _, _, factory, future, enqueued_at = self._pop()
+            if future.done():
+                continue  # Cancelled by the caller while queued
+            self._waits_ms.append((time.monotonic() - enqueued_at) * 1000)
+            self.running += 1
+            try:
+                result = await factory()
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                self.running -= 1
+                self.stats["completed"] += 1
+
+    def report(self, reset=True):
+        """Queue metrics since the last report (resets max depth and the wait window unless reset=False)"""
+        waits = sorted(self._waits_ms)
+        metrics = {
+            "depth": self.depth,
+            "running": self.running,
+            "max_depth": self.stats["max_depth"],
+            "submitted": self.stats["submitted"],
+            "completed": self.stats["completed"],
+            "deduplicated": self.stats["deduplicated"],
+            "wait_p50_ms": waits[len(waits) // 2] if waits else 0.0,
+            "wait_p95_ms": waits[int(len(waits) * 0.95)] if waits else 0.0,
+            "wait_max_ms": waits[-1] if waits else 0.0,
+        }
+        if reset:
+            self.stats["max_depth"] = self.depth
+            self._waits_ms.clear()
+        return metrics
 
 class OKXMarketSync:
-    def __init__(self):
-        self.rest_url = "https://www.okx.com"
-        self.ws_url = "wss://ws.okx.com:8443/ws/v5/business"
-        self.market_data = {}
-        self.save_interval = 60  # Save every 1 minute
+    def __init__(self, config_path: str = "config.ini"):
+        self.config = configparser.ConfigParser()
+        self.config.read(config_path)
+        self.rest_url = rest_url(self.config)
+        self.ws_url = ws_url(self.config)
+        self.market_data = {}  # {instId: {bar: CandleRing}}
+        self.save_interval = self.config.getint('SYNC', 'save_interval', fallback=60)  # Checkpoint every 1 minute
         self.data_dir = "data"  # Data directory
         self.summary_file = "data/summary.json"  # Summary file
         self.instruments_file = "instruments.json"  # Product basic info file
         self.instruments_cache_hours = 24  # Cache product info for 24 hours
+        # Re-read the instrument list every N seconds and apply listings/delistings live (0 = only at startup)
+        self.instruments_refresh_interval = self.config.getint('SYNC', 'instruments_refresh_interval', fallback=3600)
+        # Largest fraction of the live set one refresh may evict; more looks like a truncated response
+        self.instruments_max_evict_ratio = self.config.getfloat('SYNC', 'instruments_max_evict_ratio', fallback=0.1)
+        self.instruments = []  # Live instrument set, shared with the loops and updated in place
+        self._delisted = set()  # Evicted instruments; late WebSocket updates for them are ignored
+        # Columnar binary candle store (data/candles/<instId>/<bar>.olc), optionally compressed
+        store_level = self.config.get('SYNC', 'store_level', fallback='').strip()
+        self.store = CandleStore(
+            self.data_dir,
+            codec=self.config.get('SYNC', 'store_codec', fallback='none'),
+            level=int(store_level) if store_level else None,
+        )
+        # Legacy data/<instId>.json export, only for external consumers that still need it
+        self.export_json = self.config.getboolean('SYNC', 'export_json', fallback=False)
+        # Incremental persistence: (instId, bar) pairs changed since the last save
+        self._dirty = set()
+        # Series whose last save failed: their WAL records are the only durable copy until a save succeeds
+        self._unsaved = set()
+        self._saved_instruments = None  # Instrument set recorded in the last summary.json
+        self.save_stats = {"files_written": 0, "files_skipped": 0, "files_failed": 0}
+        self.save_totals = {"files_written": 0, "files_skipped": 0}
+        # Snapshot files are written on a single background thread so the event loop keeps ingesting
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="okx-save")
+        self.save_timing = {"snapshot_ms": 0.0, "write_ms": 0.0}
+        self.last_save_time = 0.0  # Unix time of the last completed checkpoint
+        self.loop_stall_ms = 0.0  # Worst event-loop stall since the last save report
+        self.loop_monitor_interval = 0.1
+        # Live snapshot in shared memory for okx_market.py (no disk I/O, refreshed every shm_interval seconds)
+        self.shm_enabled = self.config.getboolean('SYNC', 'shm_enabled', fallback=True)
+        self.shm_interval = self.config.getfloat('SYNC', 'shm_interval', fallback=1.0)
+        self.shm = SharedSnapshotWriter(
+            self.config.get('SYNC', 'shm_path', fallback=default_shm_path())
+        ) if self.shm_enabled else None
+        self._shm_dirty = set()
+        # Local fan-out of live candle / bar-closed events (TCP on localhost, or a Unix socket when set)
+        self.fanout = CandleFanout(
+            host=self.config.get('SYNC', 'fanout_host', fallback='127.0.0.1'),
+            port=self.config.getint('SYNC', 'fanout_port', fallback=8790),
+            unix_path=self.config.get('SYNC', 'fanout_unix_socket', fallback='') or None,
+            queue_size=self.config.getint('SYNC', 'fanout_queue_size', fallback=10000),
+        ) if self.config.getboolean('SYNC', 'fanout_enabled', fallback=False) else None
+        # Prometheus text metrics for health checks and alerting (GET /metrics)
+        self.metrics = SyncMetricsServer(
+            self,
+            host=self.config.get('SYNC', 'metrics_host', fallback='127.0.0.1'),
+            port=self.config.getint('SYNC', 'metrics_port', fallback=8791),
+        ) if self.config.getboolean('SYNC', 'metrics_enabled', fallback=False) else None
+        # Write-ahead log of WebSocket updates between snapshots (replayed on startup)
+        self.wal_enabled = self.config.getboolean('SYNC', 'wal_enabled', fallback=True)
+        self.wal = CandleWAL(self.data_dir) if self.wal_enabled else None
+        # WebSocket sharding: spread subscriptions over several connections ("instrument" hash or "timeframe")
+        self.ws_shards = max(1, self.config.getint('SYNC', 'ws_shards', fallback=4))
+        self.ws_shard_by = self.config.get('SYNC', 'ws_shard_by', fallback='instrument')
+        self.ws_subscribe_batch = 105  # Subscriptions per message (well under the 64KB message limit)
+        self.ws_connect_stagger = 0.4  # Seconds between shard connects (OKX: 3 connection requests/second per IP)
+        self._ws_channels = {}  # {shard_id: [subscription args]} wanted per shard (used on every connect)
+        self._ws_conns = {}  # {shard_id: open connection} for incremental subscribe/unsubscribe
+        self._ws_tasks = {}  # {shard_id: shard task}
+        self._ws_catchups = {}  # {shard_id: REST catch-up task started on the last reconnect}
+        self.ws_stats = {"messages": 0, "decode_seconds": 0.0, "connects": 0, "reconnects": 0, "catchup_series": 0}
+        self.ws_last_message = {}  # {bar: unix time of the last WebSocket candle update}
         # REST concurrency and rate limiting (OKX docs: about 40 requests/2 seconds)
         self.rest_concurrency = 8
         self._rest_sem = None  # Will be initialized in event loop
+        self._seeded = None  # Set once the startup REST fetch has filled the live windows
+        # Candle REST work is queued by priority = staleness (bars) x timeframe weight x liquidity weight
+        # and drained by rest_concurrency workers, so stale short timeframes of liquid coins go first
+        self.scheduler = RestScheduler(self.rest_concurrency)
+        self.timeframe_weights = {"5m": 8, "15m": 6, "1H": 5, "4H": 4, "1D": 3, "1W": 2, "1M": 1}
+        self.backfill_priority = 0.1  # Deep history pages run only when nothing else is queued
         # Consistency refresh throttling
         self.last_refresh = {}
+        # Oldest timestamp per (instId, bar) beyond which the exchange returned nothing
+        self._history_exhausted = {}
         # Allowed periods for auto-backfill in consistency check (avoid frequent refresh of 1W/1M)
         self.consistency_allowed_bars = {"5m", "15m", "1H", "4H", "1D"}
-        # Global rate limiter: max 18 per second
-        self.rate_limiter = AsyncRateLimiter(max_requests=18, period_seconds=1.0)
+        # Per-endpoint rate limits (OKX docs), slightly below the published values
+        self.rate_limits = RateLimitRegistry({
+            "/api/v5/market/candles": (36, 2.0),          # 40 requests / 2s
+            "/api/v5/market/history-candles": (18, 2.0),  # 20 requests / 2s
+            "/api/v5/public/instruments": (18, 2.0),      # 20 requests / 2s
+        }, default=(18, 1.0))
+        self.rate_limit_retries = 3
+        # One long-lived HTTP session (keep-alive, DNS cache), created in the event loop
+        self._session = None
         
         # Candlestick retention quantity configuration
         self.candle_limits = {
@@ -85,6 +341,11 @@ class OKXMarketSync:
             "1W": "1w",
             "1M": "1M"
         }
+        # WebSocket channel name -> timeframe, for the receive path
+        self.channel_bars = {
+            f"candle{ws_tf}": tf for tf, ws_tf in self.timeframe_map.items() if tf in self.candle_limits
+        }
+        self.ws_batch_max = 500  # Messages drained from the socket per processing pass
 
         # Milliseconds corresponding to each timeframe (for data freshness judgment)
         self.timeframe_ms = {
@@ -96,14 +357,51 @@ class OKXMarketSync:
             "1W": 7 * 24 * 60 * 60 * 1000,
             "1M": 30 * 24 * 60 * 60 * 1000  # Approximate value
         }
+
+        # Aggregation mode: subscribe only the base timeframe and roll higher timeframes up locally
+        self.aggregate_timeframes = self.config.getboolean('SYNC', 'aggregate_timeframes', fallback=False)
+        self.base_bar = "5m"
+        self.reconcile_interval = self.config.getint('SYNC', 'reconcile_interval', fallback=1800)
+        # Deep history backfill into data/history/ via paginated history-candles
+        self.backfill_enabled = self.config.getboolean('SYNC', 'backfill_enabled', fallback=True)
+        self.backfill_days = {  # Target depth per timeframe, 0 = back to the listing date
+            "5m": 7,
+            "15m": 30,
+            "1H": 90,
+            "4H": 365,
+            "1D": 1095,
+            "1W": 0,
+            "1M": 0
+        }
+        self.backfill_interval = 3600  # Seconds between rounds (each round also tops history up with the live window)
+        self.backfill_retry_interval = 60  # Seconds before retrying series that had no candles to page back from
+        self.backfill_page_delay = 0.25  # Pause between pages so live refreshes keep most of the rate budget
+        self.backfill_flush_pages = 20  # Persist progress every N pages so a restart resumes close to where it stopped
+        self.backfill_state_file = "data/history/backfill.json"
+
+        # Warm start: read snapshots in parallel, fetch only the bars missed while stopped and
+        # start the WebSocket without waiting for REST (false = refresh everything before going live)
+        self.warm_start = self.config.getboolean('SYNC', 'warm_start', fallback=True)
+        self.load_workers = 8  # Threads reading snapshot files at startup
+
+        self.aggregator = None
+        if self.aggregate_timeframes:
+            self.aggregator = CandleAggregator(
+                self.base_bar, [bar for bar in self.candle_limits if bar != self.base_bar]
+            )
         
     async def start(self):
         """Main startup function"""
         logger.info("Starting OKX Market Sync...")
         
         try:
-            # Initialize concurrency semaphore
+            # Initialize concurrency semaphore and the shared HTTP session
             self._rest_sem = asyncio.Semaphore(self.rest_concurrency)
+            self._seeded = asyncio.Event()
+            self._session = self._create_session()
+            self.scheduler.start()
+            if self.metrics:
+                await self.metrics.start()
             # 0. Create data directory
             os.makedirs(self.data_dir, exist_ok=True)
             
@@ -111,29 +409,91 @@ class OKXMarketSync:
             await self.update_instruments_info()
             
             # 2. Get list of products to synchronize
-            instruments = await self.get_instruments()
+            self.instruments = instruments = await self.get_instruments()
             logger.info(f"Found {len(instruments)} USDT-SWAP instruments")
             
-            # 3. Load existing data (if exists)
+            # 3. Load existing data (if exists) and replay the write-ahead log
             self.load_existing_data()
+            if self.wal:
+                self.wal.open()
+            await self.evict_unlisted()
             
-            # 4. Get historical candlestick data
-            await self.fetch_all_history(instruments)
-            logger.info("Historical data loaded")
+            # 4. Get historical candlestick data (warm start: only the missed bars, alongside the WebSocket)
+            if not self.warm_start:
+                await self.fetch_all_history(instruments)
+                logger.info("Historical data loaded")
+                self._seeded.set()
             
-            # 5. Save initial data
-            self.save_all_data()
+            # 5. Save initial data and publish the shared snapshot
+            self.checkpoint()
+            self.publish_snapshot(full=True)
+            if self.fanout:
+                await self.fanout.start()
             
             # 6. Start WebSocket, data consistency patrol and periodic saving
-            await asyncio.gather(
+            tasks = [
                 self.websocket_loop(instruments),
                 self.consistency_loop(instruments),
-                self.save_loop()
-            )
+                self.save_loop(),
+                self.loop_monitor()
+            ]
+            if self.aggregator:
+                tasks.append(self.reconcile_loop(instruments))
+            if self.backfill_enabled:
+                tasks.append(self.backfill_loop(instruments))
+            if self.shm:
+                tasks.append(self.publish_loop())
+            if self.instruments_refresh_interval > 0:
+                tasks.append(self.instruments_refresh_loop())
+            await asyncio.gather(*tasks)
         except KeyboardInterrupt:
             logger.info("Shutting down...")
         except Exception as e:
             logger.error(f"Unexpected error: {e}")
+        finally:
+            await self.scheduler.close()
+            if self._session:
+                await self._session.close()
+            self.close()
+            if self.fanout:
+                await self.fanout.close()
+            if self.metrics:
+                await self.metrics.close()
+
+    def close(self):
+        """Wait for pending saves, then close the write-ahead log and the shared snapshot"""
+        self._writer.shutdown(wait=True)
+        if self.wal:
+            self.wal.close()
+        if self.shm:
+            self.shm.close()
+
+    def _create_session(self):
+        """Pooled HTTP session shared by every REST call"""
+        connector = aiohttp.TCPConnector(
+            limit=self.rest_concurrency * 2,
+            ttl_dns_cache=300,
+            keepalive_timeout=60,
+        )
+        return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=15))
+
+    async def _rest_get(self, path, params=None):
+        """GET an OKX REST endpoint under its rate limit; slows down and retries on rate limit responses"""
+        limiter = self.rate_limits.get(path)
+        for attempt in range(self.rate_limit_retries + 1):
+            await limiter.acquire()
+            async with self._rest_sem:
+                async with self._session.get(f"{self.rest_url}{path}", params=params) as resp:
+                    status = resp.status
+                    data = {} if status == 429 else await resp.json(content_type=None)
+            if status == 429 or data.get('code') == '50011':
+                limiter.slow_down()
+                logger.warning(f"Rate limited on {path}, allowance now {limiter.limit}/{limiter.period:g}s")
+                await asyncio.sleep(limiter.period * (attempt + 1))
+                continue
+            limiter.record_success()
+            return data
+        return data
     
     def load_existing_data(self):
         """Load existing data files"""
@@ -147,25 +507,73 @@ class OKXMarketSync:
                     summary = json.load(f)
                     instruments = summary.get('instruments', [])
                     
-                    # Load data file for each product
-                    for inst_id in instruments:
-                        data_file = f"{self.data_dir}/{inst_id}.json"
-                        if os.path.exists(data_file):
-                            try:
-                                with open(data_file, 'r') as f:
-                                    inst_data = json.load(f)
-                                    self.market_data[inst_id] = inst_data.get('data', {})
-                            except Exception as e:
-                                logger.warning(f"Failed to load data for {inst_id}: {e}")
+                    # Read and decode files on a thread pool, fill the buffers here
+                    started = time.perf_counter()
+                    with ThreadPoolExecutor(max_workers=self.load_workers) as pool:
+                        for inst_id, stored, legacy in pool.map(self._read_instrument_files, instruments):
+                            for bar, columns in stored.items():
+                                self._series(inst_id, bar).load_columns(columns)
+                            for bar, candles in legacy.items():
+                                self._series(inst_id, bar).load_rows(candles)
+                                # Migrate legacy JSON into the binary store on the next save
+                                self.mark_dirty(inst_id, bar)
                     
-                    logger.info(f"Loaded existing data for {len(self.market_data)} instruments")
+                    logger.info(
+                        f"Loaded existing data for {len(self.market_data)} instruments "
+                        f"in {time.perf_counter() - started:.1f}s"
+                    )
             except Exception as e:
                 logger.warning(f"Failed to load summary file: {e}")
+
+        # Apply updates received after the last snapshot
+        if self.wal:
+            self.replay_wal()
+
+    def _read_instrument_files(self, inst_id):
+        """
+        Read the stored series of one product (runs on the load thread pool)
+
+        Returns:
+            (instId, {bar: columns} from the binary store, {bar: candles} from legacy JSON)
+        """
+        stored = {}
+        legacy = {}
+        try:
+            for bar in self.store.list_bars(inst_id):
+                if bar not in self.candle_limits:
+                    continue
+                series = self.store.read_series(inst_id, bar)
+                if series:
+                    stored[bar] = series["columns"]
+            data_file = f"{self.data_dir}/{inst_id}.json"
+            if not stored and os.path.exists(data_file):
+                with open(data_file, 'r') as f:
+                    inst_data = json.load(f)
+                for bar, bar_data in inst_data.get('data', {}).items():
+                    if bar in self.candle_limits:
+                        legacy[bar] = bar_data.get("candles", [])
+        except Exception as e:
+            logger.warning(f"Failed to load data for {inst_id}: {e}")
+        return inst_id, stored, legacy
+
+    def replay_wal(self):
+        """Re-apply write-ahead log entries on top of the loaded snapshots"""
+        replayed = 0
+        try:
+            for inst_id, bar, candles in self.wal.replay():
+                if bar not in self.candle_limits or not candles:
+                    continue
+                self._apply_candles(inst_id, bar, candles)
+                replayed += 1
+        except Exception as e:
+            logger.warning(f"Failed to replay WAL: {e}")
+        if replayed:
+            logger.info(f"Replayed {replayed} WAL updates")
     
-    async def update_instruments_info(self):
-        """Update product basic info (24-hour cache)"""
+    async def update_instruments_info(self, force=False):
+        """Update product basic info (24-hour cache unless force)"""
         # Check if update is needed
-        if os.path.exists(self.instruments_file):
+        if not force and os.path.exists(self.instruments_file):
             file_time = os.path.getmtime(self.instruments_file)
             current_time = time.time()
             age_hours = (current_time - file_time) / 3600
@@ -177,15 +585,12 @@ class OKXMarketSync:
         logger.info("Updating instruments info...")
         
         # Get basic info for all SWAP products from API
-        async with aiohttp.ClientSession() as session:
-            url = f"{self.rest_url}/api/v5/public/instruments?instType=SWAP"
-            async with session.get(url) as resp:
-                data = await resp.json()
-                if data['code'] != '0':
-                    logger.error(f"Failed to get instruments info: {data}")
-                    return
-                
-                all_instruments = data['data']
+        data = await self._rest_get("/api/v5/public/instruments", {'instType': 'SWAP'})
+        if data.get('code') != '0':
+            logger.error(f"Failed to get instruments info: {data}")
+            return
+        
+        all_instruments = data['data']
         
         # Filter basic info for USDT contracts
         usdt_instruments = {}
@@ -227,119 +632,435 @@ class OKXMarketSync:
             logger.error(f"Error reading instruments file: {e}")
             return []
     
+    async def instruments_refresh_loop(self):
+        """Periodically apply new listings and delistings without restarting"""
+        while True:
+            await asyncio.sleep(self.instruments_refresh_interval)
+            try:
+                await self.refresh_instruments()
+            except Exception as e:
+                logger.warning(f"Instruments refresh warning: {e}")
+
+    async def refresh_instruments(self):
+        """Re-read the instrument list and diff it against the live set"""
+        await self.update_instruments_info(force=True)
+        latest = await self.get_instruments()
+        if not latest:
+            logger.warning("Instruments refresh returned no instruments, keeping the current set")
+            return
+        current = set(self.instruments)
+        latest_set = set(latest)
+        added = [inst_id for inst_id in latest if inst_id not in current]
+        removed = [inst_id for inst_id in self.instruments if inst_id not in latest_set]
+        if not added and not removed:
+            logger.info(f"Instrument set unchanged ({len(current)} instruments)")
+            return
+        if not self._eviction_allowed(removed, len(current)):
+            logger.warning("Keeping the current instrument set")
+            return
+        logger.info(f"Instrument set changed: {len(added)} listed {added[:10]}, {len(removed)} delisted {removed[:10]}")
+
+        if removed:
+            await self._update_ws_subscriptions([], removed)
+            self.instruments[:] = [inst_id for inst_id in self.instruments if inst_id not in removed]
+            await self.evict_instruments(removed)
+        if added:
+            self._delisted.difference_update(added)
+            self.instruments.extend(added)
+            # Subscribe first so nothing is missed while REST fills the window; only new listings are fetched
+            await self._update_ws_subscriptions(added, [])
+            await self.fetch_all_history(added)
+        await self.checkpoint_async()
+        self.publish_snapshot(full=bool(removed))
+
+    def _eviction_allowed(self, removed, current):
+        """Whether one change may evict this many of current instruments (more looks like a partial list)"""
+        max_evict = max(1, int(current * self.instruments_max_evict_ratio))
+        if len(removed) <= max_evict:
+            return True
+        # Evicting deletes the stored candles, so a partial list must not be applied
+        logger.warning(
+            f"Instrument list would delist {len(removed)} of {current} instruments (limit {max_evict}); "
+            f"raise instruments_max_evict_ratio if this is a real delisting"
+        )
+        return False
+
+    async def evict_unlisted(self):
+        """Evict series loaded from disk or the WAL for instruments delisted while the sync was stopped"""
+        listed = set(self.instruments)
+        unlisted = [inst_id for inst_id in self.market_data if inst_id not in listed]
+        if not unlisted:
+            return
+        logger.info(f"Evicting {len(unlisted)} instruments no longer listed: {unlisted[:10]}")
+        # Over the limit: stop syncing and publishing them, but leave their files alone
+        remove_files = self._eviction_allowed(unlisted, len(self.market_data))
+        await self.evict_instruments(unlisted, remove_files=remove_files)
+
+    async def evict_instruments(self, inst_ids, remove_files=True):
+        """Drop delisted instruments from memory, the shared snapshot and the live store (deep history is kept)"""
+        gone = set(inst_ids)
+        self._delisted |= gone
+        for inst_id in inst_ids:
+            self.market_data.pop(inst_id, None)
+            self.last_refresh.pop(inst_id, None)
+            if self.aggregator:
+                self.aggregator.reset(inst_id)
+        self._dirty = {key for key in self._dirty if key[0] not in gone}
+        self._unsaved = {key for key in self._unsaved if key[0] not in gone}
+        self._shm_dirty = {key for key in self._shm_dirty if key[0] not in gone}
+        self._history_exhausted = {key: ts for key, ts in self._history_exhausted.items() if key[0] not in gone}
+        if self.shm:
+            # Rebuilt without the evicted series on the next publish
+            self.shm.close(stale=True)
+        if not remove_files:
+            return
+        # On the writer thread, so a save already in progress cannot re-create the files afterwards
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._writer, self._remove_instrument_files, inst_ids)
+
+    def _remove_instrument_files(self, inst_ids):
+        for inst_id in inst_ids:
+            try:
+                self.store.remove_instrument(inst_id)
+                data_file = f"{self.data_dir}/{inst_id}.json"
+                if os.path.exists(data_file):
+                    os.remove(data_file)
+            except OSError as e:
+                logger.warning(f"Failed to remove data files for {inst_id}: {e}")
+        logger.info(f"Evicted {len(inst_ids)} delisted instruments")
+
     async def fetch_all_history(self, instruments):
         """Get historical candlesticks for all products (concurrent + rate limited)"""
-        async with aiohttp.ClientSession() as session:
-            tasks = []
-            now_ms = int(time.time() * 1000)
-            for inst_id in instruments:
-                if inst_id not in self.market_data:
-                    self.market_data[inst_id] = {}
-                for bar, limit in self.candle_limits.items():
-                    if bar not in self.market_data[inst_id]:
-                        self.market_data[inst_id][bar] = {"latest_ts": 0, "candles": []}
-                    existing = self.market_data[inst_id][bar]
-                    latest_ts = int(existing.get("latest_ts", 0) or 0)
-                    bar_ms = self.timeframe_ms.get(bar, 0)
-                    need_refresh = (
-                        len(existing["candles"]) < (limit // 2)
-                        or latest_ts == 0
-                        or (bar_ms > 0 and (now_ms - latest_ts) > bar_ms * 3)
-                    )
-                    if need_refresh:
-                        tasks.append(self._fetch_and_store(session, inst_id, bar, limit))
-            if tasks:
-                await asyncio.gather(*tasks)
+        tasks = []
+        now_ms = int(time.time() * 1000)
+        for inst_id in instruments:
+            for bar, limit in self.candle_limits.items():
+                existing = self._series(inst_id, bar)
+                latest_ts = existing.latest_ts
+                bar_ms = self.timeframe_ms.get(bar, 0)
+                need_refresh = (
+                    len(existing) < (limit // 2)
+                    or latest_ts == 0
+                    or (bar_ms > 0 and (now_ms - latest_ts) > bar_ms * 3)
+                )
+                if need_refresh:
+                    stale = bars_since(latest_ts, bar, now_ms) if latest_ts else limit
+                    tasks.append(self._schedule(
+                        ("fetch", inst_id, bar), inst_id, bar, stale,
+                        functools.partial(self._fetch_and_store, inst_id, bar, limit)
+                    ))
+        if tasks:
+            await asyncio.gather(*tasks)
 
-    async def _fetch_and_store(self, session: aiohttp.ClientSession, inst_id: str, bar: str, limit: int):
-        url = f"{self.rest_url}/api/v5/market/candles"
+    async def fetch_missing_delta(self, instruments):
+        """Warm start: fetch only the bars each stored series missed while the sync was stopped"""
+        started = time.perf_counter()
+        now_ms = int(time.time() * 1000)
+        jobs = []
+        current = 0
+        for inst_id in instruments:
+            for bar, limit in self.candle_limits.items():
+                series = self.market_data.get(inst_id, {}).get(bar)
+                latest_ts = series.latest_ts if series is not None and len(series) else 0
+                missing = bars_since(latest_ts, bar, now_ms) if latest_ts else limit
+                if missing:
+                    jobs.append((inst_id, bar, latest_ts, missing))
+                else:
+                    current += 1
+        tasks = []
+        for inst_id, bar, latest_ts, missing in jobs:
+            limit = self.candle_limits[bar]
+            if latest_ts and missing < limit:
+                # Newest bars back to and including the stored latest one (it may have closed since)
+                job = functools.partial(self._repair_range, inst_id, bar, None, latest_ts - 1, missing)
+            else:
+                job = functools.partial(self._fetch_and_store, inst_id, bar, limit)
+            tasks.append(self._schedule(("fetch", inst_id, bar), inst_id, bar, missing, job))
+        logger.info(f"Warm start: {len(tasks)} series need REST, {current} already current")
+        await asyncio.gather(*tasks)
+        logger.info(f"Warm start: caught up {len(tasks)} series in {time.perf_counter() - started:.1f}s")
+        if tasks:
+            # REST results are not in the WAL; persist them now instead of at the next save
+            await self.checkpoint_async()
+
+    def _schedule(self, key, inst_id, bar, stale_bars, job):
+        """Queue a REST job for a product/period; returns a future that completes with it"""
+        priority = max(stale_bars, 1) * self.timeframe_weights.get(bar, 1) * self._liquidity_weight(inst_id)
+        return self.scheduler.submit(priority, job, key=key)
+
+    def _liquidity_weight(self, inst_id):
+        """1 for illiquid instruments, about 1 per decade of daily USDT volume above 100k"""
+        series = self.market_data.get(inst_id, {}).get("1D")
+        if series is None or not len(series):
+            return 1.0
+        # The forming day can be nearly empty, so take the larger of the last two days
+        quote_volume = float(series.column("volCcyQuote")[-2:].max())
+        return max(1.0, math.log10(quote_volume + 1) - 4)
+
+    async def _fetch_and_store(self, inst_id: str, bar: str, limit: int):
         params = {'instId': inst_id, 'bar': bar, 'limit': str(min(limit, 300))}
         try:
-            await self.rate_limiter.acquire()
-            async with self._rest_sem:
-                async with session.get(url, params=params) as resp:
-                    data = await resp.json()
+            data = await self._rest_get("/api/v5/market/candles", params)
             if data.get('code') == '0' and data.get('data'):
                 candles = data['data']
-                self.market_data.setdefault(inst_id, {}).setdefault(bar, {"latest_ts": 0, "candles": []})
-                self.market_data[inst_id][bar]["candles"] = candles
-                self.market_data[inst_id][bar]["latest_ts"] = int(candles[0][0]) if candles else 0
+                self._series(inst_id, bar).load_rows(candles)
+                self.mark_dirty(inst_id, bar)
                 logger.info(f"Fetched {len(candles)} {bar} candles for {inst_id}")
             else:
                 logger.warning(f"No data for {inst_id} {bar}: {data}")
         except Exception as e:
             logger.error(f"Error fetching {inst_id} {bar}: {e}")
     
+    def _shard_of(self, inst_id, ws_tf):
+        """Shard index of a candle channel"""
+        if self.ws_shards <= 1:
+            return 0
+        if self.ws_shard_by == "timeframe":
+            return list(self.timeframe_map.values()).index(ws_tf) % self.ws_shards
+        # Stable across restarts (unlike hash())
+        return zlib.crc32(inst_id.encode()) % self.ws_shards
+
+    def _subscribed_timeframes(self):
+        """Timeframes received over WebSocket (only the base one in aggregation mode)"""
+        if self.aggregator:
+            return {self.base_bar: self.timeframe_map[self.base_bar]}
+        return self.timeframe_map
+
+    @property
+    def active_ws_shards(self):
+        """WebSocket shards built for the current instrument set (at most ws_shards)"""
+        return len(self._ws_channels)
+
+    @property
+    def connected_ws_shards(self):
+        """WebSocket shards with an open connection"""
+        return len(self._ws_conns)
+
+    def ws_shard_channels(self, instruments):
+        """Group candle subscriptions by shard: {shard_id: [subscription args]}"""
+        shards = {}
+        for inst_id in instruments:
+            for tf, ws_tf in self._subscribed_timeframes().items():
+                shards.setdefault(self._shard_of(inst_id, ws_tf), []).append({
+                    "channel": f"candle{ws_tf}",
+                    "instId": inst_id
+                })
+        return shards
+
+    async def _update_ws_subscriptions(self, added, removed):
+        """Subscribe added / unsubscribe removed instruments on the running shard connections"""
+        changes = {}  # {shard_id: (subscribe args, unsubscribe args)}
+        for inst_ids, which in ((added, 0), (removed, 1)):
+            for inst_id in inst_ids:
+                for ws_tf in self._subscribed_timeframes().values():
+                    shard_id = self._shard_of(inst_id, ws_tf)
+                    changes.setdefault(shard_id, ([], []))[which].append({
+                        "channel": f"candle{ws_tf}",
+                        "instId": inst_id
+                    })
+        for shard_id, (subscribe, unsubscribe) in sorted(changes.items()):
+            channels = self._ws_channels.setdefault(shard_id, [])
+            dropped = {(arg["channel"], arg["instId"]) for arg in unsubscribe}
+            channels[:] = [arg for arg in channels if (arg["channel"], arg["instId"]) not in dropped] + subscribe
+            if shard_id not in self._ws_tasks:
+                if self._ws_tasks and channels:
+                    # First channels on this shard: its connection subscribes the whole list
+                    self._start_ws_shard(shard_id)
+                continue
+            await self._send_ws_op(shard_id, "unsubscribe", unsubscribe)
+            await self._send_ws_op(shard_id, "subscribe", subscribe)
+
+    async def _send_ws_op(self, shard_id, op, channels):
+        """Send a subscribe/unsubscribe op in batches; a shard that is not connected applies the list on reconnect"""
+        ws = self._ws_conns.get(shard_id)
+        if ws is None or not channels:
+            return
+        try:
+            for i in range(0, len(channels), self.ws_subscribe_batch):
+                await ws.send(json.dumps({"op": op, "args": channels[i:i + self.ws_subscribe_batch]}))
+            logger.info(f"Shard {shard_id}: {op} {len(channels)} channels")
+        except Exception as e:
+            logger.warning(f"Shard {shard_id} {op} failed, applied on reconnect: {e}")
+
     async def websocket_loop(self, instruments):
-        """WebSocket loop"""
+        """WebSocket loop: one independent connection per subscription shard"""
+        self._ws_channels = self.ws_shard_channels(instruments)
+        logger.info(
+            f"Starting {len(self._ws_channels)} WebSocket shards ({self.ws_shard_by}) for {len(instruments)} instruments"
+        )
+        for n, shard_id in enumerate(sorted(self._ws_channels)):
+            self._start_ws_shard(shard_id, start_delay=n * self.ws_connect_stagger)
+        try:
+            await asyncio.gather(*self._ws_tasks.values())
+        finally:
+            # Also stops shards started later by an instruments refresh
+            for task in list(self._ws_tasks.values()) + list(self._ws_catchups.values()):
+                task.cancel()
+            self._ws_tasks = {}
+            self._ws_catchups = {}
+
+    def _start_ws_shard(self, shard_id, start_delay=0.0):
+        self._ws_tasks[shard_id] = asyncio.create_task(self._websocket_shard(shard_id, start_delay))
+
+    async def _websocket_shard(self, shard_id, start_delay=0.0):
+        """WebSocket loop for one shard, with its own reconnect backoff and heartbeat"""
         reconnect_delay = 1
+        connected_before = False
+        down_since = None  # Wall time (ms) the last connection was lost
+        await asyncio.sleep(start_delay)
         
         while True:
             try:
                 async with websockets.connect(self.ws_url) as ws:
-                    logger.info("WebSocket connected")
+                    logger.info(f"WebSocket shard {shard_id} connected")
                     reconnect_delay = 1  # Reset delay
+                    self.ws_stats["connects"] += 1
+                    if connected_before:
+                        self.ws_stats["reconnects"] += 1
+                    connected_before = True
+                    if down_since is not None:
+                        # Fetch the bars that closed while disconnected alongside the resubscription
+                        task = asyncio.create_task(self._catch_up_shard(shard_id, down_since))
+                        task.add_done_callback(functools.partial(self._catch_up_done, shard_id))
+                        self._ws_catchups[shard_id] = task
+                        down_since = None
+                    # Changes from an instruments refresh during the subscription below are sent incrementally
+                    channels = list(self._ws_channels.get(shard_id, []))
+                    self._ws_conns[shard_id] = ws
                     
-                    # Subscribe to candlestick data in batches (avoid exceeding 64KB limit)
+                    # Subscribe in batches (avoid exceeding 64KB limit)
                     # Each subscription is about 50 bytes, 64KB ≈ 1300 subscriptions
-                    # 7 timeframes, so max 1300/7 ≈ 185 products per batch
                     # Use smaller batches for safety
-                    batch_size = 15  # 15 products per batch = 105 subscriptions
-                    timeframes = list(self.timeframe_map.items())
-                    
-                    for i in range(0, len(instruments), batch_size):
-                        batch_instruments = instruments[i:i+batch_size]
-                        
+                    batch_size = self.ws_subscribe_batch
+                    for i in range(0, len(channels), batch_size):
                         sub_msg = {
                             "op": "subscribe",
-                            "args": []
+                            "args": channels[i:i+batch_size]
                         }
-                        
-                        # Add all timeframe subscriptions for current batch of products
-                        for inst_id in batch_instruments:
-                            for tf, ws_tf in timeframes:
-                                sub_msg["args"].append({
-                                    "channel": f"candle{ws_tf}",
-                                    "instId": inst_id
-                                })
-                        
-                        logger.info(f"Subscribing batch {i//batch_size + 1}: {len(batch_instruments)} instruments, {len(sub_msg['args'])} subscriptions")
+                        logger.debug(f"Shard {shard_id} subscribing batch {i//batch_size + 1}: {len(sub_msg['args'])} subscriptions")
                         await ws.send(json.dumps(sub_msg))
                         await asyncio.sleep(1)  # Give server more time to process
                     
-                    logger.info(f"Subscribed to {len(instruments)} instruments")
+                    logger.info(f"Shard {shard_id} subscribed to {len(channels)} channels")
                     
-                    # Start heartbeat task
+                    # Start heartbeat task and the socket reader
                     heartbeat_task = asyncio.create_task(self.heartbeat_loop(ws))
+                    queue = asyncio.Queue()
+                    reader_task = asyncio.create_task(self._read_socket(ws, queue))
                     
                     try:
-                        # Receive data
-                        async for message in ws:
+                        # Receive data: process everything already buffered in one pass
+                        while True:
+                            message = await queue.get()
+                            if message is None:
+                                break
+                            batch = [message]
+                            while len(batch) < self.ws_batch_max and not queue.empty():
+                                batch.append(queue.get_nowait())
+                            if batch[-1] is None:
+                                self.process_messages(batch[:-1])
+                                break
+                            self.process_messages(batch)
+                        # Surface the close reason to the reconnect handler
+                        await reader_task
+                    finally:
+                        # Cancel heartbeat and reader tasks
+                        for task in (heartbeat_task, reader_task):
+                            task.cancel()
                             try:
-                                # Handle pong response
-                                if message == 'pong':
-                                    continue
-                                
-                                data = json.loads(message)
-                                if 'data' in data and 'arg' in data:
-                                    self.update_candle(data)
-                            except json.JSONDecodeError:
+                                await task
+                            except (asyncio.CancelledError, Exception):
                                 pass
-                            except Exception as e:
-                                logger.error(f"Error processing message: {e}")
-                    finally:
-                        # Cancel heartbeat task
-                        heartbeat_task.cancel()
-                        try:
-                            await heartbeat_task
-                        except asyncio.CancelledError:
-                            pass
+                        if self._ws_conns.get(shard_id) is ws:
+                            del self._ws_conns[shard_id]
                             
             except Exception as e:
-                logger.error(f"WebSocket error: {e}")
-                await asyncio.sleep(reconnect_delay)
-                reconnect_delay = min(reconnect_delay * 2, 60)  # Exponential backoff, max 60 seconds
+                logger.error(f"WebSocket shard {shard_id} error: {e}")
+            if connected_before and down_since is None:
+                down_since = int(time.time() * 1000)
+            # Exponential backoff with jitter so shards do not reconnect in lockstep, max 60 seconds
+            await asyncio.sleep(reconnect_delay + random.uniform(0, reconnect_delay / 2))
+            reconnect_delay = min(reconnect_delay * 2, 60)
     
+    async def _catch_up_shard(self, shard_id, down_since):
+        """
+        REST catch-up for the bars of one shard that closed during a disconnect
+
+        Every series whose bar rolled over since down_since gets the bars from
+        the one forming at the disconnect up to now (aggregated timeframes are
+        fetched directly, as their base updates were missed too).
+        """
+        started = time.perf_counter()
+        now_ms = int(time.time() * 1000)
+        tasks = []
+        for arg in list(self._ws_channels.get(shard_id, [])):
+            inst_id = arg["instId"]
+            base = self.channel_bars.get(arg["channel"])
+            if base is None or inst_id in self._delisted:
+                continue
+            bars = [base] + (self.aggregator.targets if self.aggregator and base == self.base_bar else [])
+            for bar in bars:
+                first = bucket_start(down_since, bar)
+                # Bars from the one forming at the disconnect through the forming one now (0 = no rollover)
+                count = bars_since(first, bar, now_ms)
+                if not count:
+                    continue
+                tasks.append(self._schedule(
+                    ("catchup", inst_id, bar), inst_id, bar, count,
+                    functools.partial(self._catch_up_series, inst_id, bar, first, min(count, 300))
+                ))
+        if not tasks:
+            return
+        self.ws_stats["catchup_series"] += len(tasks)
+        await asyncio.gather(*tasks)
+        logger.info(
+            f"Shard {shard_id}: caught up {len(tasks)} series after a {(now_ms - down_since) / 1000:.1f}s "
+            f"disconnect in {time.perf_counter() - started:.1f}s"
+        )
+
+    def _catch_up_done(self, shard_id, task):
+        """Forget a finished catch-up task and log its failure (nothing else awaits it)"""
+        if self._ws_catchups.get(shard_id) is task:
+            del self._ws_catchups[shard_id]
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Shard {shard_id}: reconnect catch-up failed: {task.exception()}")
+
+    async def _catch_up_series(self, inst_id, bar, first_ts, limit):
+        """Merge the bars from first_ts on; derived timeframes re-seed from the fetched bars"""
+        await self._repair_range(inst_id, bar, None, first_ts - 1, limit)
+        if self.aggregator and bar in self.aggregator.targets:
+            self.aggregator.reset(inst_id, bar)
+
+    async def _read_socket(self, ws, queue):
+        """Move raw socket messages into the processing queue; None marks the end of the connection"""
+        try:
+            async for message in ws:
+                queue.put_nowait(message)
+        finally:
+            queue.put_nowait(None)
+
+    def process_messages(self, messages):
+        """Decode and apply a batch of WebSocket messages (one WAL flush per batch)"""
+        self.ws_stats["messages"] += len(messages)
+        for message in messages:
+            # Handle pong response
+            if message == 'pong':
+                continue
+            started = time.perf_counter()
+            try:
+                data = json_loads(message)
+            except ValueError:
+                continue  # Not JSON (e.g. a stray text frame)
+            finally:
+                self.ws_stats["decode_seconds"] += time.perf_counter() - started
+            try:
+                if 'data' in data and 'arg' in data:
+                    self.update_candle(data, flush=False)
+            except Exception as e:
+                logger.error(f"Error processing message: {e}")
+        if self.wal:
+            self.wal.flush()
+
     async def heartbeat_loop(self, ws):
         """Heartbeat loop - send ping every 25 seconds"""
         try:
@@ -354,181 +1075,572 @@ class OKXMarketSync:
             logger.error(f"Heartbeat error: {e}")
             raise
     
-    def update_candle(self, msg):
+    def update_candle(self, msg, flush=True):
         """Update candlestick data"""
         arg = msg['arg']
-        channel = arg.get('channel', '')
         inst_id = arg.get('instId', '')
-        
-        if not inst_id or 'candle' not in channel:
+        # Standard timeframe of the channel (None for non-candle or untracked channels)
+        bar = self.channel_bars.get(arg.get('channel'))
+        if not inst_id or bar is None or inst_id in self._delisted:
             return
-        
-        # Extract time period
-        ws_bar = channel.replace('candle', '')
-        
-        # Find corresponding standard timeframe
-        bar = None
-        for tf, ws_tf in self.timeframe_map.items():
-            if ws_tf == ws_bar:
-                bar = tf
-                break
-        
-        if not bar or bar not in self.candle_limits:
-            return
-        
-        # Ensure data structure exists
-        if inst_id not in self.market_data:
-            self.market_data[inst_id] = {}
-        if bar not in self.market_data[inst_id]:
-            self.market_data[inst_id][bar] = {
-                "latest_ts": 0,
-                "candles": []
-            }
-        
-        # Update data
+
         new_candles = msg['data']
-        bar_data = self.market_data[inst_id][bar]
-        
+        if not new_candles:
+            return
+        self.ws_last_message[bar] = time.time()
+        if self.wal:
+            self.wal.append(inst_id, bar, new_candles, flush=flush)
+        self._apply_candles(inst_id, bar, new_candles)
+
+    def _series(self, inst_id, bar):
+        """Get (or create) the in-memory candle buffer for a product/period"""
+        inst_data = self.market_data.setdefault(inst_id, {})
+        series = inst_data.get(bar)
+        if series is None:
+            series = inst_data[bar] = CandleRing(self.candle_limits[bar])
+        return series
+
+    def _apply_candles(self, inst_id, bar, new_candles):
+        """Merge received candles into the in-memory series"""
+        series = self._series(inst_id, bar)
+        touched = {bar}
+        before = None
+        if self.fanout and self.fanout.active:
+            bars = [bar] + (self.aggregator.targets if self.aggregator and bar == self.base_bar else [])
+            before = {tf: self._latest_state(inst_id, tf) for tf in bars}
         for new_candle in new_candles:
-            ts = int(new_candle[0])
-            
-            # Update latest timestamp
-            if ts > bar_data["latest_ts"]:
-                bar_data["latest_ts"] = ts
-            
-            # Check if update is needed
-            updated = False
-            for i, candle in enumerate(bar_data["candles"]):
-                if int(candle[0]) == ts:
-                    bar_data["candles"][i] = new_candle
-                    updated = True
-                    break
-            
-            # If it's a new candlestick, add to the beginning
-            if not updated:
-                bar_data["candles"].insert(0, new_candle)
-                # Maintain limited quantity
-                limit = self.candle_limits[bar]
-                bar_data["candles"] = bar_data["candles"][:limit]
+            # Same timestamp replaces the candle, a newer one is appended (oldest dropped at capacity)
+            series.upsert_row(new_candle)
+            if self.aggregator and bar == self.base_bar:
+                targets = {tf: self._series(inst_id, tf) for tf in self.aggregator.targets}
+                for tf in self.aggregator.apply(inst_id, int(new_candle[0]), series, targets):
+                    self.mark_dirty(inst_id, tf)
+                    touched.add(tf)
+        self.mark_dirty(inst_id, bar)
+        if before is not None:
+            for tf in touched:
+                self._fanout_changes(inst_id, tf, *before[tf])
+
+    def _latest_state(self, inst_id, bar):
+        """(timestamp, confirmed) of the newest candle of a series, (0, False) when empty"""
+        series = self.market_data.get(inst_id, {}).get(bar)
+        if series is None or not len(series):
+            return 0, False
+        return series.latest_ts, bool(series.get(series.latest_ts)[1])
+
+    def _fanout_changes(self, inst_id, bar, prev_ts, prev_confirmed):
+        """Publish the newest candle and any bar that became confirmed since (prev_ts, prev_confirmed)"""
+        series = self.market_data[inst_id][bar]
+
+        def row(ts):
+            values, confirm = series.get(ts)
+            return [ts, *values.tolist(), "1" if confirm else "0"]
+
+        if prev_ts and prev_ts != series.latest_ts and not prev_confirmed:
+            # The previous bar was closed by the rollover to a new one
+            previous = series.get(prev_ts)
+            if previous is not None and previous[1]:
+                self.fanout.publish("closed", inst_id, bar, row(prev_ts))
+        latest = row(series.latest_ts)
+        self.fanout.publish("candle", inst_id, bar, latest)
+        if latest[-1] == "1" and not (prev_ts == series.latest_ts and prev_confirmed):
+            self.fanout.publish("closed", inst_id, bar, latest)
 
     async def consistency_loop(self, instruments):
         """Data consistency patrol and auto-backfill: ensure all timeframes are gap-free, up-to-date and meet length standards"""
         # Patrol interval (seconds)
         interval_seconds = 180
+        if self.warm_start:
+            # Catch up on the bars missed while stopped first, so the patrol does not request them again
+            try:
+                await self.fetch_missing_delta(instruments)
+            finally:
+                self._seeded.set()
         while True:
             try:
-                async with aiohttp.ClientSession() as session:
-                    refresh_tasks = []
-                    for inst_id in instruments:
-                        if inst_id not in self.market_data:
+                repair_tasks = []
+                for inst_id in instruments:
+                    if inst_id not in self.market_data:
+                        continue
+                    for bar in self.candle_limits:
+                        if bar not in self.market_data[inst_id]:
                             continue
-                        for bar, limit in self.candle_limits.items():
-                            if bar not in self.market_data[inst_id]:
-                                continue
-                            # Only perform auto-backfill for allowed periods
-                            if bar not in self.consistency_allowed_bars:
-                                continue
-                            if self._need_refresh_or_backfill(inst_id, bar):
-                                refresh_tasks.append(self._refresh_recent_candles(session, inst_id, bar, limit))
-                    if refresh_tasks:
-                        await asyncio.gather(*refresh_tasks)
+                        # Only perform auto-backfill for allowed periods
+                        if bar not in self.consistency_allowed_bars:
+                            continue
+                        for after, before, limit in self._missing_ranges(inst_id, bar):
+                            repair_tasks.append(self._schedule(
+                                ("repair", inst_id, bar, after, before), inst_id, bar, limit,
+                                functools.partial(self._repair_range, inst_id, bar, after, before, limit)
+                            ))
+                if repair_tasks:
+                    await asyncio.gather(*repair_tasks)
+                    logger.info(f"Consistency patrol repaired {len(repair_tasks)} ranges")
             except Exception as e:
                 logger.warning(f"Consistency loop warning: {e}")
             # Wait for next round
             await asyncio.sleep(interval_seconds)
 
-    def _need_refresh_or_backfill(self, inst_id: str, bar: str) -> bool:
-        """Determine if this product/period needs refresh (insufficient length/too old/gaps exist)"""
+    def _missing_ranges(self, inst_id: str, bar: str, now_ms=None):
+        """
+        Exact missing ranges of a product/period as (after, before, limit) request bounds
+
+        after/before follow OKX semantics (records earlier/newer than the ts, exclusive),
+        None means unbounded on that side.
+        """
+        bar_ms = self.timeframe_ms.get(bar, 0)
+        if bar_ms <= 0:
+            return []
+        capacity = self.candle_limits.get(bar, 0)
+        series = self.market_data.get(inst_id, {}).get(bar)
+        if series is None or not len(series):
+            return [(None, None, min(capacity, 300))]
+
+        now_ms = now_ms or int(time.time() * 1000)
+        ts = series.timestamps()
+        ranges = []
+        # Newer side: a whole bar is missing after the latest one (also re-fetches the latest bar)
+        if now_ms - int(ts[-1]) > bar_ms * 2:
+            missing = (now_ms - int(ts[-1])) // bar_ms + 1
+            ranges.append((None, int(ts[-1]) - 1, min(missing, 300)))
+        # Gaps inside the window, allow small jitter due to matching delays, threshold 1.5 bars
+        diffs = np.diff(ts)
+        for i in np.nonzero(diffs > int(bar_ms * 1.5))[0]:
+            ranges.append((int(ts[i + 1]), int(ts[i]), min(int(diffs[i] // bar_ms), 300)))
+        # Older side: fill the window up to capacity unless the exchange has nothing older
+        if len(ts) < capacity and self._history_exhausted.get((inst_id, bar)) != int(ts[0]):
+            ranges.append((int(ts[0]), None, min(capacity - len(ts), 300)))
+        return ranges
+
+    async def _repair_range(self, inst_id: str, bar: str, after, before, limit: int):
+        """Use REST to fetch only a missing range of this product/period and merge it in"""
+        bar_ms = self.timeframe_ms.get(bar, 0)
+        # /market/candles only serves the latest 1440 bars, older ranges need history-candles
+        if after is not None and bar_ms and (time.time() * 1000 - after) > bar_ms * 1400:
+            path = "/api/v5/market/history-candles"
+            limit = min(limit, 100)
+        else:
+            path = "/api/v5/market/candles"
+        params = {'instId': inst_id, 'bar': bar, 'limit': str(limit)}
+        if after is not None:
+            params['after'] = str(after)
+        if before is not None:
+            params['before'] = str(before)
         try:
-            bar_ms = self.timeframe_ms.get(bar, 0)
-            if bar_ms <= 0:
-                return False
-            data = self.market_data.get(inst_id, {}).get(bar, {})
-            candles = data.get("candles", [])
-            latest_ts = int(data.get("latest_ts", 0) or 0)
-            limit = self.candle_limits.get(bar, 0)
-            if not candles or len(candles) < max(10, limit // 3):
-                return True
-            # Too old
-            now_ms = int(time.time() * 1000)
-            if latest_ts == 0 or (now_ms - latest_ts) > bar_ms * 3:
-                return True
-            # Gaps: check time intervals of recent candlesticks
-            check_n = min(50, len(candles) - 1)
-            for i in range(check_n):
-                try:
-                    ts_curr = int(candles[i][0])
-                    ts_next = int(candles[i + 1][0])
-                except Exception:
-                    return True
-                gap = ts_curr - ts_next
-                # Allow small jitter due to matching delays, threshold 1.5 bars
-                if gap > int(bar_ms * 1.5):
-                    return True
-            return False
-        except Exception:
-            return True
+            data = await self._rest_get(path, params)
+            if data.get('code') != '0':
+                logger.warning(f"Failed to repair {inst_id} {bar}: {data}")
+                return
+            candles = data.get('data') or []
+            if not candles:
+                if after is not None and before is None:
+                    # Nothing older on the exchange (recent listing), stop asking
+                    self._history_exhausted[(inst_id, bar)] = after
+                return
+            self._series(inst_id, bar).merge_rows(candles)
+            self.mark_dirty(inst_id, bar)
+            logger.info(f"Repaired {len(candles)} {bar} candles for {inst_id} (consistency)")
+            # Mark throttle time
+            self.last_refresh.setdefault(inst_id, {})[bar] = int(time.time() * 1000)
+        except Exception as e:
+            logger.warning(f"Repair error for {inst_id} {bar}: {e}")
+    
+    async def reconcile_loop(self, instruments):
+        """Periodically overwrite the newest locally aggregated bars with exchange values"""
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            try:
+                tasks = [
+                    self._schedule(("reconcile", inst_id, bar), inst_id, bar, 1,
+                                   functools.partial(self._reconcile_recent, inst_id, bar))
+                    for inst_id in instruments
+                    for bar in self.aggregator.targets
+                    if inst_id in self.market_data
+                ]
+                await asyncio.gather(*tasks)
+                logger.info(f"Reconciled {len(tasks)} aggregated series with REST")
+            except Exception as e:
+                logger.warning(f"Reconcile loop warning: {e}")
 
-    async def _refresh_recent_candles(self, session: aiohttp.ClientSession, inst_id: str, bar: str, limit: int):
-        """Use REST to refresh recent candlesticks for this product/period, fix gaps and staleness"""
-        url = f"{self.rest_url}/api/v5/market/candles"
-        params = {'instId': inst_id, 'bar': bar, 'limit': str(min(limit, 300))}
+    async def _reconcile_recent(self, inst_id: str, bar: str):
+        """Fetch the forming and previous bar of a derived timeframe and merge them"""
+        params = {'instId': inst_id, 'bar': bar, 'limit': '2'}
         try:
-            await self.rate_limiter.acquire()
-            async with self._rest_sem:
-                async with session.get(url, params=params) as resp:
-                    data = await resp.json()
+            data = await self._rest_get("/api/v5/market/candles", params)
             if data.get('code') == '0' and data.get('data'):
-                candles = data['data']
-                # Overwrite
-                if inst_id not in self.market_data:
-                    self.market_data[inst_id] = {}
-                if bar not in self.market_data[inst_id]:
-                    self.market_data[inst_id][bar] = {"latest_ts": 0, "candles": []}
-                self.market_data[inst_id][bar]["candles"] = candles
-                self.market_data[inst_id][bar]["latest_ts"] = int(candles[0][0]) if candles else 0
-                logger.info(f"Refreshed {bar} candles for {inst_id} (consistency)")
-                # Mark throttle time
-                self.last_refresh.setdefault(inst_id, {})[bar] = int(time.time() * 1000)
+                series = self._series(inst_id, bar)
+                for candle in data['data']:
+                    series.upsert_row(candle)
+                # Next base update re-seeds from the reconciled bar
+                self.aggregator.reset(inst_id, bar)
+                self.mark_dirty(inst_id, bar)
             else:
-                logger.warning(f"Failed to refresh {inst_id} {bar}: {data}")
+                logger.warning(f"Failed to reconcile {inst_id} {bar}: {data}")
         except Exception as e:
-            logger.warning(f"Refresh error for {inst_id} {bar}: {e}")
-    
+            logger.warning(f"Reconcile error for {inst_id} {bar}: {e}")
+
+    async def backfill_loop(self, instruments):
+        """Page history-candles backwards until every series reaches its target depth"""
+        state = self._load_backfill_state()
+        # Long timeframes first: few pages each and useful to the analyzer right away
+        bars = sorted(self.candle_limits, key=lambda b: self.timeframe_ms.get(b, 0), reverse=True)
+        # Paging starts from the oldest known candle, so wait until the startup fetch has filled the windows
+        await self._seeded.wait()
+        pending = []  # (instId, bar) with no candles yet, retried before the next full round
+        next_round = 0
+        while True:
+            try:
+                if time.monotonic() >= next_round:
+                    next_round = time.monotonic() + self.backfill_interval
+                    # Copy: an instruments refresh may change the set while this round runs
+                    targets = [(inst_id, bar) for bar in bars for inst_id in list(instruments)]
+                else:
+                    targets = pending
+                pending = [
+                    (inst_id, bar) for inst_id, bar in targets
+                    if inst_id not in self._delisted and not await self._backfill_series(inst_id, bar, state)
+                ]
+                if pending:
+                    logger.info(f"Backfill round: {len(pending)} series have no candles yet, "
+                                f"retrying in {self.backfill_retry_interval}s")
+                else:
+                    logger.info(f"Backfill round complete for {len(instruments)} instruments")
+            except Exception as e:
+                logger.warning(f"Backfill loop warning: {e}")
+            delay = self.backfill_retry_interval if pending else next_round - time.monotonic()
+            await asyncio.sleep(max(0, delay))
+
+    def _load_backfill_state(self):
+        """Load per-series backfill progress ({instId: {bar: {"complete": bool}}})"""
+        try:
+            with open(self.backfill_state_file, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"Failed to load backfill state: {e}")
+            return {}
+
+    def _save_backfill_state(self, state):
+        os.makedirs(os.path.dirname(self.backfill_state_file), exist_ok=True)
+        temp_file = f"{self.backfill_state_file}.tmp"
+        with open(temp_file, 'w') as f:
+            json.dump(state, f, separators=(',', ':'))
+        os.replace(temp_file, self.backfill_state_file)
+
+    def _write_backfill(self, inst_id, bar, history, state):
+        """Persist extended history and the progress that covers it (runs on the writer thread)"""
+        self.store.write_history(inst_id, bar, history)
+        self._save_backfill_state(state)
+
+    async def _backfill_series(self, inst_id: str, bar: str, state):
+        """
+        Extend the stored history of one product/period (resumes from the oldest stored candle)
+
+        Returns False when the series has no live or stored candles yet, so there is
+        nothing to page back from and the caller should retry it soon.
+        """
+        # File I/O and encoding run on the writer thread, ordered with saves and evictions
+        loop = asyncio.get_running_loop()
+        try:
+            stored = await loop.run_in_executor(self._writer, self.store.read_history, inst_id, bar)
+        except ValueError as e:
+            logger.warning(f"Discarding unreadable history for {inst_id} {bar}: {e}")
+            stored = None
+        # Views of the live buffer: taken after the await and merged into a copy right away
+        series = self.market_data.get(inst_id, {}).get(bar)
+        live = series.columns() if series is not None and len(series) else None
+        if live is None and not (stored and len(stored["columns"]["ts"])):
+            return False
+        history = merge_columns(stored["columns"] if stored else None, live)
+        changed = live is not None and (stored is None or int(live["ts"][-1]) > stored["latest_ts"])
+        entry = state.setdefault(inst_id, {}).setdefault(bar, {"complete": False})
+        bar_ms = self.timeframe_ms.get(bar, 0)
+        now_ms = int(time.time() * 1000)
+
+        # Hole between stored history and the live window (sync was down longer than the window)
+        if stored and live is not None:
+            stored_ts = stored["columns"]["ts"]
+            if len(stored_ts) and int(live["ts"][0]) - int(stored_ts[-1]) > bar_ms * 1.5:
+                pages = await self._page_history(inst_id, bar, int(live["ts"][0]), int(stored_ts[-1]))
+                if pages:
+                    history = merge_columns(*pages, history)
+                    changed = True
+
+        # Deeper history, flushed every few pages
+        days = self.backfill_days.get(bar, 0)
+        target_ts = now_ms - days * 24 * 60 * 60 * 1000 if days else 0
+        while not entry["complete"] and len(history["ts"]) and int(history["ts"][0]) > target_ts:
+            pages = await self._page_history(
+                inst_id, bar, int(history["ts"][0]), target_ts, max_pages=self.backfill_flush_pages
+            )
+            if pages is None:
+                break  # Request failed, retry next round
+            if not pages or not len(pages[-1]["ts"]):
+                entry["complete"] = True  # Reached the listing date
+            history = merge_columns(*pages, history)
+            changed = changed or bool(pages)
+            if changed:
+                await loop.run_in_executor(self._writer, self._write_backfill, inst_id, bar, history, state)
+                changed = False
+            if entry["complete"] or not pages:
+                break
+
+        if changed:
+            await loop.run_in_executor(self._writer, self._write_backfill, inst_id, bar, history, state)
+        return True
+
+    async def _page_history(self, inst_id, bar, after_ts, stop_ts, max_pages=None):
+        """
+        Fetch history-candles pages older than after_ts until stop_ts is covered
+
+        Returns:
+            List of chronological column pages (the last one empty if history ran out),
+            or None if a request failed
+        """
+        pages = []
+        cursor = after_ts
+        while cursor > stop_ts and (max_pages is None or len(pages) < max_pages):
+            params = {'instId': inst_id, 'bar': bar, 'after': str(cursor), 'limit': '100'}
+            try:
+                data = await self.scheduler.run(
+                    self.backfill_priority,
+                    functools.partial(self._rest_get, "/api/v5/market/history-candles", params)
+                )
+            except Exception as e:
+                logger.warning(f"Backfill error for {inst_id} {bar}: {e}")
+                return None
+            if data.get('code') != '0':
+                logger.warning(f"Backfill failed for {inst_id} {bar}: {data}")
+                return None
+            page = candles_to_columns(data.get('data') or [])
+            pages.append(page)
+            if not len(page["ts"]):
+                break
+            cursor = int(page["ts"][0])
+            await asyncio.sleep(self.backfill_page_delay)
+        if pages:
+            logger.info(f"Backfilled {sum(len(p['ts']) for p in pages)} {bar} candles for {inst_id}")
+        return pages
+
     async def save_loop(self):
-        """Periodically save data"""
+        """Periodically save data (files are written off the event loop)"""
         while True:
             await asyncio.sleep(self.save_interval)
-            self.save_all_data()
-            logger.info(f"Data saved - {len(self.market_data)} instruments")
-    
-    def save_all_data(self):
-        """Save all data to separate files"""
-        current_time = datetime.now().isoformat()
-        
-        # Save summary file
-        summary = {
-            'update_time': current_time,
-            'instrument_count': len(self.market_data),
-            'instruments': list(self.market_data.keys())
-        }
-        
-        # Atomic write summary file
-        temp_summary = f"{self.summary_file}.tmp"
-        with open(temp_summary, 'w') as f:
-            json.dump(summary, f, separators=(',', ':'))
-        os.replace(temp_summary, self.summary_file)
-        
-        # Save data file for each product
+            await self.checkpoint_async()
+            logger.info(
+                f"Data saved - {len(self.market_data)} instruments, "
+                f"{self.save_stats['files_written']} files written, "
+                f"{self.save_stats['files_skipped']} skipped "
+                f"(total {self.save_totals['files_written']} written / {self.save_totals['files_skipped']} skipped), "
+                f"snapshot {self.save_timing['snapshot_ms']:.1f}ms, write {self.save_timing['write_ms']:.0f}ms, "
+                f"max loop stall {self.loop_stall_ms:.1f}ms"
+            )
+            self.loop_stall_ms = 0.0
+            queue = self.scheduler.report()
+            logger.info(
+                f"REST queue - depth {queue['depth']} (max {queue['max_depth']}), {queue['running']} running, "
+                f"{queue['completed']} completed, {queue['deduplicated']} deduplicated, "
+                f"wait p50 {queue['wait_p50_ms']:.0f}ms / p95 {queue['wait_p95_ms']:.0f}ms / "
+                f"max {queue['wait_max_ms']:.0f}ms"
+            )
+
+    async def loop_monitor(self):
+        """Measure how late the event loop wakes up (time it was blocked)"""
+        while True:
+            expected = time.perf_counter() + self.loop_monitor_interval
+            await asyncio.sleep(self.loop_monitor_interval)
+            stall_ms = (time.perf_counter() - expected) * 1000
+            if stall_ms > self.loop_stall_ms:
+                self.loop_stall_ms = stall_ms
+
+    def checkpoint(self):
+        """Save changed series and fold the write-ahead log into the snapshot files (blocking)"""
+        sealed_before, snapshot = self._take_snapshot()
+        self._finish_checkpoint(sealed_before, snapshot, self._write_snapshot(snapshot))
+
+    async def checkpoint_async(self):
+        """Like checkpoint(), but only the in-memory snapshot runs on the event loop"""
+        sealed_before, snapshot = self._take_snapshot()
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self._writer, self._write_snapshot, snapshot)
+        self._finish_checkpoint(sealed_before, snapshot, result)
+
+    def _take_snapshot(self):
+        """
+        Copy the series changed since the last save
+
+        Runs on the event loop; copying the dirty columns is cheap compared to
+        encoding and writing them, and later updates cannot touch the copies.
+
+        Returns:
+            (first WAL segment not covered by the snapshot, snapshot dict)
+        """
+        started = time.perf_counter()
+        # Updates from here on go to a new segment; older segments are covered by this save
+        sealed_before = self.wal.rotate() if self.wal else None
+        # Swap out the dirty set so updates arriving during the save are kept for the next one
+        dirty, self._dirty = self._dirty, set()
+
+        series = {}
+        skipped = 0
         for inst_id, inst_data in self.market_data.items():
-            self.save_instrument_data(inst_id, inst_data, current_time)
+            bars = [bar for bar in inst_data if (inst_id, bar) in dirty]
+            skipped += len(inst_data) - len(bars) + (1 if self.export_json and not bars else 0)
+            if not bars:
+                continue
+            # JSON export rewrites the whole instrument file, so it needs every period
+            copy_bars = list(inst_data) if self.export_json else bars
+            series[inst_id] = (
+                bars,
+                {bar: {name: col.copy() for name, col in inst_data[bar].columns().items()} for bar in copy_bars},
+            )
+
+        instruments = list(self.market_data.keys())
+        snapshot = {
+            "update_time": datetime.now().isoformat(),
+            "instruments": instruments if self._saved_instruments != set(instruments) else None,
+            "series": series,
+            "skipped": skipped,
+        }
+        self.save_timing["snapshot_ms"] = (time.perf_counter() - started) * 1000
+        return sealed_before, snapshot
+
+    def _finish_checkpoint(self, sealed_before, snapshot, result):
+        """Record save results on the event loop and compact the write-ahead log"""
+        stats, failed, instruments = result
+        for inst_id, bar in failed:
+            # Retry on the next save
+            self.mark_dirty(inst_id, bar)
+        attempted = {(inst_id, bar) for inst_id, (bars, _) in snapshot["series"].items() for bar in bars}
+        # A checkpoint that overlapped an earlier failed one may not include its series, so failures
+        # are only cleared by a successful write of that series
+        self._unsaved -= attempted
+        self._unsaved.update(failed)
+        if instruments is not None:
+            self._saved_instruments = set(instruments)
+        self.save_stats = stats
+        self.last_save_time = time.time()
+        self.save_totals["files_written"] += stats["files_written"]
+        self.save_totals["files_skipped"] += stats["files_skipped"]
+
+        if sealed_before is None:
+            return
+        if not self._unsaved:
+            removed = self.wal.drop_before(sealed_before)
+            logger.debug(f"Compacted {removed} WAL segments")
+        else:
+            logger.warning(f"Keeping WAL segments until {len(self._unsaved)} unsaved series are written")
+
+    def mark_dirty(self, inst_id, bar):
+        """Record that a product/period changed and must be written on the next save"""
+        self._dirty.add((inst_id, bar))
+        self._shm_dirty.add((inst_id, bar))
+
+    async def publish_loop(self):
+        """Refresh the shared-memory snapshot with the series changed since the last publish"""
+        while True:
+            await asyncio.sleep(self.shm_interval)
+            self.publish_snapshot()
+
+    def publish_snapshot(self, full=False):
+        """Copy changed (or all) series into the shared snapshot"""
+        if not self.shm:
+            return
+        dirty, self._shm_dirty = self._shm_dirty, set()
+        try:
+            published = self.shm.publish(self.market_data, None if full else dirty)
+            logger.debug(f"Published {published} series to shared snapshot")
+        except Exception as e:
+            logger.error(f"Failed to publish shared snapshot: {e}")
+            self._shm_dirty |= dirty
+    
+    def _write_snapshot(self, snapshot):
+        """
+        Write a snapshot to disk (safe to run on the writer thread)
+
+        Returns:
+            (save stats, failed (instId, bar) pairs, instrument list written to summary.json or None)
+        """
+        started = time.perf_counter()
+        written = 0
+        skipped = snapshot["skipped"]
+        failed = []
+        json_failed = 0
+
+        # Save summary file only when the instrument set changes
+        instruments = snapshot["instruments"]
+        if instruments is not None:
+            summary = {
+                'update_time': snapshot["update_time"],
+                'instrument_count': len(instruments),
+                'instruments': instruments
+            }
+
+            # Atomic write summary file
+            try:
+                temp_summary = f"{self.summary_file}.tmp"
+                with open(temp_summary, 'w') as f:
+                    json.dump(summary, f, separators=(',', ':'))
+                os.replace(temp_summary, self.summary_file)
+                written += 1
+            except OSError as e:
+                logger.error(f"Failed to save summary file: {e}")
+                json_failed += 1
+                # Not recorded as saved, so the next save retries it
+                instruments = None
+        else:
+            skipped += 1
+
+        # Save data files for each product
+        for inst_id, (bars, inst_data) in snapshot["series"].items():
+            count, bad = self.save_instrument_data(inst_id, inst_data, snapshot["update_time"], bars)
+            written += count
+            failed.extend((inst_id, bar) for bar in bad)
+            json_failed += len(bars) + (1 if self.export_json else 0) - count - len(bad)
+
+        self.save_timing["write_ms"] = (time.perf_counter() - started) * 1000
+        stats = {"files_written": written, "files_skipped": skipped, "files_failed": len(failed) + json_failed}
+        return stats, failed, instruments
     
-    def save_instrument_data(self, inst_id, inst_data, update_time):
-        """Save data for a single product"""
+    def save_instrument_data(self, inst_id, inst_data, update_time, bars=None):
+        """
+        Save data for a single product (all periods unless bars is given)
+
+        Args:
+            inst_data: {bar: chronological columns} snapshot
+
+        Returns:
+            (files written, periods that failed to save)
+        """
+        written = 0
+        failed = []
+        for bar in (bars if bars is not None else list(inst_data.keys())):
+            try:
+                self.store.write_columns(inst_id, bar, inst_data[bar])
+                written += 1
+            except Exception as e:
+                logger.error(f"Failed to save {inst_id} {bar}: {e}")
+                failed.append(bar)
+
+        if self.export_json:
+            try:
+                self.export_instrument_json(inst_id, inst_data, update_time)
+                written += 1
+            except Exception as e:
+                logger.error(f"Failed to export JSON for {inst_id}: {e}")
+        return written, failed
+
+    def export_instrument_json(self, inst_id, inst_data, update_time):
+        """Write the legacy data/<instId>.json file (compatibility mode)"""
         output = {
             'update_time': update_time,
             'instrument': inst_id,
-            'data': inst_data
+            'data': {
+                bar: {"latest_ts": int(columns["ts"][-1]) if len(columns["ts"]) else 0,
+                      "candles": columns_to_candles(columns, as_strings=True)}
+                for bar, columns in inst_data.items()
+            }
         }
         
         # Atomic write product data file
@@ -10,13 +10,14 @@ import requests
 import time
 from datetime import datetime, timezone
 from typing import Optional
+from okx_endpoints import rest_url
 
 
 class OKXTimeUtils:
     """Unified OKX time handling utilities"""
     
     def __init__(self):
-        self.okx_time_url = "https://www.okx.com/api/v5/public/time"
+        self.okx_time_url = f"{rest_url()}/api/v5/public/time"
         self._cached_offset = 0.0  # Offset between local and OKX server time
         self._last_sync_time = 0
         self._sync_interval = 300  # Re-sync every 5 minutes
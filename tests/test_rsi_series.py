@@ -0,0 +1,62 @@
+"""
+Streaming RSI equivalence check
+
+ProfessionalMarketAnalyzer._rsi_series must reproduce, bit for bit, the
+per-prefix Wilder RSI that _calculate_advanced_rsi used to compute:
+
+    python -m pytest tests
+    python -m unittest tests.test_rsi_series
+"""
+
+import unittest
+import numpy as np
+from okx_market import ProfessionalMarketAnalyzer
+
+
+def prefix_rsi(series: np.ndarray, period: int) -> float:
+    """Wilder RSI of a whole series, as computed before the streaming version"""
+    if len(series) < period + 1:
+        return float(np.nan)
+    deltas = np.diff(series)
+    seed = deltas[:period]
+    avg_gain = seed[seed > 0].sum() / period
+    avg_loss = -seed[seed < 0].sum() / period
+    rs = (avg_gain / avg_loss) if avg_loss != 0 else np.inf
+    rsi_val = 100 - (100 / (1 + rs))
+    for delta in deltas[period:]:
+        gain = max(delta, 0)
+        loss = -min(delta, 0)
+        avg_gain = (avg_gain * (period - 1) + gain) / period
+        avg_loss = (avg_loss * (period - 1) + loss) / period
+        rs = (avg_gain / avg_loss) if avg_loss != 0 else np.inf
+        rsi_val = 100 - (100 / (1 + rs))
+    return float(rsi_val)
+
+
+def price_series():
+    """Random walks of several lengths plus flat, monotonic and step series"""
+    rng = np.random.default_rng(24)
+    for length in (8, 15, 16, 30, 100, 288):
+        yield 100 * np.exp(np.cumsum(rng.normal(0, 0.01, length)))
+    yield np.full(50, 3.5)
+    yield np.linspace(1, 2, 50)
+    yield np.linspace(2, 1, 50)
+    yield np.repeat([10.0, 11.0, 10.5], 20)
+
+
+class RsiSeriesTest(unittest.TestCase):
+    def test_matches_prefix_rsi(self):
+        for prices in price_series():
+            for period in (7, 14):
+                series = ProfessionalMarketAnalyzer._rsi_series(prices, period)
+                expected = [prefix_rsi(prices[: i + 1], period) for i in range(period, len(prices))]
+                self.assertEqual(len(series), len(expected))
+                for i, (got, want) in enumerate(zip(series, expected)):
+                    if np.isnan(want):
+                        self.assertTrue(np.isnan(got), f"period {period} index {i}")
+                    else:
+                        self.assertEqual(got, want, f"period {period} index {i} of {len(prices)} bars")
+
+
+if __name__ == "__main__":
+    unittest.main()